@@ -1,8 +1,12 @@
 import streamlit as st
-from chatbot import ChatBot
+from chatbot import ChatBot, ChatEngine
+from conversation_store import ConversationStore
+from formatter import StreamingFormatter
+import os
 import time
 import re
-from PIL import Image
+
+PAGE_SIZE = 20 # messages rendered per page of the transcript
 
 # Page Config
 st.set_page_config(
@@ -12,17 +16,72 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize ChatBot in session state
+# Knowledge, API keys, models and caches are shared by all sessions
+@st.cache_resource
+def get_engine():
+    # Per-key quotas of the Gemini Flash free tier; raise them for paid keys
+    return ChatEngine(metrics=True, metrics_file="metrics.prom", key_rpm=10, key_tpm=250_000)
+
+# Transcripts of all sessions (SQLite next to the app)
+@st.cache_resource
+def get_store():
+    return ConversationStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations.db"))
+
+# Live quota view: refreshes on its own while the rest of the page is idle
+@st.fragment(run_every=2)
+def quota_panel(scheduler, flights):
+    status = scheduler.snapshot()
+    queued = ", ".join(f"{count} {name}" for name, count in status["queued"].items())
+    st.caption(f"Queue depth: {status['queue_depth']} ({queued})")
+    coalescing = flights.stats()
+    st.caption(f"Coalesced: {coalescing['coalesced']:,} of {coalescing['coalesced'] + coalescing['upstream_calls']:,} "
+               f"identical requests ({coalescing['coalescing_ratio']:.0%})")
+    st.dataframe(status["keys"], hide_index=True, use_container_width=True)
+
+# Initialize ChatBot (per-session persona + history) in session state
 if "bot" not in st.session_state:
     try:
-        st.session_state.bot = ChatBot()
+        st.session_state.bot = ChatBot(get_engine())
     except Exception as e:
         st.error(f"Failed to initialize ChatBot: {e}")
         st.stop()
 
-# Initialize chat history for UI
+store = get_store()
+
+def to_view(message):
+    """Display form of a stored message (replies are rendered to HTML once, when paged in)."""
+    content = message["text"]
+    if message["role"] == "assistant":
+        content = st.session_state.bot.reformat_text(content)
+    return {"id": message["id"], "role": message["role"], "content": content}
+
+def add_message(role, text, kind="text", content=None):
+    """Saves a message and appends it to the visible window, dropping the oldest past the window size."""
+    message_id = store.append(st.session_state.session_id, role, text, kind)
+    st.session_state.messages.append({"id": message_id, "role": role, "content": content or text})
+    overflow = len(st.session_state.messages) - st.session_state.visible
+    if overflow > 0:
+        del st.session_state.messages[:overflow]
+
+def new_session():
+    st.session_state.session_id = store.create_session()
+    st.query_params["session"] = st.session_state.session_id
+
+# The conversation id lives in the URL, so a reload (or restart) reopens it
+if "session_id" not in st.session_state:
+    session_id = st.query_params.get("session")
+    if session_id and store.has_session(session_id):
+        st.session_state.session_id = session_id
+        bot_history = st.session_state.bot.history_manager
+        for user_text, reply in store.recent_turns(session_id, limit=bot_history.keep_turns):
+            bot_history.add_turn(user_text, reply)
+    else:
+        new_session()
+
+# Chat history for UI: only the visible window (older pages load on demand)
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.visible = PAGE_SIZE
+    st.session_state.messages = [to_view(m) for m in store.page(st.session_state.session_id, limit=PAGE_SIZE)]
 
 # Initialize processing state (Fix for KeyError)
 if "processing" not in st.session_state:
@@ -32,7 +91,9 @@ if "processing" not in st.session_state:
 with st.sidebar:
     st.title("🤖 SmartBot")
     if st.button("➕ New Chat", use_container_width=True):
+        new_session()
         st.session_state.messages = []
+        st.session_state.visible = PAGE_SIZE
         if "bot" in st.session_state:
             st.session_state.bot.history = []
         st.rerun()
@@ -48,14 +109,36 @@ with st.sidebar:
     )
     st.session_state.bot.set_persona(selected_persona)
 
+    # Context size of the last Gemini request (history window + summary + prompt)
+    last_prompt_tokens = st.session_state.bot.history_manager.last_prompt_tokens
+    if last_prompt_tokens:
+        st.caption(f"🧠 Last prompt: ~{last_prompt_tokens:,} tokens")
+        st.caption(f"💾 Session memory: ~{st.session_state.bot.memory_usage() / 1024:,.1f} KB")
+
     # Regenerate Button (Restored)
     if st.session_state.messages and st.session_state.messages[-1]["role"] == "assistant":
         if st.button("🔄 Regenerate Response", use_container_width=True):
-            st.session_state.messages.pop() # Remove last assistant message
+            store.delete_message(st.session_state.messages.pop()["id"]) # Remove last assistant message
             st.rerun()
 
     st.divider()
 
+    # Debug panel: per-stage latency across all sessions + this session's last request
+    metrics = st.session_state.bot.metrics
+    if metrics.enabled:
+        with st.expander("🔍 Debug: latency"):
+            stages = metrics.stage_summary()
+            if stages:
+                st.dataframe(stages, hide_index=True, use_container_width=True)
+            last_trace = metrics.recent_trace(st.session_state.bot.last_request_id)
+            if last_trace:
+                st.caption("Last request")
+                st.json(last_trace, expanded=False)
+            st.download_button("Prometheus metrics", metrics.render(), file_name="metrics.prom")
+
+    with st.expander("🚦 API quota"):
+        quota_panel(st.session_state.bot.scheduler, st.session_state.bot.engine.flights)
+
 # Custom CSS for better aesthetics
 st.markdown("""
 <style>
@@ -142,15 +225,25 @@ if uploaded_file:
         if uploaded_file.name.split('.')[-1].lower() in ['png', 'jpg', 'jpeg']:
             st.image(uploaded_file, width=100)
 
-# Display chat messages from history
+# "Load earlier" pages older messages in above the visible window
+messages = st.session_state.messages
+if messages and store.has_earlier(st.session_state.session_id, messages[0]["id"]):
+    if st.button("⬆️ Load earlier messages", use_container_width=True):
+        earlier = store.page(st.session_state.session_id, before_id=messages[0]["id"], limit=PAGE_SIZE)
+        st.session_state.messages = [to_view(m) for m in earlier] + messages
+        st.session_state.visible += PAGE_SIZE
+
+# Display chat messages from history. Only replies are HTML (rendered by
+# formatter.py, which escapes raw HTML); user text is stored as typed and a
+# session can be opened by anyone with its URL, so it is never trusted as HTML.
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
-        st.markdown(message["content"], unsafe_allow_html=True)
+        st.markdown(message["content"], unsafe_allow_html=message["role"] == "assistant")
 
 # Accept user input
 if prompt := st.chat_input("Send a message...", disabled=st.session_state.processing):
     # 1. Display User Message Immediately
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    add_message("user", prompt)
     with st.chat_message("user"):
         st.markdown(prompt)
     
@@ -160,15 +253,15 @@ if prompt := st.chat_input("Send a message...", disabled=st.session_state.proces
     if uploaded_file:
         file_type = uploaded_file.name.split('.')[-1].lower()
         if file_type in ['png', 'jpg', 'jpeg']:
-            temp_file = Image.open(uploaded_file)
-            st.session_state.messages.append({"role": "user", "content": f"*[Attached Image: {uploaded_file.name}]*"})
+            temp_file = uploaded_file # raw upload; the bot downscales and caches it
+            add_message("user", f"*[Attached Image: {uploaded_file.name}]*", kind="attachment")
             with st.chat_message("user"):
                 st.markdown(f"*[Attached Image: {uploaded_file.name}]*")
             temp_file_type = file_type
         else:
             # Excel/CSV
             temp_file = uploaded_file
-            st.session_state.messages.append({"role": "user", "content": f"*[Attached File: {uploaded_file.name}]*"})
+            add_message("user", f"*[Attached File: {uploaded_file.name}]*", kind="attachment")
             with st.chat_message("user"):
                 st.markdown(f"*[Attached File: {uploaded_file.name}]*")
             temp_file_type = file_type
@@ -176,33 +269,42 @@ if prompt := st.chat_input("Send a message...", disabled=st.session_state.proces
     # 2. Generate Response Immediately (No Rerun)
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
-        with st.spinner("Thinking..."):
-            try:
-                st.session_state.processing = True
-                
-                # Get response from bot
-                response = st.session_state.bot.get_response(
-                    prompt, 
-                    file_data=temp_file, 
-                    file_type=temp_file_type
-                )
-                
-                if response is None:
-                    response = "I'm sorry, I don't know the answer to that yet."
-                
-                # Post-processing
-                html_response = st.session_state.bot.reformat_text(response)
-                
-                # Render
-                message_placeholder.markdown(html_response, unsafe_allow_html=True)
-                
-                # Update history
-                st.session_state.messages.append({"role": "assistant", "content": html_response})
-                
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
-            finally:
-                st.session_state.processing = False
-                # Increment uploader key for next interaction to clear it visuals eventually, 
-                # but NOT forcing rerun keeps the chat snappy.
-                st.session_state.uploader_key += 1
+        try:
+            st.session_state.processing = True
+            
+            # Stream response from bot (spinner only until the first chunk)
+            stream = st.session_state.bot.stream_response(
+                prompt, 
+                file_data=temp_file, 
+                file_type=temp_file_type
+            )
+            with st.spinner("Thinking..."):
+                first_chunk = next(stream, None)
+            
+            response = ""
+            if first_chunk is not None:
+                formatter = StreamingFormatter()
+                message_placeholder.markdown(formatter.feed(first_chunk) + "▌", unsafe_allow_html=True)
+                for chunk in stream:
+                    message_placeholder.markdown(formatter.feed(chunk) + "▌", unsafe_allow_html=True)
+                response = formatter.text
+            
+            if not response:
+                response = "I'm sorry, I don't know the answer to that yet."
+            
+            # Post-processing
+            html_response = st.session_state.bot.reformat_text(response)
+            
+            # Render
+            message_placeholder.markdown(html_response, unsafe_allow_html=True)
+            
+            # Update history (the raw reply is stored; the HTML only lives in the window)
+            add_message("assistant", response, content=html_response)
+            
+        except Exception as e:
+            st.error(f"An error occurred: {e}")
+        finally:
+            st.session_state.processing = False
+            # Increment uploader key for next interaction to clear it visuals eventually, 
+            # but NOT forcing rerun keeps the chat snappy.
+            st.session_state.uploader_key += 1
@@ -0,0 +1,326 @@
+import io
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from utils import content_digest, lazy_import
+
+# Only imported when a spreadsheet is actually attached
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+SPREADSHEET_TYPES = ['csv', 'xlsx', 'xls']
+IMAGE_TYPES = ['png', 'jpg', 'jpeg']
+
+
+class _DigestCache:
+    """Small thread-safe LRU keyed by attachment content digest."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                return self._entries[digest]
+            return None
+
+    def put(self, digest, value):
+        with self._lock:
+            self._entries[digest] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class ColumnStats:
+    """Streaming statistics for one column, merged chunk by chunk."""
+
+    def __init__(self, name, max_distinct=1000):
+        self.name = name
+        self.max_distinct = max_distinct
+        self.count = 0
+        self.missing = 0
+        self.numeric = None  # decided by the first chunk with values
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = None
+        self.max = None
+        self.values = Counter()
+        self.too_many_values = False
+
+    def update(self, series):
+        missing = series.isna()
+        missing_count = int(missing.sum())
+        if missing_count:
+            self.missing += missing_count
+            series = series[~missing]
+        if series.empty:
+            return
+        if self.numeric is None:
+            self.numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+        if self.numeric:
+            values = pd.to_numeric(series, errors='coerce').dropna()
+            if values.empty:
+                return
+            self.count += len(values)
+            self.total += float(values.sum())
+            self.total_sq += float((values.astype('float64') ** 2).sum())
+            low, high = values.min().item(), values.max().item()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+        else:
+            self.count += len(series)
+            if not self.too_many_values:
+                self.values.update(series.astype(str).value_counts().to_dict())
+                if len(self.values) > self.max_distinct:
+                    # Keep the frequent ones only; exact distinct count is lost
+                    self.values = Counter(dict(self.values.most_common(self.max_distinct // 10)))
+                    self.too_many_values = True
+
+    def describe(self):
+        if self.count == 0:
+            return f"- {self.name}: empty ({self.missing:,} missing)"
+        if self.numeric:
+            mean = self.total / self.count
+            variance = max(0.0, self.total_sq / self.count - mean ** 2)
+            return (f"- {self.name} (number): {self.missing:,} missing, min {_fmt(self.min)}, "
+                    f"max {_fmt(self.max)}, mean {_fmt(mean)}, std {_fmt(math.sqrt(variance))}, "
+                    f"sum {_fmt(self.total)}")
+        distinct = f">{self.max_distinct:,}" if self.too_many_values else f"{len(self.values):,}"
+        # Values under 1% are noise for IDs, names, free text...
+        top = [(value, n) for value, n in self.values.most_common(5) if n / self.count >= 0.01]
+        if not top:
+            return f"- {self.name} (text): {self.missing:,} missing, {distinct} distinct (mostly unique)"
+        top = ", ".join(f"{value[:40]} ({n / self.count:.0%})" for value, n in top)
+        return f"- {self.name} (text): {self.missing:,} missing, {distinct} distinct, top: {top}"
+
+
+class SpreadsheetProfile:
+    """Result of one pass over a spreadsheet: size, per-column stats and a row sample."""
+
+    __slots__ = ("rows", "columns", "overview", "sample")
+
+    def __init__(self, rows, columns, overview, sample=""):
+        self.rows = rows
+        self.columns = columns    # name -> ColumnStats
+        self.overview = overview  # schema + column stats, as prompt text
+        self.sample = sample      # sample rows, as prompt text
+
+    def numeric_columns(self):
+        return [name for name, stats in self.columns.items() if stats.numeric]
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        if value.is_integer() or abs(value) >= 1e4:
+            return f"{value:,.0f}"
+        return f"{value:.4g}"
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+
+class SpreadsheetIngestor:
+    """
+    Turns a CSV/XLSX attachment into a compact text context for Gemini:
+    schema, per-column statistics and a random sample of rows (see
+    SpreadsheetProfile).
+
+    Files are parsed once per content hash (results are cached), CSVs are
+    read in chunks and XLSX files in openpyxl read-only mode, so memory stays
+    bounded by chunk_rows regardless of file size.
+    """
+
+    def __init__(self, chunk_rows=100_000, sample_rows=20, max_cache=32):
+        self.logger = logging.getLogger("ChatBot")
+        self.chunk_rows = chunk_rows
+        self.sample_rows = sample_rows
+        self._cache = _DigestCache(max_cache)  # content digest -> SpreadsheetProfile
+
+    def iter_chunks(self, file_data, file_type, usecols=None):
+        """Yields the file as DataFrames of at most chunk_rows rows (only usecols, if given)."""
+        if hasattr(file_data, "seek"):
+            file_data.seek(0)
+
+        if file_type == 'csv':
+            yield from pd.read_csv(file_data, chunksize=self.chunk_rows, usecols=usecols)
+        elif file_type == 'xlsx':
+            import openpyxl
+            workbook = openpyxl.load_workbook(file_data, read_only=True, data_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    return
+                columns = [str(c) if c is not None else f"column_{i + 1}" for i, c in enumerate(header)]
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= self.chunk_rows:
+                        frame = pd.DataFrame(batch, columns=columns)
+                        yield frame[usecols] if usecols else frame
+                        batch = []
+                if batch:
+                    frame = pd.DataFrame(batch, columns=columns)
+                    yield frame[usecols] if usecols else frame
+            finally:
+                workbook.close()
+        else:
+            # Legacy .xls has no streaming reader
+            yield pd.read_excel(file_data, usecols=usecols)
+
+    def summarize(self, file_data, file_type, include_sample=True, digest=None):
+        """Returns the text context for an attachment (see profile)."""
+        profile = self.profile(file_data, file_type, digest)
+        if include_sample and profile.sample:
+            return profile.overview + "\n" + profile.sample + "\n\n"
+        return profile.overview + "\n\n"
+
+    def profile(self, file_data, file_type, digest=None):
+        """
+        Returns the SpreadsheetProfile of an attachment (cached by content
+        hash; pass digest if the caller already has it).
+        """
+        digest = digest or content_digest(file_data)
+        profile = self._cache.get(digest)
+        if profile is not None:
+            self.logger.info("Spreadsheet profile served from cache.")
+            return profile
+
+        start = time.perf_counter()
+        profile = self._profile(file_data, file_type)
+        self.logger.info("Parsed spreadsheet (%s) in %.2fs", file_type, time.perf_counter() - start)
+        self._cache.put(digest, profile)
+        return profile
+
+    def _profile(self, file_data, file_type):
+        rng = np.random.default_rng(0)
+        stats = {}
+        rows = 0
+        # Bottom-k sampling: every row gets a random key and the k rows with the
+        # smallest keys form a uniform sample, mergeable across chunks.
+        sample, sample_keys = None, np.empty(0)
+
+        for chunk in self.iter_chunks(file_data, file_type):
+            chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+            rows += len(chunk)
+            for column in chunk.columns:
+                if column not in stats:
+                    stats[column] = ColumnStats(column)
+                stats[column].update(chunk[column])
+
+            keys = rng.random(len(chunk))
+            if len(chunk) > self.sample_rows:
+                keep = np.argpartition(keys, self.sample_rows)[:self.sample_rows]
+                chunk, keys = chunk.iloc[keep], keys[keep]
+            sample = chunk if sample is None else pd.concat([sample, chunk])
+            sample_keys = np.concatenate([sample_keys, keys])
+            if len(sample) > self.sample_rows:
+                keep = np.argpartition(sample_keys, self.sample_rows)[:self.sample_rows]
+                sample, sample_keys = sample.iloc[keep], sample_keys[keep]
+
+        if not rows:
+            return SpreadsheetProfile(0, stats, "\n\n[ATTACHED DATA: empty file]")
+
+        lines = [f"\n\n[ATTACHED DATA: {rows:,} rows x {len(stats)} columns]", "Columns:"]
+        lines += [column.describe() for column in stats.values()]
+        shown = "all" if rows <= self.sample_rows else f"random {len(sample)} of {rows:,}"
+        sample_text = (f"Sample rows ({shown}, CSV, first column is the row number):\n"
+                       + sample.sort_index().to_csv(index=True, float_format="%.6g").strip())
+        return SpreadsheetProfile(rows, stats, "\n".join(lines), sample_text)
+
+
+class ImagePreprocessor:
+    """
+    Prepares png/jpg attachments before they are sent to Gemini: decodes at
+    reduced size (JPEG draft mode), downscales to max_dimension, re-encodes
+    compactly and caches the result by content hash.
+
+    prepare() returns an inline blob ({"mime_type", "data"}) that the genai
+    client sends as-is, so the image is not re-encoded on every key attempt.
+    """
+
+    def __init__(self, max_dimension=1536, jpeg_quality=85, max_cache=32):
+        self.logger = logging.getLogger("ChatBot")
+        self.max_dimension = max_dimension
+        self.jpeg_quality = jpeg_quality
+        self._cache = _DigestCache(max_cache)  # content digest -> blob
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def prepare(self, file_data, digest=None):
+        """
+        Returns {"mime_type", "data"} for an upload, file path, bytes or PIL
+        image (cached by content hash; pass digest if the caller already has it).
+        """
+        digest = digest or content_digest(file_data)
+        blob = self._cache.get(digest)
+        if blob is not None:
+            self.logger.info("Prepared image served from cache.")
+            return blob
+
+        start = time.perf_counter()
+        blob, original_size, original_bytes, size = self._prepare(file_data)
+        elapsed = time.perf_counter() - start
+        saved = original_bytes - len(blob["data"]) if original_bytes else 0
+        self.bytes_in += original_bytes or len(blob["data"])
+        self.bytes_out += len(blob["data"])
+        self.logger.info("Prepared image %dx%d -> %dx%d, %s bytes (%s saved) in %.1f ms",
+                         original_size[0], original_size[1], size[0], size[1], len(blob["data"]), saved,
+                         elapsed * 1000)
+        self._cache.put(digest, blob)
+        return blob
+
+    def _prepare(self, file_data):
+        from PIL import Image, ImageOps
+
+        raw = None
+        if isinstance(file_data, Image.Image):
+            image = file_data
+        else:
+            if isinstance(file_data, (bytes, bytearray, memoryview)):
+                raw = bytes(file_data)
+            elif hasattr(file_data, "getvalue"):
+                raw = file_data.getvalue()
+            elif hasattr(file_data, "read"):
+                file_data.seek(0)
+                raw = file_data.read()
+            else:
+                with open(file_data, "rb") as f:
+                    raw = f.read()
+            image = Image.open(io.BytesIO(raw))
+
+        original_size = image.size
+        original_format = image.format
+        if raw is not None:
+            # JPEG only: let the decoder scale by 1/2, 1/4 or 1/8 while reading
+            image.draft("RGB", (self.max_dimension, self.max_dimension))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        out = io.BytesIO()
+        if has_alpha:
+            image.save(out, format="PNG", optimize=True)
+            mime_type = "image/png"
+        else:
+            image.convert("RGB").save(out, format="JPEG", quality=self.jpeg_quality, optimize=True)
+            mime_type = "image/jpeg"
+        data = out.getvalue()
+
+        if raw is not None and len(raw) <= len(data) and image.size == original_size \
+                and original_format in ("JPEG", "PNG"):
+            # Already small and compact: keep the original bytes
+            data, mime_type = raw, f"image/{original_format.lower()}"
+        return {"mime_type": mime_type, "data": data}, original_size, len(raw) if raw else 0, image.size
+
+    def stats(self):
+        return {
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+        }
@@ -0,0 +1,237 @@
+"""
+Batch mode: runs a JSONL file of prompts through ChatBot.get_response.
+
+    python batch.py prompts.jsonl -o results.jsonl --workers 8
+
+Each input line is a JSON object with the prompt in "prompt" (or "body" /
+"text") and optionally "id", "persona" and "conversation". Items that share
+a conversation run in order on the same worker with a shared history;
+other items each start from an empty history. Every result is appended to
+the output as soon as it is ready (the input fields plus "response",
+"status" and "seconds"), and the output doubles as the checkpoint:
+running the same command again skips items that already succeeded and
+retries the rest (when an id appears more than once, the last line wins).
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+
+from chatbot import ChatBot, ChatEngine, BUSY_MESSAGE, ERROR_MESSAGE, FALLBACK_MESSAGE
+from scheduler import BATCH
+from utils import percentile, setup_logging
+
+PROMPT_FIELDS = ("prompt", "body", "text")
+FAILED_REPLIES = {FALLBACK_MESSAGE, ERROR_MESSAGE, BUSY_MESSAGE}
+
+
+def read_items(path):
+    """Yields (item_id, item) for each line of a JSONL file, without loading it whole."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                item = {"error": f"invalid JSON: {e}"}
+            if not isinstance(item, dict):
+                item = {"prompt": str(item)}
+            item_id = item.get("id", item.get("request_id", f"line-{line_no}"))
+            yield str(item_id), item
+
+
+def load_checkpoint(path):
+    """
+    Reads an earlier (possibly interrupted) output file. Returns the ids that
+    succeeded and the finished turns of each conversation, in order, so
+    their history can be rebuilt. A torn last line is cut off.
+    """
+    done, conversations = set(), {}
+    if not os.path.exists(path):
+        return done, conversations
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    for line in data[:end].decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") != "ok":
+            continue
+        done.add(str(record["id"]))
+        if record.get("conversation") is not None:
+            prompt = next((record[field] for field in PROMPT_FIELDS if record.get(field)), "")
+            conversations.setdefault(str(record["conversation"]), []).append((str(prompt), record["response"]))
+    return done, conversations
+
+
+class BatchRunner:
+    """
+    Feeds items to a fixed pool of worker threads through small bounded
+    queues (so a huge input file is never held in memory) and appends each
+    result to the output file as it completes.
+
+    Each worker owns its ChatBot sessions, so persona and history are never
+    shared between threads; all of them share one ChatEngine (knowledge,
+    keys, caches) and submit at batch priority to its request scheduler.
+    """
+
+    def __init__(self, engine, output_file, workers=4, persona=None, queue_size=8, progress_every=100):
+        self.engine = engine
+        self.output_file = output_file
+        self.workers = workers
+        self.persona = persona
+        self.queue_size = queue_size
+        self.progress_every = progress_every
+
+        self.ok = 0
+        self.failed = 0
+        self.skipped = 0
+        self.latencies = []
+        self._history = {}  # conversation -> finished (prompt, response) turns, from the checkpoint
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._out = None
+        self._started = None
+
+    def run(self, items, resume=True):
+        """Processes (item_id, item) pairs; returns the stats dict."""
+        done = set()
+        if resume:
+            done, self._history = load_checkpoint(self.output_file)
+        self._started = time.perf_counter()
+        inboxes = [queue.Queue(self.queue_size) for _ in range(self.workers)]
+        threads = [threading.Thread(target=self._work, args=(i, inbox), daemon=True)
+                   for i, inbox in enumerate(inboxes)]
+
+        with open(self.output_file, "a", encoding="utf-8") as self._out:
+            for thread in threads:
+                thread.start()
+            try:
+                next_worker = 0
+                for item_id, item in items:
+                    if item_id in done:
+                        self.skipped += 1
+                        continue
+                    conversation = item.get("conversation")
+                    if conversation is not None:
+                        # Same conversation, same worker: its turns stay in order
+                        worker = zlib.crc32(str(conversation).encode("utf-8")) % self.workers
+                    else:
+                        worker, next_worker = next_worker, (next_worker + 1) % self.workers
+                    inboxes[worker].put((item_id, item))  # blocks when the worker is behind
+            except KeyboardInterrupt:
+                print("Interrupted; finishing items in progress (run again to resume).", file=sys.stderr)
+                self._stop.set()
+            for inbox in inboxes:
+                inbox.put(None)
+            for thread in threads:
+                thread.join()
+        return self.stats()
+
+    def _work(self, worker, inbox):
+        bots = {}  # conversation -> ChatBot
+        while True:
+            entry = inbox.get()
+            if entry is None or self._stop.is_set():
+                return
+            item_id, item = entry
+            conversation = item.get("conversation")
+            conversation = None if conversation is None else str(conversation)
+            bot = bots.get(conversation)
+            if bot is None:
+                bot = bots[conversation] = self._new_bot()
+                for prompt, response in self._history.pop(conversation, ()):
+                    bot.history_manager.add_turn(prompt, response)
+            if conversation is None:
+                bot.history = []  # standalone items don't see each other
+            self._handle(bot, worker, item_id, item)
+
+    def _new_bot(self):
+        bot = ChatBot(self.engine, priority=BATCH)
+        if self.persona:
+            bot.set_persona(self.persona)
+        return bot
+
+    def _handle(self, bot, worker, item_id, item):
+        prompt = next((item[field] for field in PROMPT_FIELDS if item.get(field)), None)
+        record = {"id": item_id, **item, "worker": worker}
+        start = time.perf_counter()
+        if prompt is None:
+            record.update(status="failed", error=item.get("error", "no prompt field"))
+        else:
+            persona = bot.current_persona
+            if item.get("persona"):
+                bot.set_persona(item["persona"])
+            try:
+                response = bot.get_response(str(prompt))
+            finally:
+                bot.set_persona(persona)
+            record.update(response=response, status="failed" if response in FAILED_REPLIES else "ok")
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        self._write(record)
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._out.write(line)
+            self._out.flush()
+            if record["status"] == "ok":
+                self.ok += 1
+                self.latencies.append(record["seconds"])
+            else:
+                self.failed += 1
+            finished = self.ok + self.failed
+        if self.progress_every and finished % self.progress_every == 0:
+            elapsed = time.perf_counter() - self._started
+            print(f"{finished:,} done ({self.failed:,} failed), {finished / elapsed:.1f} items/s", file=sys.stderr)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._started
+        processed = self.ok + self.failed
+        stats = {
+            "processed": processed,
+            "ok": self.ok,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_s": round(elapsed, 2),
+            "items_per_s": round(processed / elapsed, 2) if elapsed else None,
+            "failure_rate": round(self.failed / processed, 4) if processed else 0.0,
+        }
+        if self.latencies:
+            stats["p50_s"] = percentile(self.latencies, 50)
+            stats["p95_s"] = percentile(self.latencies, 95)
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the ChatBot.")
+    parser.add_argument("input", help="JSONL file, one {\"prompt\": ...} object per line")
+    parser.add_argument("-o", "--output", required=True, help="results JSONL (appended to; also the checkpoint)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent requests")
+    parser.add_argument("--persona", help="default persona (items may override it with \"persona\")")
+    parser.add_argument("--no-resume", action="store_true", help="redo items already in the output file")
+    parser.add_argument("--max-wait", type=float, default=300.0,
+                        help="seconds a request may wait for API quota before it fails")
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    engine = ChatEngine(max_queue=max(64, args.workers), max_queue_wait=args.max_wait, metrics=True)
+    if not engine.api_keys:
+        logger.warning("No API keys configured; only learned knowledge will answer.")
+    runner = BatchRunner(engine, args.output, workers=args.workers, persona=args.persona)
+    stats = runner.run(read_items(args.input), resume=not args.no_resume)
+    print(json.dumps(stats, indent=2))
+    sys.exit(1 if stats["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import ChatBot, ChatEngine
+from fake_genai import FakeGenAI
+from utils import percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="A classroom asking the same questions at once: upstream calls with and without coalescing.")
+    parser.add_argument("--users", type=int, default=64, help="concurrent sessions")
+    parser.add_argument("--questions", type=int, default=5, help="distinct questions in circulation")
+    parser.add_argument("--rounds", type=int, default=3, help="questions each user asks")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake Gemini latency in seconds")
+    args = parser.parse_args()
+
+    logging.getLogger("ChatBot").setLevel(logging.CRITICAL)
+    knowledge_file = os.path.join(tempfile.mkdtemp(), "knowledge.json")
+    questions = [f"Explain topic number {i} in simple words" for i in range(args.questions)]
+
+    for label, max_history in (("no coalescing", None), ("coalescing", 2 * args.rounds)):
+        backend = FakeGenAI(latency=args.latency)
+        engine = ChatEngine(knowledge_file=knowledge_file, genai_backend=backend, api_keys=["key-a", "key-b"],
+                            cache_size=0, coalesce_max_history=max_history)
+        bots = [ChatBot(engine) for _ in range(args.users)]
+        rng = random.Random(1)
+        latencies = []
+
+        def ask(bot):
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                bot.get_response(rng.choice(questions))
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.users) as pool:
+            list(pool.map(ask, bots))
+        elapsed = time.perf_counter() - start
+
+        stats = engine.flights.stats()
+        print(f"{label:<14} requests {len(latencies)}  upstream calls {backend.calls:4d}  "
+              f"coalescing ratio {stats['coalescing_ratio']:.2f}  p50 {percentile(latencies, 50) * 1000:6.1f} ms  "
+              f"p95 {percentile(latencies, 95) * 1000:6.1f} ms  wall {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatter import StreamingFormatter, markdown_to_html
+
+SECTION = """### หัวข้อที่ {n}: Section {n}
+
+This is **paragraph {n}** with *some* emphasis, `inline code` and a [link](https://example.com).
+It continues on a second line with more words to make it realistic.
+
+1. First point about item {n}
+2. Second point with **bold** text
+   - nested detail
+   - another nested detail
+3. Third point
+
+สรุป {n} ### รายการ 1. อย่าลืม 2. ตรวจสอบ 3. ส่งงาน
+
+"""
+
+
+def make_response(target_chars):
+    """Builds a long Markdown reply of roughly target_chars characters."""
+    parts, n = [], 1
+    while sum(len(p) for p in parts) < target_chars:
+        parts.append(SECTION.format(n=n))
+        n += 1
+    return "".join(parts)
+
+
+def bench(label, fn, repeat):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<45} {elapsed * 1000:9.3f} ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local Markdown -> HTML formatter.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2_000, 20_000, 100_000],
+                        help="response sizes in characters")
+    parser.add_argument("--chunk", type=int, default=24, help="streamed chunk size in characters")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        text = make_response(size)
+        chunks = [text[i:i + args.chunk] for i in range(0, len(text), args.chunk)]
+        print(f"--- {len(text):,} chars, {len(chunks):,} chunks ---")
+
+        bench("markdown_to_html (whole reply)", lambda: markdown_to_html(text), args.repeat)
+
+        def stream():
+            formatter = StreamingFormatter()
+            for chunk in chunks:
+                formatter.feed(chunk)
+
+        total = bench("StreamingFormatter (all chunks)", stream, args.repeat)
+        print(f"{'  per chunk':<45} {total / len(chunks) * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import ChatBot
+from fake_genai import FakeGenAI, lognormal_latency
+from utils import percentile
+
+
+async def run(bot, requests, concurrency):
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(f"benchmark question {i}")
+
+    async def worker():
+        while not queue.empty():
+            prompt = queue.get_nowait()
+            start = time.perf_counter()
+            await bot.acall_gemini(prompt)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare async Gemini calls with and without hedging (offline).")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--median", type=float, default=0.05, help="median fake latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.8, help="lognormal sigma (tail heaviness)")
+    parser.add_argument("--hedge-after", type=float, default=0.1)
+    args = parser.parse_args()
+
+    knowledge_file = os.path.join(tempfile.mkdtemp(), "knowledge.json")
+    for label, hedge_after in (("no hedging", None), (f"hedge after {args.hedge_after}s", args.hedge_after)):
+        backend = FakeGenAI(latency=lognormal_latency(args.median, args.sigma, seed=42))
+        bot = ChatBot(knowledge_file=knowledge_file, genai_backend=backend, api_keys=["key-a", "key-b", "key-c"],
+                      cache_size=0, max_concurrency=args.concurrency, hedge_after=hedge_after)
+        latencies, elapsed = asyncio.run(run(bot, args.requests, args.concurrency))
+        print(f"{label:<22} p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+              f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+              f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+              f"{len(latencies) / elapsed:6.1f} req/s  upstream calls {backend.calls}")
+
+
+if __name__ == "__main__":
+    main()
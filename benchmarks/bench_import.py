@@ -0,0 +1,75 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported just to start the CLI / answer from local knowledge
+HEAVY_MODULES = ("google.generativeai", "pandas", "numpy", "PIL", "streamlit", "openpyxl", "asyncio")
+
+STARTUP = """
+import sys
+from chatbot import ChatBot
+bot = ChatBot(knowledge_file={knowledge!r}, api_keys=[])
+bot.get_response("hello")
+print(",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def run_importtime(code):
+    """
+    Runs code under -X importtime. Returns ({module: cumulative_us}, stdout)
+    for the chatbot module and everything imported on its behalf.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    subtree = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Children are listed (indented) before their top-level parent
+        subtree[name.strip()] = int(cumulative)
+        if not name[1:].startswith(" "):
+            if name.strip() == "chatbot":
+                return subtree, result.stdout.strip()
+            subtree = {}
+    raise RuntimeError("chatbot was not imported")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure import time of chatbot.py (python -X importtime); exits 1 past the threshold.")
+    parser.add_argument("--threshold-ms", type=float, default=150.0,
+                        help="max cumulative import time of the chatbot module (best of --repeat)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="show the N slowest imports")
+    args = parser.parse_args()
+
+    knowledge = os.path.join(ROOT, "knowledge.json")
+    code = STARTUP.format(knowledge=knowledge, heavy=HEAVY_MODULES)
+    runs = [run_importtime(code) for _ in range(args.repeat)]
+    best_modules, loaded = min(runs, key=lambda run: run[0]["chatbot"])
+    best_ms = best_modules["chatbot"] / 1000
+
+    all_ms = ", ".join(f"{modules['chatbot'] / 1000:.1f}" for modules, _ in runs)
+    print(f"import chatbot: best {best_ms:.1f} ms of {args.repeat} (all: {all_ms} ms)")
+    print("Slowest imports (cumulative):")
+    for name, us in sorted(best_modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: heavy modules imported at startup: {loaded}")
+        failed = True
+    if best_ms > args.threshold_ms:
+        print(f"FAIL: import chatbot took {best_ms:.1f} ms (threshold {args.threshold_ms:.0f} ms)")
+        failed = True
+    if not failed:
+        print(f"OK: under {args.threshold_ms:.0f} ms, no heavy modules loaded")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import ChatBot, ChatEngine
+from fake_genai import FakeGenAI
+from log_pipeline import JsonLinesFormatter, LogPipeline, rotating_file_handler
+from utils import percentile
+
+
+def slow_disk(handler, delay):
+    """Makes every write to handler take delay seconds longer (a busy or network disk)."""
+    if delay:
+        emit = handler.emit
+
+        def slow_emit(record):
+            time.sleep(delay)
+            emit(record)
+
+        handler.emit = slow_emit
+    return handler
+
+
+def legacy_logging(logger, log_file, delay):
+    """The previous setup_logging: a synchronous FileHandler at DEBUG, text format."""
+    handler = logging.FileHandler(log_file, encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(slow_disk(handler, delay))
+    return lambda: (logger.removeHandler(handler), handler.close())
+
+
+def pipeline_logging(logger, log_file, delay):
+    """The current setup_logging: queue + writer thread, rotating JSON-lines file."""
+    handler = rotating_file_handler(log_file)
+    handler.setFormatter(JsonLinesFormatter())
+    pipeline = LogPipeline(logger, [slow_disk(handler, delay)])
+    pipeline.start()
+
+    def stop():
+        start = time.perf_counter()
+        pipeline.stop()
+        print(f"    (writer drained in {time.perf_counter() - start:.2f}s after the run, "
+              f"{pipeline.dropped} records dropped)")
+    return stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request logging overhead: synchronous file handler vs queue.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode; the fastest is reported")
+    parser.add_argument("--slow-disk-ms", type=float, nargs="+", default=[0.0, 1.0],
+                        help="extra latency per log write, to emulate a busy disk")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    knowledge_file = os.path.join(tmp, "knowledge.json")
+    logger = logging.getLogger("ChatBot")
+    logger.propagate = False
+    modes = {"disabled": None, "sync FileHandler": legacy_logging, "queue + JSON lines": pipeline_logging}
+
+    for delay_ms in args.slow_disk_ms:
+        print(f"--- {delay_ms:g} ms per log write ---")
+        baseline = None
+        for label, setup in modes.items():
+            engine = ChatEngine(knowledge_file=knowledge_file, genai_backend=FakeGenAI(latency=0),
+                                api_keys=["key-a"], cache_size=0, metrics=True)
+            bot = ChatBot(engine)
+            logger.setLevel(logging.WARNING if setup is None else logging.DEBUG)
+            stop = setup(logger, os.path.join(tmp, f"{label}.log"), delay_ms / 1000) if setup else None
+            runs = []
+            for _ in range(args.repeat):
+                latencies = []
+                for i in range(args.requests):
+                    bot.history = []
+                    start = time.perf_counter()
+                    bot.get_response(f"question number {i}")
+                    latencies.append(time.perf_counter() - start)
+                runs.append((sum(latencies) / len(latencies), latencies))
+            mean, latencies = min(runs, key=lambda run: run[0])
+            baseline = mean if baseline is None else baseline
+            print(f"  {label:<20} mean {mean * 1e6:8.1f} us  p50 {percentile(latencies, 50) * 1e6:8.1f} us  "
+                  f"p99 {percentile(latencies, 99) * 1e6:8.1f} us  logging overhead {(mean - baseline) * 1e6:8.1f} us/request")
+            if stop:
+                stop()
+
+
+if __name__ == "__main__":
+    main()
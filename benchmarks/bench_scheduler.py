@@ -0,0 +1,65 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import ChatBot, ChatEngine
+from fake_genai import FakeGenAI
+from scheduler import BATCH, INTERACTIVE, PRIORITY_NAMES, RequestScheduler
+from utils import percentile
+
+
+def run(engine, requests, threads):
+    """Fires a burst of requests, every other one at batch priority."""
+    def one(i):
+        priority = BATCH if i % 2 else INTERACTIVE
+        bot = ChatBot(engine, priority=priority)
+        start = time.perf_counter()
+        reply = bot.call_gemini(f"burst question {i}")
+        return priority, reply is not None, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(one, range(requests)))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Burst load against a rate-limited fake backend: 429 feedback only vs per-key token buckets.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--keys", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=5, help="requests per key per --period (fake quota)")
+    parser.add_argument("--period", type=float, default=1.0, help="quota window in seconds (60 on the real API)")
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    logging.getLogger("ChatBot").setLevel(logging.CRITICAL)
+    knowledge_file = os.path.join(tempfile.mkdtemp(), "knowledge.json")
+    keys = [f"key-{i}" for i in range(args.keys)]
+
+    for label, rpm in (("429 feedback only", None), (f"token buckets ({args.limit}/key)", args.limit)):
+        backend = FakeGenAI(latency=args.latency, rate_limit=(args.limit, args.period))
+        engine = ChatEngine(knowledge_file=knowledge_file, genai_backend=backend, api_keys=keys, cache_size=0)
+        # Same quota window as the fake backend, so the benchmark runs in seconds
+        engine.scheduler = RequestScheduler(engine.key_pool, rpm=rpm, period=args.period,
+                                            max_queue=args.requests, max_wait=30.0)
+        results, elapsed = run(engine, args.requests, args.threads)
+
+        ok = sum(1 for _, success, _ in results if success)
+        print(f"{label}: {ok}/{len(results)} answered in {elapsed:.2f}s, upstream calls {backend.calls}, "
+              f"429s {backend.rate_limited}")
+        for priority, name in PRIORITY_NAMES.items():
+            latencies = [seconds for p, _, seconds in results if p == priority]
+            print(f"  {name:<12} p50 {percentile(latencies, 50) * 1000:8.1f} ms  "
+                  f"p95 {percentile(latencies, 95) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chatbot import ChatBot, ChatEngine
+from fake_genai import FakeGenAI
+
+
+def make_sessions(count, turns, shared, options):
+    engine = ChatEngine(**options) if shared else None
+    sessions = []
+    for i in range(count):
+        bot = ChatBot(engine) if shared else ChatBot(**options)
+        for t in range(turns):
+            bot.get_response(f"session {i} question {t} about something specific")
+        sessions.append(bot)
+    return engine, sessions
+
+
+def measure(label, count, turns, shared, options):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    engine, sessions = make_sessions(count, turns, shared, options)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    total, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    reported = sum(bot.memory_usage() for bot in sessions) / count
+    print(f"{label:<28} total {total / 1024 / 1024:8.2f} MB  per session {total / count / 1024:8.1f} KB  "
+          f"(memory_usage() {reported / 1024:6.1f} KB)  setup {elapsed:6.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per Streamlit-style session: shared engine vs one ChatBot each.")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=4, help="conversation turns per session")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        knowledge_file = os.path.join(tmp, "knowledge.json")
+        shutil.copy(os.path.join(ROOT, "knowledge.json"), knowledge_file)
+        options = dict(knowledge_file=knowledge_file, genai_backend=FakeGenAI(), api_keys=["key-a", "key-b"])
+
+        measure("one ChatBot per session", args.sessions, args.turns, False, options)
+        measure("shared ChatEngine", args.sessions, args.turns, True, options)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import io
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REGIONS = ["North", "South", "East", "West", "ภาคกลาง"]
+QUESTIONS = [
+    "What is the total qty by region?",
+    "average price per region where qty > 50",
+    "how many orders have qty >= 90 and region = North",
+    "top 10 rows by price",
+    "top 5 product by total qty",
+    "how many distinct products",
+    "describe discount where region = West",
+    "describe the price column",
+]
+
+
+def write_csv(path, rows, chunk_rows=500_000):
+    """Writes a sales-like CSV of the given number of rows, in chunks."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for start in range(0, rows, chunk_rows):
+            n = min(chunk_rows, rows - start)
+            pd.DataFrame({
+                "order_id": np.arange(start, start + n),
+                "region": rng.choice(REGIONS, n),
+                "product": rng.integers(0, 5000, n).astype(str),
+                "qty": rng.integers(1, 100, n),
+                "price": rng.random(n).round(4) * 1000,
+                "discount": np.where(rng.random(n) < 0.1, np.nan, rng.random(n).round(2)),
+            }).to_csv(f, index=False, header=start == 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time local pandas answers to spreadsheet questions on a multi-million-row CSV.")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=500_000)
+    parser.add_argument("--skip-baseline", action="store_true", help="don't time loading the whole file")
+    parser.add_argument("--dir", default=None, help="where to write the generated file")
+    args = parser.parse_args()
+
+    from attachments import SpreadsheetIngestor
+    from sheet_query import SpreadsheetQueryEngine
+
+    logging.getLogger("ChatBot").setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        path = os.path.join(tmp, "sales.csv")
+        write_csv(path, args.rows)
+        with open(path, "rb") as f:
+            data = io.BytesIO(f.read())
+        print(f"CSV {len(data.getvalue()) / 1024 / 1024:,.0f} MB, {args.rows:,} rows")
+
+        if not args.skip_baseline:
+            import pandas as pd
+            start = time.perf_counter()
+            pd.read_csv(io.BytesIO(data.getvalue()))
+            print(f"  baseline: pandas.read_csv of the whole file {time.perf_counter() - start:.2f}s")
+
+        ingestor = SpreadsheetIngestor(chunk_rows=args.chunk_rows)
+        engine = SpreadsheetQueryEngine(ingestor)
+        start = time.perf_counter()
+        summary = ingestor.summarize(data, "csv")
+        print(f"  profile pass (once per file): {time.perf_counter() - start:.2f}s, "
+              f"sample context {len(summary):,} chars")
+
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            result = engine.answer(question, data, "csv")
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            engine.answer(question, data, "csv")
+            cached = time.perf_counter() - start
+            if result is None:
+                print(f"  {question:<52} not recognized")
+                continue
+            context = ingestor.summarize(data, "csv", include_sample=False) + result.as_context()
+            print(f"  {question:<52} {elapsed:6.2f}s  cached {cached * 1000:6.2f} ms  "
+                  f"context {len(context):,} chars  ({result.description})")
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(f"peak RSS {peak_mb:,.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REGIONS = ["North", "South", "East", "West", "ภาคกลาง"]
+
+
+def write_csv(path, target_mb, chunk_rows=200_000):
+    """Writes a CSV of roughly target_mb megabytes in chunks (bounded memory)."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    written, start_row = 0, 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        while written < target_mb * 1024 * 1024:
+            n = chunk_rows
+            df = pd.DataFrame({
+                "order_id": np.arange(start_row, start_row + n),
+                "region": rng.choice(REGIONS, n),
+                "product": rng.integers(0, 5000, n).astype(str),
+                "qty": rng.integers(1, 100, n),
+                "price": rng.random(n).round(4) * 1000,
+                "discount": np.where(rng.random(n) < 0.1, np.nan, rng.random(n).round(2)),
+            })
+            df.to_csv(f, index=False, header=start_row == 0)
+            written = f.tell()
+            start_row += n
+    return start_row
+
+
+def write_xlsx(path, rows):
+    """Writes an XLSX with openpyxl's write-only mode."""
+    import random
+    import openpyxl
+
+    rng = random.Random(0)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["order_id", "region", "product", "qty", "price", "discount"])
+    for i in range(rows):
+        sheet.append([i, rng.choice(REGIONS), str(rng.randrange(5000)), rng.randrange(1, 100),
+                      round(rng.random() * 1000, 4), None if rng.random() < 0.1 else round(rng.random(), 2)])
+    workbook.save(path)
+
+
+def run_mode(mode, path, file_type, chunk_rows):
+    """Runs one ingestion strategy in this process and prints time + peak RSS."""
+    start = time.perf_counter()
+    if mode == "legacy":
+        # Previous behaviour: load the whole sheet, keep the first 50 rows
+        import pandas as pd
+        df = pd.read_csv(path) if file_type == "csv" else pd.read_excel(path)
+        context = df.head(50).to_csv(index=False)
+        cached = 0.0
+    else:
+        from attachments import SpreadsheetIngestor
+        ingestor = SpreadsheetIngestor(chunk_rows=chunk_rows)
+        context = ingestor.summarize(path, file_type)
+        cache_start = time.perf_counter()
+        ingestor.summarize(path, file_type)
+        cached = time.perf_counter() - cache_start
+        start += cached
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(f"{elapsed:.3f} {peak_mb:.1f} {cached:.3f} {len(context)}")
+
+
+def measure(mode, path, file_type, chunk_rows):
+    out = subprocess.run(
+        [sys.executable, __file__, "--run", mode, path, file_type, "--chunk-rows", str(chunk_rows)],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    elapsed, peak_mb, cached, chars = float(out[0]), float(out[1]), float(out[2]), int(out[3])
+    cached_note = f", cached re-read {cached * 1000:.1f} ms" if mode == "ingest" else ""
+    print(f"  {mode:<7} {elapsed:8.2f} s  peak RSS {peak_mb:8.1f} MB  context {chars:,} chars{cached_note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spreadsheet ingestion on large generated files.")
+    parser.add_argument("--csv-mb", type=int, nargs="+", default=[100, 1024],
+                        help="generated CSV sizes in MB")
+    parser.add_argument("--xlsx-rows", type=int, default=200_000, help="rows in the generated XLSX (0 to skip)")
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--skip-legacy", action="store_true", help="don't run the load-everything baseline")
+    parser.add_argument("--dir", default=None, help="where to write the generated files")
+    parser.add_argument("--run", nargs=3, metavar=("MODE", "PATH", "TYPE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args.run[0], args.run[1], args.run[2], args.chunk_rows)
+        return
+
+    modes = ["ingest"] if args.skip_legacy else ["legacy", "ingest"]
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for size in args.csv_mb:
+            path = os.path.join(tmp, f"data_{size}mb.csv")
+            rows = write_csv(path, size)
+            print(f"--- CSV {os.path.getsize(path) / 1024 / 1024:,.0f} MB, {rows:,} rows ---")
+            for mode in modes:
+                measure(mode, path, "csv", args.chunk_rows)
+            os.remove(path)
+
+        if args.xlsx_rows:
+            path = os.path.join(tmp, "data.xlsx")
+            write_xlsx(path, args.xlsx_rows)
+            print(f"--- XLSX {os.path.getsize(path) / 1024 / 1024:,.1f} MB, {args.xlsx_rows:,} rows ---")
+            for mode in modes:
+                measure(mode, path, "xlsx", args.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
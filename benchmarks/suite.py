@@ -0,0 +1,287 @@
+"""
+Offline benchmark suite for the ChatBot hot paths.
+
+Runs without network access or API keys (Gemini is replaced by
+fake_genai.FakeGenAI) and writes p50/p95/p99 latency and throughput as
+JSON, so runs can be compared across commits:
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --output after.json --compare before.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_formatter import make_response
+from chatbot import ChatBot, ChatEngine
+from fake_genai import FakeGenAI, lognormal_latency
+from matcher import KnowledgeIndex
+from retrieval import KnowledgeRetriever
+from utils import percentile
+
+WORDS = ("what how why when where is are the a my your weather today price order status account password "
+         "reset help open close time bank card ราคา วันนี้ อากาศ สั่งซื้อ สถานะ บัญชี รหัสผ่าน ช่วย เปิด ปิด เวลา").split()
+
+
+def summarize(latencies, elapsed=None, **params):
+    """Latency percentiles (ms) and throughput for one benchmark."""
+    elapsed = elapsed if elapsed is not None else sum(latencies)
+    return {
+        "n": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+        "ops_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "params": params,
+    }
+
+
+def timed(fn, items):
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - start
+
+
+def make_questions(count, rng):
+    questions = set()
+    while len(questions) < count:
+        questions.add(" ".join(rng.choices(WORDS, k=rng.randint(2, 7))) + f" {rng.randrange(10 ** 6)}")
+    return list(questions)
+
+
+def make_queries(questions, count, rng):
+    """Mix of exact hits, typos and misses."""
+    queries = []
+    for _ in range(count):
+        roll = rng.random()
+        question = rng.choice(questions)
+        if roll < 0.4:
+            queries.append(question)
+        elif roll < 0.8:
+            i = rng.randrange(len(question))
+            queries.append(question[:i] + question[i + 1:])
+        else:
+            queries.append(" ".join(rng.choices(WORDS, k=4)) + " zz")
+    return queries
+
+
+def bench_lookup(args, tmp):
+    results = {}
+    for size in args.knowledge_sizes:
+        rng = random.Random(size)
+        questions = make_questions(size, rng)
+        build_start = time.perf_counter()
+        index = KnowledgeIndex(questions)
+        build = time.perf_counter() - build_start
+        latencies, elapsed = timed(index.lookup, make_queries(questions, args.lookups, rng))
+        results[f"knowledge_lookup_{size}"] = summarize(latencies, elapsed, size=size, build_s=round(build, 3))
+    return results
+
+
+def bench_retrieval(args, tmp):
+    results = {}
+    for size in args.knowledge_sizes:
+        rng = random.Random(size)
+        questions = make_questions(size, rng)
+        build_start = time.perf_counter()
+        retriever = KnowledgeRetriever({q: [f"answer {i}"] for i, q in enumerate(questions)}, background=False)
+        build = time.perf_counter() - build_start
+        retriever.search(["warm up"])  # imports numpy
+        latencies, elapsed = timed(retriever.context, make_queries(questions, args.lookups // 4, rng))
+        results[f"retrieval_context_{size}"] = summarize(latencies, elapsed, size=size, build_s=round(build, 3))
+    return results
+
+
+def bench_learn(args, tmp):
+    knowledge_file = os.path.join(tmp, "learn.json")
+    engine = ChatEngine(knowledge_file=knowledge_file, genai_backend=FakeGenAI(), api_keys=[])
+    rng = random.Random(1)
+    pairs = [(q, f"answer {i}") for i, q in enumerate(make_questions(args.learns, rng))]
+    latencies, elapsed = timed(lambda pair: engine.learn(*pair), pairs)
+    results = {"learn": summarize(latencies, elapsed, entries=len(pairs))}
+
+    saves, elapsed = timed(lambda _: engine.save_knowledge(), range(5))
+    results["save_knowledge"] = summarize(saves, elapsed, entries=len(engine.responses))
+    return results
+
+
+def bench_gemini(args, tmp):
+    results = {}
+    knowledge_file = os.path.join(tmp, "gemini.json")
+    keys = ["key-a", "key-b", "key-c", "key-d"]
+    for failure_rate in args.failure_rates:
+        backend = FakeGenAI(latency=lognormal_latency(args.latency, seed=7), failure_rate=failure_rate, seed=7)
+        bot = ChatBot(knowledge_file=knowledge_file, genai_backend=backend, api_keys=keys, cache_size=0)
+        prompts = [f"gemini question {i}" for i in range(args.calls)]
+        latencies, elapsed = timed(bot.call_gemini, prompts)
+        results[f"call_gemini_fail_{int(failure_rate * 100)}pct"] = summarize(
+            latencies, elapsed, failure_rate=failure_rate, median_latency_s=args.latency,
+            upstream_calls=backend.calls,
+        )
+
+    # Streaming: time to first chunk and to the full reply
+    backend = FakeGenAI(reply=make_response(2000), latency=args.latency, chunk_size=32, chunk_delay=0.0005)
+    bot = ChatBot(knowledge_file=knowledge_file, genai_backend=backend, api_keys=keys, cache_size=0)
+    first, total = [], []
+    start = time.perf_counter()
+    for i in range(max(1, args.calls // 4)):
+        t = time.perf_counter()
+        stream = bot.call_gemini_stream(f"stream question {i}")
+        next(stream)
+        first.append(time.perf_counter() - t)
+        for _ in stream:
+            pass
+        total.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    results["call_gemini_stream_first_chunk"] = summarize(first, elapsed, median_latency_s=args.latency)
+    results["call_gemini_stream_total"] = summarize(total, elapsed, median_latency_s=args.latency)
+    return results
+
+
+def bench_spreadsheet(args, tmp):
+    from attachments import SpreadsheetIngestor
+
+    rng = random.Random(3)
+    lines = ["order_id,region,product,qty,price"]
+    lines += [f"{i},{rng.choice(['North', 'South', 'East', 'West'])},p{rng.randrange(500)},"
+              f"{rng.randrange(1, 100)},{rng.random() * 1000:.2f}" for i in range(args.sheet_rows)]
+    data = ("\n".join(lines) + "\n").encode()
+
+    results = {}
+    cold, elapsed = timed(lambda _: SpreadsheetIngestor().summarize(io.BytesIO(data), "csv"), range(5))
+    results["spreadsheet_parse"] = summarize(cold, elapsed, rows=args.sheet_rows, bytes=len(data))
+
+    ingestor = SpreadsheetIngestor()
+    ingestor.summarize(io.BytesIO(data), "csv")
+    warm, elapsed = timed(lambda _: ingestor.summarize(io.BytesIO(data), "csv"), range(50))
+    results["spreadsheet_cached"] = summarize(warm, elapsed, rows=args.sheet_rows, bytes=len(data))
+    return results
+
+
+def bench_reformat(args, tmp):
+    engine = ChatEngine(knowledge_file=os.path.join(tmp, "reformat.json"), genai_backend=FakeGenAI(), api_keys=[])
+    results = {}
+    for size in (2_000, 20_000):
+        text = make_response(size)
+        latencies, elapsed = timed(engine.reformat_text, [text] * args.reformats)
+        results[f"reformat_text_{size}"] = summarize(latencies, elapsed, chars=len(text))
+    return results
+
+
+def bench_persona(args, tmp):
+    """Per-request persona cost: switch persona, build the message, open a chat on the cached model."""
+    engine = ChatEngine(knowledge_file=os.path.join(tmp, "persona.json"), genai_backend=FakeGenAI(latency=0),
+                        api_keys=["key-a"], retrieval_k=0)
+    bot = ChatBot(engine)
+    names = list(engine.personas)
+
+    def prepare(i):
+        bot.set_persona(names[i % len(names)])
+        bot._start_chat(0, bot._build_message("hello there"))
+
+    latencies, elapsed = timed(prepare, range(args.calls * 10))
+    return {"persona_prepare": summarize(latencies, elapsed, personas=len(names))}
+
+
+BENCHMARKS = {
+    "lookup": bench_lookup,
+    "retrieval": bench_retrieval,
+    "learn": bench_learn,
+    "gemini": bench_gemini,
+    "spreadsheet": bench_spreadsheet,
+    "reformat": bench_reformat,
+    "persona": bench_persona,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_file):
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n--- vs {baseline_file} (commit {baseline.get('commit')}) ---")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        ratios = "  ".join(f"{p} {result[p] / before[p]:5.2f}x" if before[p] else f"{p}   n/a"
+                           for p in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"{name:<36} {ratios}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ChatBot benchmark suite (fake Gemini backend).")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run a subset")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--knowledge-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--lookups", type=int, default=2_000)
+    parser.add_argument("--learns", type=int, default=500)
+    parser.add_argument("--calls", type=int, default=200, help="call_gemini requests per failure rate")
+    parser.add_argument("--failure-rates", type=float, nargs="+", default=[0.0, 0.2, 0.5])
+    parser.add_argument("--latency", type=float, default=0.002, help="median fake Gemini latency in seconds")
+    parser.add_argument("--sheet-rows", type=int, default=200_000)
+    parser.add_argument("--reformats", type=int, default=50)
+    args = parser.parse_args()
+    if args.quick:
+        args.knowledge_sizes = [1_000, 10_000]
+        args.lookups, args.learns, args.calls = 500, 100, 50
+        args.sheet_rows, args.reformats = 20_000, 10
+
+    # Key failures are expected here; keep the output to the results
+    logging.getLogger("ChatBot").setLevel(logging.CRITICAL)
+
+    results = {}
+    tmp = tempfile.mkdtemp()
+    try:
+        for name in args.only or BENCHMARKS:
+            results.update(BENCHMARKS[name](args, tmp))
+    finally:
+        shutil.rmtree(tmp)
+
+    for name, result in results.items():
+        throughput = f"{result['ops_per_s']:>10,.1f}/s" if result["ops_per_s"] else ""
+        print(f"{name:<36} p50 {result['p50_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms  "
+              f"p99 {result['p99_ms']:9.3f} ms {throughput}")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
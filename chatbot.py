@@ -1,49 +1,126 @@
+import itertools
 import logging
+import threading
+import time
 import random
 import json
 import os
-import google.generativeai as genai
-import pandas as pd
-from PIL import Image
+import sys
+import weakref
+from matcher import KnowledgeIndex
+from knowledge_store import KnowledgeStore, apply_learn
+from key_pool import KeyPool
+from formatter import markdown_to_html
+from response_cache import ResponseCache, time_bucket
+from utils import content_digest, deep_sizeof, lazy_import
+from attachments import ImagePreprocessor, SpreadsheetIngestor, IMAGE_TYPES, SPREADSHEET_TYPES
+from history import HistoryManager, extractive_summary
+from metrics import Metrics, current_trace
+from personas import DEFAULT_PERSONA, PersonaRegistry
+from retrieval import KnowledgeRetriever
+from singleflight import SingleFlight
+from scheduler import RequestScheduler, SchedulerBusy, rate_limit_delay, INTERACTIVE, IMAGE_TOKENS, REPLY_TOKENS
 
-class ChatBot:
-    def __init__(self, knowledge_file="knowledge.json", config_file="config.json"):
+# Heavy imports are deferred until a Gemini call (or async request) needs them
+asyncio = lazy_import("asyncio")
+genai = lazy_import("google.generativeai")
+sheet_query = lazy_import("sheet_query")
+
+FALLBACK_MESSAGE = "I'm sorry, I couldn't understand that."
+ERROR_MESSAGE = "Oops! Something went wrong internally."
+BUSY_MESSAGE = "I'm handling a lot of requests right now. Please try again in a moment."
+
+class ChatEngine:
+    """
+    Process-wide resources shared by every chat session: knowledge, API keys,
+    the model pool and the caches. Thread-safe; create it once per process
+    (app.py keeps it in st.cache_resource) and give each session a ChatBot.
+    """
+
+    def __init__(self, knowledge_file="knowledge.json", config_file="config.json", match_threshold=0.5,
+                 genai_backend=None, api_keys=None, cache_size=1024, cache_ttl=900, cache_file=None,
+                 cache_history_window=6, max_concurrency=8, hedge_after=None, metrics=False, metrics_file=None,
+                 retrieval_k=3, key_rpm=None, key_tpm=None, max_queue=64, max_queue_wait=20.0,
+                 coalesce_max_history=2, coalesce_timeout=60.0, sheet_direct_answers=False, persona_dir="personas"):
         self.logger = logging.getLogger("ChatBot")
         
         # Resolve absolute paths
         base_dir = os.path.dirname(os.path.abspath(__file__))
         self.knowledge_file = os.path.join(base_dir, knowledge_file)
         self.config_file = os.path.join(base_dir, config_file)
+        self.store = KnowledgeStore(self.knowledge_file)
         
+        self._lock = threading.RLock() # guards responses + index (learn vs lookup)
         self.responses = self.load_knowledge()
-        self.api_keys = self.load_api_keys()
-        self.history = [] # Initialize conversation history
+        self.index = KnowledgeIndex(self.responses.keys(), threshold=match_threshold)
+        # Top-k similar knowledge injected into Gemini prompts (retrieval_k=0 disables);
+        # its index is built by a background thread, off the request path
+        self.retriever = KnowledgeRetriever(self.responses, k=retrieval_k) if retrieval_k else None
+        self.api_keys = api_keys if api_keys is not None else self.load_api_keys()
+        self.genai = genai_backend or genai # e.g. fake_genai.FakeGenAI() for offline use
+        self.key_pool = KeyPool(self.api_keys, self.genai)
+        # Per-key RPM/TPM budgets, 429 cooldowns and the priority queue (see scheduler.py)
+        self.scheduler = RequestScheduler(self.key_pool, rpm=key_rpm, tpm=key_tpm, max_queue=max_queue,
+                                          max_wait=max_queue_wait)
         
-        # Define Personas
-        self.personas = {
-            "Jarvis AI": "You are J.A.R.V.I.S, a highly advanced and intelligent AI assistant. You are polite, efficient, and sophisticated. Address the user as 'Sir' or 'Boss'. Provide concise, data-driven, and extremely helpful responses like a top-tier digital butler.",
-            "Transformer": "You are a Cybertronian Autobot. Speak with a robotic, heroic, and metallic tone. Use terms like 'Prime', 'Energon', 'Roll out', 'Spark'. You are dedicated to protecting Earth and defeating the Decepticons. Include mechanical sound effects like *whirrr-clank* or *zzzt*.",
-            "Comedian": "You are a hilarious stand-up comedian. Your goal is to make the user laugh. Answer every question with a joke, a pun, or a funny sarcasm. Roast the user lightly. Use Thai slang and '55555' (laughing) frequently."
-        }
-        self.current_persona = "Jarvis AI"
+        # Async path: at most max_concurrency Gemini calls in flight across all
+        # sessions (one semaphore per event loop), and optional hedged requests
+        self.max_concurrency = max_concurrency
+        self._async_semaphores = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self.hedge_after = hedge_after
+        
+        # Reply cache (cache_size=0 disables it); cache_file adds a persistent tier
+        self.response_cache = ResponseCache(cache_size, cache_ttl, cache_file) if cache_size else None
+        self.cache_history_window = cache_history_window
+        # Identical concurrent requests share one Gemini call when the asking
+        # session has at most this many history messages (None disables). A
+        # follower waits at most coalesce_timeout seconds, then calls on its own
+        self.flights = SingleFlight()
+        self.coalesce_max_history = coalesce_max_history
+        self.coalesce_timeout = coalesce_timeout
+        # Attachments are prepared once per file content (see attachments.py)
+        self.spreadsheets = SpreadsheetIngestor()
+        self.images = ImagePreprocessor()
+        # Aggregate/filter/top-N questions about a spreadsheet are computed
+        # locally; the results go to Gemini, or straight to the user when
+        # sheet_direct_answers is set (see sheet_query.py). Built on first use.
+        self._sheet_queries = None
+        self.sheet_direct_answers = sheet_direct_answers
+        # Per-stage tracing + histograms (no-ops unless enabled); see metrics.py
+        metrics_file = os.path.join(base_dir, metrics_file) if metrics_file else None
+        self.metrics = Metrics(enabled=metrics, prometheus_file=metrics_file)
+        
+        # Personas: one JSON file each in persona_dir, reloaded when the files
+        # change; models of replaced persona versions are dropped
+        self.personas = PersonaRegistry(os.path.join(base_dir, persona_dir), on_change=self.key_pool.invalidate)
         self.active_model_name = None # Stores the auto-resolved model name
         
-        self.logger.info(f"ChatBot initialized. Config: {self.config_file}")
+        self.logger.info("ChatEngine initialized. Config: %s", self.config_file)
 
-    def set_persona(self, persona_name):
-        """Sets the current persona."""
-        if persona_name in self.personas:
-            self.current_persona = persona_name
-            self.logger.info(f"Persona set to: {persona_name}")
+    @property
+    def sheet_queries(self):
+        """The SpreadsheetQueryEngine; sheet_query (and pandas) load on the first spreadsheet question."""
+        if self._sheet_queries is None:
+            with self._lock:
+                if self._sheet_queries is None:
+                    self._sheet_queries = sheet_query.SpreadsheetQueryEngine(self.spreadsheets)
+        return self._sheet_queries
+
+    def async_semaphore(self):
+        """The semaphore bounding async Gemini calls of every session on the running event loop."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+        return semaphore
 
     def load_knowledge(self):
-        """Loads knowledge from a JSON file."""
-        if os.path.exists(self.knowledge_file):
+        """Loads knowledge from the JSON snapshot plus the learn journal."""
+        if self.store.exists():
             try:
-                with open(self.knowledge_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return self.store.load()
             except Exception as e:
-                self.logger.error(f"Error loading knowledge file: {e}")
+                self.logger.error("Error loading knowledge file: %s", e)
         
         return {
             "hello": ["Hello there!", "Hi!", "Greetings!"],
@@ -55,9 +132,10 @@ class ChatBot:
 
     def load_api_keys(self):
         """Loads API keys from config file or Streamlit secrets."""
-        # 1. Try Streamlit Secrets (Best for Cloud Deployment)
+        # 1. Try Streamlit Secrets (Best for Cloud Deployment). Only if the app
+        # already imported streamlit: the CLI shouldn't pay for importing it.
         try:
-            import streamlit as st
+            st = sys.modules["streamlit"]
             if "api_keys" in st.secrets:
                 # Handle both list and string formats
                 keys = st.secrets["api_keys"]
@@ -74,27 +152,181 @@ class ChatBot:
                     config = json.load(f)
                     return config.get("api_keys", [])
             except Exception as e:
-                self.logger.error(f"Error loading config file: {e}")
+                self.logger.error("Error loading config file: %s", e)
         return []
 
     def save_knowledge(self):
-        """Saves current knowledge to a JSON file."""
+        """Writes a full snapshot of current knowledge (compacts the journal)."""
         try:
-            with open(self.knowledge_file, 'w', encoding='utf-8') as f:
-                json.dump(self.responses, f, indent=4, ensure_ascii=False)
+            self.store.compact(self.responses)
             self.logger.info("Knowledge saved successfully.")
         except Exception as e:
-            self.logger.error(f"Error saving knowledge file: {e}")
+            self.logger.error("Error saving knowledge file: %s", e)
 
     def learn(self, question, answer):
         """Learns a new response for a given question."""
         normalized_question = question.lower().strip()
-        if normalized_question in self.responses:
-            self.responses[normalized_question].append(answer)
+        with self._lock:
+            if normalized_question not in self.responses:
+                self.index.add(normalized_question)
+            apply_learn(self.responses, normalized_question, answer)
+            if self.retriever is not None:
+                self.retriever.add(normalized_question)
+        try:
+            self.store.append(normalized_question, answer)
+        except Exception as e:
+            self.logger.error("Error saving knowledge file: %s", e)
+        self.logger.info("Learned new response for '%s': %s", normalized_question, answer)
+
+    def build_system_instruction(self, persona_name):
+        """Returns the (precompiled) system instruction for a persona."""
+        return self.personas.resolve(persona_name).instruction
+
+    def summarize_turns(self, summary, turns):
+        """History summarizer backed by Gemini (falls back to an extractive summary)."""
+        transcript = "\n".join(f"{message['role']}: {message['parts'][0]}" for message in turns)
+        prompt = f"""
+        Update the running summary of a conversation with the new turns below.
+        Keep names, facts, decisions and open questions. Reply with the summary only,
+        at most 150 words, in the language of the conversation.
+
+        CURRENT SUMMARY:
+        {summary or "(empty)"}
+
+        NEW TURNS:
+        {transcript}
+        """
+        try:
+            for i in self.scheduled_keys(len(prompt) // 4 + REPLY_TOKENS):
+                try:
+                    model = self.key_pool.get_model(i, self.active_model_name or 'gemini-flash-latest')
+                    with self.key_pool.binding(i, model):
+                        response = model.generate_content(prompt)
+                    if response.text:
+                        self.key_pool.record_success(i)
+                        return response.text.strip()
+                except Exception as e:
+                    self.key_failed(i, e)
+                    self.logger.warning("API Key #%d failed to summarize history: %s", i + 1, e)
+        except SchedulerBusy:
+            self.logger.warning("Scheduler busy; summarizing history locally.")
+        return extractive_summary(summary, turns)
+
+    def scheduled_keys(self, tokens, priority=INTERACTIVE):
+        """
+        Yields the keys to try for one request, each granted by the scheduler
+        (waiting for quota if needed). Stops once every key has been tried or
+        none can be granted in time; raises SchedulerBusy if the queue is full.
+        """
+        tried = set()
+        while len(tried) < len(self.key_pool):
+            with self.metrics.span("queue_wait"):
+                index = self.scheduler.acquire(tokens, priority, exclude=tried)
+            if index is None:
+                self.logger.warning("No API key has quota left for this request.")
+                return
+            tried.add(index)
+            yield index
+
+    def key_failed(self, index, error):
+        """A 429 cools the key down in the scheduler; anything else counts against its health."""
+        delay = rate_limit_delay(error, self.scheduler.default_cooldown)
+        if delay is None:
+            self.key_pool.record_failure(index)
         else:
-            self.responses[normalized_question] = [answer]
-        self.save_knowledge()
-        self.logger.info(f"Learned new response for '{normalized_question}': {answer}")
+            self.scheduler.rate_limited(index, delay)
+            self.metrics.inc("chatbot_key_rate_limited_total", key=f"#{index+1}")
+
+    def reformat_text(self, text):
+        """Converts Markdown text into clean HTML (locally, no API call)."""
+        if not text:
+            return text
+        with self.metrics.span("reformat"):
+            return markdown_to_html(text)
+
+    def local_answer(self, user_input):
+        """Returns an answer from learned knowledge, or None."""
+        with self._lock:
+            match = self.index.lookup(user_input)
+            if not match:
+                return None
+            key, score = match
+            self.logger.debug("Knowledge match '%s' (score %.2f)", key, score)
+            return random.choice(self.responses[key])
+
+
+def _shared(name):
+    """ChatBot attribute that lives on the shared ChatEngine."""
+    return property(lambda self: getattr(self.engine, name))
+
+
+class ChatBot:
+    """
+    One conversation: persona and history on top of a shared ChatEngine.
+    Kept small (__slots__, no per-session copies of knowledge or keys) so
+    many sessions can share one process; see memory_usage().
+
+    ChatBot(**options) without an engine builds a private ChatEngine, which
+    is what the CLI and scripts want.
+    """
+
+    __slots__ = ("engine", "current_persona", "priority", "history_manager", "last_request_id",
+                 "_digest")
+
+    logger = logging.getLogger("ChatBot")
+
+    # Shared state and helpers, read through to the engine
+    responses = _shared("responses")
+    personas = _shared("personas")
+    api_keys = _shared("api_keys")
+    key_pool = _shared("key_pool")
+    scheduler = _shared("scheduler")
+    response_cache = _shared("response_cache")
+    spreadsheets = _shared("spreadsheets")
+    sheet_queries = _shared("sheet_queries")
+    images = _shared("images")
+    metrics = _shared("metrics")
+    learn = _shared("learn")
+    save_knowledge = _shared("save_knowledge")
+    build_system_instruction = _shared("build_system_instruction")
+    reformat_text = _shared("reformat_text")
+
+    def __init__(self, engine=None, history_max_tokens=3000, history_keep_turns=8, llm_summary=False,
+                 priority=INTERACTIVE, **engine_options):
+        self.engine = engine or ChatEngine(**engine_options)
+        self.current_persona = DEFAULT_PERSONA
+        self.priority = priority # scheduler.INTERACTIVE (UI) or scheduler.BATCH
+        self.last_request_id = None # trace of this session's latest request (see metrics.recent_trace)
+        self._digest = None # (attachment, content_digest) during a request (see _file_digest)
+        # Conversation history, kept within a token budget (see history.py)
+        self.history_manager = HistoryManager(
+            max_tokens=history_max_tokens,
+            keep_turns=history_keep_turns,
+            summarizer=self.engine.summarize_turns if llm_summary else None,
+        )
+
+    @property
+    def active_model_name(self):
+        return self.engine.active_model_name
+
+    @property
+    def history(self):
+        """Recent conversation turns (older ones live in history_manager.summary)."""
+        return self.history_manager.turns
+
+    @history.setter
+    def history(self, turns):
+        self.history_manager.reset(turns)
+
+    def set_persona(self, persona_name):
+        """Sets the current persona."""
+        if persona_name in self.personas:
+            self.current_persona = persona_name
+            self.logger.info("Persona set to: %s", persona_name)
+
+    def memory_usage(self):
+        """Approximate bytes held by this session (excluding the shared engine)."""
+        return deep_sizeof(self, exclude=(self.engine,))
 
     def call_gemini(self, prompt, file_data=None, file_type=None):
         """Calls Google Gemini API with key rotation and history."""
@@ -102,142 +334,567 @@ class ChatBot:
             self.logger.warning("No API keys found in config.json.")
             return None
 
-        for i, key in enumerate(self.api_keys):
-            if "YOUR_API_KEY" in key: # Skip placeholders
-                continue
-                
+        cache_key = self._cache_key(prompt, file_data)
+        cached = self._cached_reply(prompt, cache_key)
+        if cached:
+            return cached
+
+        flight_key, flight, leader = self._join_flight(prompt, file_data)
+        if not leader:
             try:
-                self.logger.info(f"Attempting to use API Key #{i+1}")
-                genai.configure(api_key=key)
-                
-                from datetime import datetime
-                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                # Construct System Instruction
-                base_instruction = self.personas.get(self.current_persona, self.personas["Jarvis AI"])
-                formatting_rules = f"""
-                IMPORTANT SYSTEM CONTEXT:
-                - Current Date/Time: {current_time}
-                
-                IMPORTANT RULES:
-                1. USE STRICT MARKDOWN.
-                2. ALWAYS put a blank line before headers (###).
-                3. ALWAYS put a blank line before and after lists.
-                4. LANGUAGE MATCHING: If the user speaks Thai, YOU MUST REPLY IN THAI.
-                5. AWARENESS: Be highly aware of the conversation context.
-                """
-                full_system_instruction = base_instruction + formatting_rules
-
-                # FORCE LATEST AS REQUESTED
-                target_model = 'gemini-flash-latest'
-                self.active_model_name = target_model
-                
-                model = genai.GenerativeModel(target_model, system_instruction=full_system_instruction)
-                chat = model.start_chat(history=self.history)
-                
-                # Prepare message content
-                message_parts = [prompt + "\n\n(SYSTEM NOTE: Format clearly using Markdown.)"]
-                
-                # Handle File Attachments
-                if file_data:
-                    if file_type in ['png', 'jpg', 'jpeg']:
-                        self.logger.info("Attaching Image...")
-                        message_parts.append(file_data) # PIL Image
-                    elif file_type in ['csv', 'xlsx', 'xls']:
-                        self.logger.info(f"Processing Spreadsheet ({file_type})...")
-                        # Convert spreadsheet to textual representation
-                        try:
-                            if file_type == 'csv':
-                                df = pd.read_csv(file_data)
-                            else:
-                                df = pd.read_excel(file_data)
-                            
-                            # Limit data to prevent token overflow (e.g., first 50 rows)
-                            data_preview = df.head(50).to_markdown(index=False)
-                            context_msg = f"\n\n[ATTACHED DATA - First 50 rows]\n{data_preview}\n\n"
-                            message_parts[0] += context_msg
-                        except Exception as e:
-                            self.logger.error(f"Error reading spreadsheet: {e}")
-                            message_parts[0] += f"\n\n(Error reading attached file: {str(e)})"
-
-                response = chat.send_message(message_parts)
+                return self._shared_reply(prompt, flight.wait(self.engine.coalesce_timeout))
+            except TimeoutError:
+                flight_key, flight = self._leader_timed_out()
+
+        text = None
+        try:
+            message_parts = self._build_message(prompt, file_data, file_type)
+            for i in self.engine.scheduled_keys(self._request_tokens(message_parts), self.priority):
+                try:
+                    self.logger.info("Attempting to use API Key #%d", i + 1)
+                    chat = self._start_chat(i, message_parts)
+                    with self.metrics.span("gemini_call"), self.key_pool.binding(i, chat.model):
+                        response = chat.send_message(message_parts)
                 
-                if response.text:
-                    self.logger.info(f"Success with API Key #{i+1}")
-                    # Update local history (Store text representation only)
-                    self.history.append({"role": "user", "parts": [prompt]})
-                    self.history.append({"role": "model", "parts": [response.text]})
-                    return response.text
+                    if response.text:
+                        self._key_succeeded(i)
+                        self.logger.info("Success with API Key #%d", i + 1)
+                        text = response.text
+                        self._record_turn(prompt, text)
+                        if cache_key:
+                            self.response_cache.put(cache_key, text)
+                        return text
                     
-            except Exception as e:
-                self.logger.warning(f"API Key #{i+1} failed: {e}. Trying next key...")
+                except Exception as e:
+                    self._key_failed(i, e)
+                    self.logger.warning("API Key #%d failed: %s. Trying next key...", i + 1, e)
         
-        self.logger.error("All API keys failed.")
-        return None
+            self.logger.error("All API keys failed.")
+            return None
+        finally:
+            self._finish_flight(flight_key, flight, text)
 
-    def reformat_text(self, text):
-        """Uses Gemini to reformat text into clean HTML."""
+    def call_gemini_stream(self, prompt, file_data=None, file_type=None):
+        """
+        Streaming variant of call_gemini: yields text chunks as they arrive.
+        Keys are only rotated before the first chunk; history is updated once
+        the reply is complete.
+        """
         if not self.api_keys:
-            return text
+            self.logger.warning("No API keys found in config.json.")
+            return
+
+        cache_key = self._cache_key(prompt, file_data)
+        cached = self._cached_reply(prompt, cache_key)
+        if cached:
+            yield cached
+            return
 
-        # Use the first available key
-        for key in self.api_keys:
-            if "YOUR_API_KEY" in key:
-                continue
+        flight_key, flight, leader = self._join_flight(prompt, file_data)
+        if not leader:
             try:
-                genai.configure(api_key=key)
-                
-                # Use the same model that worked for the main chat
-                reformat_model_name = self.active_model_name if self.active_model_name else 'gemini-pro'
-                model = genai.GenerativeModel(reformat_model_name)
-                
-                prompt = f"""
-                Please rewrite the following text using HTML formatting for a web chat interface.
-                
-                RULES:
-                1. Use <h3> for headers.
-                2. Use <ul> and <li> for lists.
-                3. Use <p> for paragraphs.
-                4. Use <b> for bold text.
-                5. Add <br> tags for extra spacing where needed.
-                6. Do NOT use Markdown. ONLY HTML.
-                7. Return ONLY the HTML code.
-                
-                TEXT TO FORMAT:
-                {text}
-                """
-                
-                response = model.generate_content(prompt)
-                if response.text:
-                    clean_html = response.text.replace("```html", "").replace("```", "").strip()
-                    return clean_html
-            except Exception:
-                continue
+                text = self._shared_reply(prompt, flight.wait(self.engine.coalesce_timeout))
+                if text:
+                    yield text
+                return
+            except TimeoutError:
+                flight_key, flight = self._leader_timed_out()
+
+        # Followers get the whole reply once the stream completes
+        text = None
+        try:
+            message_parts = self._build_message(prompt, file_data, file_type)
+            for i in self.engine.scheduled_keys(self._request_tokens(message_parts), self.priority):
+                chunks = []
+                try:
+                    self.logger.info("Attempting to stream with API Key #%d", i + 1)
+                    chat = self._start_chat(i, message_parts)
+                    with self.metrics.span("gemini_first_chunk"), self.key_pool.binding(i, chat.model):
+                        stream = iter(chat.send_message(message_parts, stream=True))
+                        first = next(stream, None)
+                    with self.metrics.span("gemini_stream"):
+                        for chunk in itertools.chain([first] if first is not None else [], stream):
+                            if chunk.text:
+                                chunks.append(chunk.text)
+                                yield chunk.text
+                except Exception as e:
+                    self._key_failed(i, e)
+                    if not chunks:
+                        self.logger.warning("API Key #%d failed: %s. Trying next key...", i + 1, e)
+                        continue
+                    # Part of the reply is already on screen; keep what was shown
+                    self.logger.error("API Key #%d failed mid-stream: %s", i + 1, e)
+                    self._record_turn(prompt, "".join(chunks))
+                    return
+
+                if chunks:
+                    self._key_succeeded(i)
+                    self.logger.info("Success with API Key #%d", i + 1)
+                    text = "".join(chunks)
+                    self._record_turn(prompt, text)
+                    if cache_key:
+                        self.response_cache.put(cache_key, text)
+                    return
+
+            self.logger.error("All API keys failed.")
+        finally:
+            self._finish_flight(flight_key, flight, text)
+
+    async def acall_gemini(self, prompt, file_data=None, file_type=None, hedge_after=None):
+        """
+        Async variant of call_gemini with bounded concurrency.
+        With hedge_after (seconds) set, a second request is sent on the next
+        key if the first has not answered in time; the first reply wins and
+        the other request is cancelled.
+        """
+        if not self.api_keys:
+            self.logger.warning("No API keys found in config.json.")
+            return None
+
+        # Recording a turn can call Gemini to summarize the history (llm_summary)
+        # and blocks, like the disk cache tier, so both run off the event loop
+        cache_key = self._cache_key(prompt, file_data)
+        cached = await asyncio.to_thread(self._cached_reply, prompt, cache_key)
+        if cached:
+            return cached
+
+        flight_key, flight, leader = self._join_flight(prompt, file_data)
+        if not leader:
+            try:
+                text = await self.engine.flights.wait_async(flight, self.engine.coalesce_timeout)
+                return await asyncio.to_thread(self._shared_reply, prompt, text)
+            except TimeoutError:
+                flight_key, flight = self._leader_timed_out()
+
+        result = None
+        try:
+            hedge_after = self.engine.hedge_after if hedge_after is None else hedge_after
+            # Spreadsheet parsing can take a while; keep it off the event loop
+            message_parts = await asyncio.to_thread(self._build_message, prompt, file_data, file_type)
+            tokens = self._request_tokens(message_parts)
+            tried = set()
+            pending = {}  # task -> key index
+
+            def launch(i):
+                if i is None:
+                    return False
+                tried.add(i)
+                task = asyncio.ensure_future(self._attempt_async(i, message_parts))
+                pending[task] = i
+                return True
+
+            async def acquire():
+                # Waiting for quota blocks, so do it off the event loop
+                if len(tried) == len(self.key_pool):
+                    return None
+                with self.metrics.span("queue_wait"):
+                    return await asyncio.to_thread(self.scheduler.acquire, tokens, self.priority, set(tried))
+
+            async with self.engine.async_semaphore():
+                launch(await acquire())
+                try:
+                    while pending:
+                        # Only hedge while a single request is in flight
+                        timeout = hedge_after if hedge_after and len(pending) == 1 else None
+                        done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                        if not done:
+                            i = next(iter(pending.values()))
+                            # A hedge only goes out if a key has quota right now
+                            if launch(self.scheduler.try_acquire(tokens, exclude=tried)):
+                                self.logger.info("API Key #%d slower than %ss, hedging on another key.", i + 1, hedge_after)
+                            else:
+                                hedge_after = None  # nothing left to hedge with
+                            continue
+
+                        for task in done:
+                            i = pending.pop(task)
+                            try:
+                                text = task.result()
+                            except Exception as e:
+                                self._key_failed(i, e)
+                                self.logger.warning("API Key #%d failed: %s. Trying next key...", i + 1, e)
+                                continue
+                            if text:
+                                self._key_succeeded(i)
+                                self.logger.info("Success with API Key #%d", i + 1)
+                                result = text
+                                await asyncio.to_thread(self._record_turn, prompt, text)
+                                if cache_key:
+                                    self.response_cache.put(cache_key, text)
+                                return text
+
+                        if not pending:
+                            launch(await acquire())
+                finally:
+                    # Cancel the losing hedge (or everything, if we were cancelled)
+                    for task in pending:
+                        task.cancel()
+
+            self.logger.error("All API keys failed.")
+            return None
+        finally:
+            self._finish_flight(flight_key, flight, result)
+
+    async def _attempt_async(self, index, message_parts):
+        self.logger.info("Attempting to use API Key #%d (async)", index + 1)
+        chat = self._start_chat(index, message_parts)
+        with self.metrics.span("gemini_call"):
+            # Like key_pool.binding(), so a first bind can't race a sync one
+            request = await self.key_pool.start_async(index, chat.model,
+                                                      lambda: chat.send_message_async(message_parts))
+            response = await request
+        return response.text
+
+    def _join_flight(self, prompt, file_data=None):
+        """
+        Joins the in-flight call for an identical request from another
+        session, if any. Returns (flight_key, flight, is_leader); only
+        history-free or short-history requests coalesce (flight_key None
+        means this one goes upstream on its own), and the key covers that
+        whole history, so sessions only share a reply when they've said the
+        same things so far.
+        """
+        max_history = self.engine.coalesce_max_history
+        if max_history is None or len(self.history) > max_history:
+            return None, None, True
+        flight_key = ResponseCache.make_key(
+            self._persona().key,
+            prompt,
+            [message["parts"][0] for message in self.history],
+            self._file_digest(file_data),
+        )
+        flight, leader = self.engine.flights.begin(flight_key)
+        self.metrics.inc("chatbot_coalescing_total", role="leader" if leader else "follower")
+        return flight_key, flight, leader
+
+    def _leader_timed_out(self):
+        """A coalesced follower stops waiting: this request goes upstream on its own (no flight)."""
+        self.logger.warning("Identical in-flight request took over %ss; calling Gemini directly.",
+                            self.engine.coalesce_timeout)
+        self.metrics.inc("chatbot_coalescing_total", role="timeout")
+        return None, None
+
+    def _finish_flight(self, flight_key, flight, text):
+        if flight is not None:
+            self.engine.flights.finish(flight_key, flight, text)
+
+    def _shared_reply(self, prompt, text):
+        """Reply of the call this request was coalesced into, recorded in this session's history."""
+        if text:
+            self.logger.info("Shared the reply of an identical in-flight request.")
+            current_trace().set(source="coalesced")
+            self._record_turn(prompt, text)
+        return text
+
+    def _key_succeeded(self, index):
+        self.key_pool.record_success(index)
+        self.metrics.inc("chatbot_key_success_total", key=f"#{index+1}")
+        current_trace().set(source="gemini", key_index=index)
+
+    def _key_failed(self, index, error):
+        self.engine.key_failed(index, error)
+        self.metrics.inc("chatbot_key_failures_total", key=f"#{index+1}")
+        current_trace().incr("failed_keys")
+
+    def _build_message(self, prompt, file_data=None, file_type=None):
+        """Builds the message parts once per request (not once per key attempt)."""
+        # The current time goes into the message rather than the system
+        # instruction so cached models stay valid.
+        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        message_parts = [prompt + f"\n\n(SYSTEM NOTE: Current Date/Time: {current_time}. Format clearly using Markdown.)"]
+
+        # Ground the reply in what the bot has been taught
+        if prompt and self.engine.retriever is not None:
+            with self.metrics.span("retrieval"):
+                message_parts[0] += self.engine.retriever.context(prompt)
         
-        return text 
+        # Handle File Attachments
+        if file_data:
+            if file_type in IMAGE_TYPES:
+                self.logger.info("Attaching Image...")
+                # Downscaled, re-encoded and cached by content hash
+                try:
+                    with self.metrics.span("image"):
+                        message_parts.append(self.images.prepare(file_data, self._file_digest(file_data)))
+                except Exception as e:
+                    self.logger.error("Error preparing image: %s", e)
+                    message_parts[0] += f"\n\n(Error reading attached image: {str(e)})"
+            elif file_type in SPREADSHEET_TYPES:
+                self.logger.info("Processing Spreadsheet (%s)...", file_type)
+                # Schema and column stats, plus the exact results when the
+                # question could be computed locally, else a row sample
+                try:
+                    result = self._sheet_query(prompt, file_data, file_type)
+                    with self.metrics.span("spreadsheet"):
+                        message_parts[0] += self.spreadsheets.summarize(file_data, file_type,
+                                                                        include_sample=result is None,
+                                                                        digest=self._file_digest(file_data))
+                    if result is not None:
+                        message_parts[0] += result.as_context()
+                except Exception as e:
+                    self.logger.error("Error reading spreadsheet: %s", e)
+                    message_parts[0] += f"\n\n(Error reading attached file: {str(e)})"
+        return message_parts
+
+    def _request_tokens(self, message_parts):
+        """Estimated tokens one request costs against a key's TPM budget."""
+        tokens = self.history_manager.measure_prompt(self._persona().instruction, message_parts[0])
+        self.logger.debug("Estimated prompt size: %d tokens", tokens)
+        return tokens + IMAGE_TOKENS * (len(message_parts) - 1) + REPLY_TOKENS
+
+    def _persona(self):
+        """The session's Persona (the default one if it was removed from the registry)."""
+        return self.engine.personas.resolve(self.current_persona)
+
+    def _start_chat(self, index, message_parts):
+        """Opens a chat on the key at index."""
+        # FORCE LATEST AS REQUESTED
+        target_model = 'gemini-flash-latest'
+        self.engine.active_model_name = target_model
+        persona = self._persona()
+
+        # Cached per persona version, with its instruction compiled once
+        model = self.key_pool.get_model(index, target_model, persona.key, persona.instruction)
+        return model.start_chat(history=self.history_manager.context())
+
+    def _cache_key(self, prompt, file_data=None):
+        """
+        Returns the response cache key for a request, or None if caching is
+        off or the reply depends on the time of day. Replies about the date
+        are only shared within the same day.
+        """
+        if self.response_cache is None:
+            return None
+        bucket = time_bucket(prompt)
+        if bucket is None:
+            return None
+        history_window = self.engine.cache_history_window
+        window = self.history[-history_window:] if history_window else []
+        return ResponseCache.make_key(
+            self._persona().key,
+            prompt,
+            [message["parts"][0] for message in window],
+            self._file_digest(file_data),
+            bucket,
+        )
+
+    def _file_digest(self, file_data):
+        """
+        content_digest of an attachment, hashed once per request: the cache
+        key, the coalescing key and every attachment stage reuse it. The
+        response methods drop the memo when the request ends, so a session
+        doesn't keep its last upload alive.
+        """
+        if file_data is None:
+            return None
+        memo = self._digest
+        if memo is not None and memo[0] is file_data:
+            return memo[1]
+        digest = content_digest(file_data)
+        self._digest = (file_data, digest)
+        return digest
+
+    def _cached_reply(self, prompt, cache_key):
+        """Returns a cached reply (recording it in history), or None."""
+        if not cache_key:
+            return None
+        with self.metrics.span("cache_lookup"):
+            cached = self.response_cache.get(cache_key)
+        if cached:
+            self.logger.info("Response cache hit.")
+            current_trace().set(source="cache")
+            self._record_turn(prompt, cached)
+        return cached
+
+    def _record_turn(self, prompt, text):
+        """Updates local history (Store text representation only)."""
+        self.history_manager.add_turn(prompt, text)
+
+    def _local_answer(self, user_input, file_data=None):
+        """Returns an answer from learned knowledge, or None."""
+        # Only for text-only queries
+        if file_data or not user_input:
+            return None
+        with self.metrics.span("knowledge_lookup"):
+            answer = self.engine.local_answer(user_input)
+        if answer:
+            current_trace().set(source="local")
+        return answer
+
+    def _sheet_query(self, prompt, file_data=None, file_type=None):
+        """Computes the answer to a question about an attached spreadsheet (a QueryResult), or None."""
+        if not prompt or not file_data or file_type not in SPREADSHEET_TYPES:
+            return None
+        try:
+            with self.metrics.span("spreadsheet_query"):
+                return self.sheet_queries.answer(prompt, file_data, file_type, self._file_digest(file_data))
+        except Exception as e:
+            self.logger.error("Error querying spreadsheet: %s", e)
+            return None
+
+    def _sheet_answer(self, prompt, file_data=None, file_type=None):
+        """
+        Answers a spreadsheet question without Gemini, when the engine has
+        sheet_direct_answers set (or no API keys). Returns None otherwise.
+        """
+        if not self.engine.sheet_direct_answers and self.api_keys:
+            return None
+        result = self._sheet_query(prompt, file_data, file_type)
+        if result is None:
+            return None
+        current_trace().set(source="spreadsheet")
+        answer = result.as_answer()
+        self._record_turn(prompt, answer)
+        return answer
 
     def get_response(self, user_input, file_data=None, file_type=None):
         """
         Determines the response based on user input and optional file attachment.
         """
+        with self.metrics.trace("get_response") as trace:
+            self.last_request_id = trace.request_id
+            trace.set(prompt_chars=len(user_input or ""))
+            try:
+                response = self._get_response(user_input, file_data, file_type)
+            finally:
+                self._digest = None
+            trace.set(response_chars=len(response))
+            return response
+
+    def _get_response(self, user_input, file_data=None, file_type=None):
         try:
             if not user_input and not file_data:
                 return "..."
 
             # 1. Check Local Knowledge (Only if text-only query)
-            normalized_input = user_input.lower().strip()
-            if not file_data and normalized_input in self.responses:
-                import random
-                return random.choice(self.responses[normalized_input])
+            local_answer = self._local_answer(user_input, file_data)
+            if local_answer:
+                return local_answer
+
+            # 2. Spreadsheet questions computed locally (if answered directly)
+            sheet_answer = self._sheet_answer(user_input, file_data, file_type)
+            if sheet_answer:
+                return sheet_answer
                 
-            # 2. Call Google Gemini API
+            # 3. Call Google Gemini API
             ai_response = self.call_gemini(user_input, file_data=file_data, file_type=file_type)
             if ai_response:
                 return ai_response
                 
-            # 3. Fallback
-            return "I'm sorry, I couldn't understand that."
+            # 4. Fallback
+            current_trace().set(source="fallback")
+            return FALLBACK_MESSAGE
 
+        except SchedulerBusy:
+            self.logger.warning("Request queue full; asking the user to retry.")
+            current_trace().set(source="busy")
+            return BUSY_MESSAGE
         except Exception as e:
-            self.logger.error(f"Error processing input: {e}", exc_info=True)
-            return "Oops! Something went wrong internally."
+            self.logger.error("Error processing input: %s", e, exc_info=True)
+            current_trace().set(source="error")
+            return ERROR_MESSAGE
+
+    def stream_response(self, user_input, file_data=None, file_type=None):
+        """
+        Generator variant of get_response: yields the reply in chunks as it
+        arrives from Gemini (local answers and fallbacks come as one chunk).
+        """
+        with self.metrics.trace("stream_response") as trace:
+            self.last_request_id = trace.request_id
+            trace.set(prompt_chars=len(user_input or ""))
+            response_chars = 0
+            try:
+                for chunk in self._stream_response(user_input, file_data, file_type):
+                    response_chars += len(chunk)
+                    yield chunk
+            finally:
+                self._digest = None
+            trace.set(response_chars=response_chars)
+
+    def _stream_response(self, user_input, file_data=None, file_type=None):
+        try:
+            if not user_input and not file_data:
+                yield "..."
+                return
+
+            # 1. Check Local Knowledge (Only if text-only query)
+            local_answer = self._local_answer(user_input, file_data)
+            if local_answer:
+                yield local_answer
+                return
+
+            # 2. Spreadsheet questions computed locally (if answered directly)
+            sheet_answer = self._sheet_answer(user_input, file_data, file_type)
+            if sheet_answer:
+                yield sheet_answer
+                return
+
+            # 3. Stream from Google Gemini API
+            streamed = False
+            for chunk in self.call_gemini_stream(user_input, file_data=file_data, file_type=file_type):
+                streamed = True
+                yield chunk
+            if streamed:
+                return
+
+            # 4. Fallback
+            current_trace().set(source="fallback")
+            yield FALLBACK_MESSAGE
+
+        except SchedulerBusy:
+            self.logger.warning("Request queue full; asking the user to retry.")
+            current_trace().set(source="busy")
+            yield BUSY_MESSAGE
+        except Exception as e:
+            self.logger.error("Error processing input: %s", e, exc_info=True)
+            current_trace().set(source="error")
+            yield ERROR_MESSAGE
+
+    async def aget_response(self, user_input, file_data=None, file_type=None):
+        """
+        Async variant of get_response (see acall_gemini).
+        """
+        with self.metrics.trace("aget_response") as trace:
+            self.last_request_id = trace.request_id
+            trace.set(prompt_chars=len(user_input or ""))
+            try:
+                response = await self._aget_response(user_input, file_data, file_type)
+            finally:
+                self._digest = None
+            trace.set(response_chars=len(response))
+            return response
+
+    async def _aget_response(self, user_input, file_data=None, file_type=None):
+        try:
+            if not user_input and not file_data:
+                return "..."
+
+            # 1. Check Local Knowledge (Only if text-only query)
+            local_answer = self._local_answer(user_input, file_data)
+            if local_answer:
+                return local_answer
+
+            # 2. Spreadsheet questions computed locally (if answered directly)
+            if file_type in SPREADSHEET_TYPES:
+                sheet_answer = await asyncio.to_thread(self._sheet_answer, user_input, file_data, file_type)
+                if sheet_answer:
+                    return sheet_answer
+                
+            # 3. Call Google Gemini API
+            ai_response = await self.acall_gemini(user_input, file_data=file_data, file_type=file_type)
+            if ai_response:
+                return ai_response
+                
+            # 4. Fallback
+            current_trace().set(source="fallback")
+            return FALLBACK_MESSAGE
+
+        except SchedulerBusy:
+            self.logger.warning("Request queue full; asking the user to retry.")
+            current_trace().set(source="busy")
+            return BUSY_MESSAGE
+        except Exception as e:
+            self.logger.error("Error processing input: %s", e, exc_info=True)
+            current_trace().set(source="error")
+            return ERROR_MESSAGE
+
@@ -0,0 +1,144 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+# Message body encodings
+RAW = 0
+ZLIB = 1
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions "
+    "(id TEXT PRIMARY KEY, created REAL NOT NULL, updated REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS messages "
+    "(id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, created REAL NOT NULL, "
+    "role TEXT NOT NULL, kind TEXT NOT NULL DEFAULT 'text', codec INTEGER NOT NULL, body BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, created, id)",
+)
+
+
+def _encode(text, min_size, level):
+    data = text.encode("utf-8")
+    if len(data) >= min_size:
+        compressed = zlib.compress(data, level)
+        if len(compressed) < len(data):
+            return ZLIB, compressed
+    return RAW, data
+
+
+def _decode(codec, body):
+    data = zlib.decompress(body) if codec == ZLIB else body
+    return data.decode("utf-8")
+
+
+class ConversationStore:
+    """
+    SQLite store for chat transcripts, so conversations survive restarts and
+    browser reloads.
+
+    Message bodies are stored as the raw text (not the rendered HTML) and
+    zlib-compressed once they reach compress_min bytes. Messages are indexed
+    on (session_id, created), so the UI can page a conversation from the
+    newest message backwards without reading the rest of it.
+    """
+
+    def __init__(self, db_file, compress_min=256, compress_level=6):
+        self.logger = logging.getLogger("ChatBot")
+        self.db_file = db_file
+        self.compress_min = compress_min
+        self.compress_level = compress_level
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_file, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    def create_session(self):
+        """Starts a new conversation and returns its id."""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT INTO sessions (id, created, updated) VALUES (?, ?, ?)",
+                             (session_id, now, now))
+            self._db.commit()
+        return session_id
+
+    def has_session(self, session_id):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def append(self, session_id, role, text, kind="text"):
+        """
+        Adds a message and returns its id. kind="text" messages are
+        conversation turns; other kinds (e.g. "attachment" notes) are only
+        shown in the transcript.
+        """
+        codec, body = _encode(text, self.compress_min, self.compress_level)
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO messages (session_id, created, role, kind, codec, body) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, now, role, kind, codec, body),
+            )
+            self._db.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+            self._db.commit()
+            return cursor.lastrowid
+
+    def page(self, session_id, before_id=None, limit=20):
+        """
+        Returns up to limit messages older than before_id (default: the
+        newest ones), oldest first, as dicts with id, role, kind, text and
+        created.
+        """
+        query = "SELECT id, role, kind, codec, body, created FROM messages WHERE session_id = ?"
+        params = [session_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY created DESC, id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [
+            {"id": message_id, "role": role, "kind": kind, "text": _decode(codec, body), "created": created}
+            for message_id, role, kind, codec, body, created in reversed(rows)
+        ]
+
+    def has_earlier(self, session_id, before_id):
+        """True if the session has messages older than before_id."""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM messages WHERE session_id = ? AND id < ? LIMIT 1",
+                                    (session_id, before_id)).fetchone() is not None
+
+    def recent_turns(self, session_id, limit=8):
+        """
+        The last limit (prompt, reply) pairs of a session, oldest first,
+        for rebuilding ChatBot history.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, codec, body FROM messages WHERE session_id = ? AND kind = 'text' "
+                "ORDER BY created DESC, id DESC LIMIT ?", (session_id, 2 * limit + 1),
+            ).fetchall()
+        turns, reply = [], None
+        for role, codec, body in rows:  # newest first
+            if role == "assistant":
+                reply = _decode(codec, body)
+            elif reply is not None:
+                turns.append((_decode(codec, body), reply))
+                reply = None
+        return turns[:limit][::-1]
+
+    def delete_message(self, message_id):
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
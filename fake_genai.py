@@ -0,0 +1,176 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+
+class FakeResponse:
+    """Mimics a google.generativeai response (or one streamed chunk)."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStreamResponse:
+    """Mimics a streaming response: iterate to receive chunks as they arrive."""
+
+    def __init__(self, chunks, chunk_delay):
+        self._chunks = chunks
+        self._chunk_delay = chunk_delay
+        self.text = "".join(chunks)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            yield FakeResponse(chunk)
+
+
+class FakeRateLimitError(Exception):
+    """Mimics google.api_core.exceptions.ResourceExhausted (HTTP 429)."""
+
+    code = 429
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"429 Resource has been exhausted (e.g. check quota). "
+                         f"Please retry in {retry_after:.1f}s.")
+
+
+class FakeChatSession:
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False):
+        return self.model._respond(content, stream=stream)
+
+    async def send_message_async(self, content, stream=False):
+        return await self.model._respond_async(content)
+
+
+class FakeGenerativeModel:
+    def __init__(self, backend, model_name, system_instruction=None):
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.api_key = None  # bound to the configured key on first request, like the real client
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+    def generate_content(self, content, stream=False):
+        return self._respond(content, stream=stream)
+
+    async def generate_content_async(self, content, stream=False):
+        return await self._respond_async(content)
+
+    def _bind(self):
+        if self.api_key is None:
+            self.api_key = self.backend.api_key
+        return self.api_key
+
+    def _respond(self, content, stream=False):
+        return self.backend._respond(self._bind(), content, stream)
+
+    async def _respond_async(self, content):
+        # Binds before the first await, like the real async client
+        return await self.backend._respond_async(self._bind(), content)
+
+
+class FakeGenAI:
+    """
+    Offline stand-in for the google.generativeai module.
+
+    Supports configure(), GenerativeModel, start_chat/send_message(_async) and
+    generate_content(_async), with optional streaming. Latency, per-key
+    failures and the reply text are configurable so ChatBot can be exercised
+    without a network connection or real API keys.
+
+    latency may be a number of seconds, a callable taking the API key (see
+    lognormal_latency), or a dict mapping API keys to either of those.
+    rate_limit=(requests, period) enforces a per-key quota like the real
+    API: calls over it raise FakeRateLimitError with a retry delay.
+    """
+
+    def __init__(self, reply="This is a **fake** Gemini reply.", latency=0.0, chunk_size=16,
+                 chunk_delay=0.0, failure_rate=0.0, failing_keys=(), seed=None, rate_limit=None):
+        self.reply = reply
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.failure_rate = failure_rate
+        self.failing_keys = set(failing_keys)
+        self.rate_limit = rate_limit
+        self.api_key = None
+        self.calls = 0
+        self.rate_limited = 0
+        self._windows = {}  # api key -> recent call times
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def configure(self, api_key=None, **kwargs):
+        self.api_key = api_key
+
+    def GenerativeModel(self, model_name, system_instruction=None, **kwargs):
+        return FakeGenerativeModel(self, model_name, system_instruction)
+
+    def _reply_text(self, content):
+        if callable(self.reply):
+            return self.reply(content)
+        return self.reply
+
+    def _latency_for(self, api_key):
+        latency = self.latency
+        if isinstance(latency, dict):
+            latency = latency.get(api_key, 0.0)
+        if callable(latency):
+            with self._lock:
+                return latency(api_key)
+        return latency
+
+    def _begin(self, api_key):
+        """Counts the call, enforces rate_limit and decides up front whether it fails."""
+        with self._lock:
+            self.calls += 1
+            if self.rate_limit:
+                limit, period = self.rate_limit
+                now = time.monotonic()
+                window = self._windows.setdefault(api_key, deque())
+                while window and window[0] <= now - period:
+                    window.popleft()
+                if len(window) >= limit:
+                    self.rate_limited += 1
+                    raise FakeRateLimitError(window[0] + period - now)
+                window.append(now)
+            return api_key in self.failing_keys or self._random.random() < self.failure_rate
+
+    def _respond(self, api_key, content, stream):
+        fail = self._begin(api_key)
+        latency = self._latency_for(api_key)
+        if latency:
+            time.sleep(latency)
+        if fail:
+            raise RuntimeError(f"Fake backend failure for key {api_key!r}")
+
+        text = self._reply_text(content)
+        if not stream:
+            return FakeResponse(text)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        return FakeStreamResponse(chunks, self.chunk_delay)
+
+    async def _respond_async(self, api_key, content):
+        fail = self._begin(api_key)
+        latency = self._latency_for(api_key)
+        if latency:
+            await asyncio.sleep(latency)
+        if fail:
+            raise RuntimeError(f"Fake backend failure for key {api_key!r}")
+        return FakeResponse(self._reply_text(content))
+
+
+def lognormal_latency(median, sigma=0.5, seed=None):
+    """Returns a latency function with a long right tail, like real API calls."""
+    rng = random.Random(seed)
+    return lambda api_key: median * rng.lognormvariate(0.0, sigma)
@@ -0,0 +1,253 @@
+import html
+import re
+
+# Headers or numbered items glued onto the previous sentence, e.g. Thai text
+# "...มนุษย์ ### รายการ 1. อย่า... 2. อย่า..." (see reproduce_issue.py)
+_INLINE_HEADER_RE = re.compile(r"(?<=[^\s#])[ \t]+(#{2,6}[ \t]+)")
+_INLINE_NUMBER_RE = re.compile(r"(?:(?<=\s)|^)(\d{1,3})\.[ \t]+")
+
+_FENCE_RE = re.compile(r"^\s*```")
+_HEADER_RE = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_HR_RE = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+_BULLET_RE = re.compile(r"^(\s*)[-*+•][ \t]+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\s*)(\d{1,3})[.)][ \t]+(.*)$")
+
+_CODE_RE = re.compile(r"`([^`\n]+)`")
+_BOLD_RE = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|__(?=\S)(.+?)(?<=\S)__")
+_ITALIC_RE = re.compile(r"(?<![\w*])\*(?=\S)([^*\n]+?)(?<=\S)\*(?!\*)|(?<!\w)_(?=\S)([^_\n]+?)(?<=\S)_(?!\w)")
+_LINK_RE = re.compile(r"\[([^\]\n]+)\]\((https?://[^)\s]+)\)")
+
+
+def _starts_list(line, pos):
+    """True if a "1." at pos begins a list: at the start of a line, or after a colon or a header."""
+    before = line[:pos].rsplit("\n", 1)[-1].strip()
+    return not before or before.endswith((":", "：")) or before.startswith("#")
+
+
+def fix_run_on(text):
+    """
+    Puts run-on headers and numbered lists onto their own lines.
+    A numbered item is only split off when it continues a 1, 2, 3... run
+    that starts a line or follows a colon or a header, so numbers inside
+    sentences ("10 ประการ", "version 2. ", "I have 1. apples and 2. pears")
+    are left alone.
+    """
+    lines = []
+    in_code = False
+    for line in text.split("\n"):
+        if _FENCE_RE.match(line):
+            in_code = not in_code
+        if in_code or _FENCE_RE.match(line):
+            lines.append(line)
+            continue
+
+        line = _INLINE_HEADER_RE.sub(r"\n\n\1", line)
+
+        # Find the first "1." that can start a list and the run of
+        # consecutive numbers after it
+        splits, expected = [], 1
+        for m in _INLINE_NUMBER_RE.finditer(line):
+            if int(m.group(1)) == expected and (expected > 1 or _starts_list(line, m.start())):
+                splits.append(m.start())
+                expected += 1
+        if len(splits) >= 2:
+            parts = [line[:splits[0]]]
+            parts += [line[a:b] for a, b in zip(splits, splits[1:] + [len(line)])]
+            line = "\n\n".join(part.strip() for part in parts if part.strip())
+
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def render_inline(text):
+    """Escapes HTML and converts inline Markdown (bold, italic, code, links)."""
+    code_spans = []
+
+    def stash_code(m):
+        code_spans.append(f"<code>{html.escape(m.group(1), quote=False)}</code>")
+        return f"\x00{len(code_spans) - 1}\x00"
+
+    text = _CODE_RE.sub(stash_code, text)
+    text = html.escape(text, quote=False)
+    # The URL was escaped with the text (quote=False); escape it again for the attribute
+    text = _LINK_RE.sub(lambda m: f'<a href="{html.escape(html.unescape(m.group(2)), quote=True)}" '
+                                  f'target="_blank">{m.group(1)}</a>', text)
+    text = _BOLD_RE.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = _ITALIC_RE.sub(lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
+    if code_spans:
+        text = re.sub(r"\x00(\d+)\x00", lambda m: code_spans[int(m.group(1))], text)
+    return text
+
+
+def _render_list(items):
+    """Renders [(indent, ordered, number, text)] as (possibly nested) lists."""
+    out = []
+    stack = []  # (indent, tag)
+    for indent, ordered, number, text in items:
+        tag = "ol" if ordered else "ul"
+        while stack and (indent < stack[-1][0] or (indent == stack[-1][0] and tag != stack[-1][1])):
+            out.append(f"</li></{stack.pop()[1]}>")
+        if not stack or indent > stack[-1][0]:
+            start = f' start="{number}"' if ordered and number != 1 else ""
+            out.append(f"<{tag}{start}><li>")
+            stack.append((indent, tag))
+        else:
+            out.append("</li><li>")
+        out.append(render_inline(text))
+    while stack:
+        out.append(f"</li></{stack.pop()[1]}>")
+    return "".join(out)
+
+
+def markdown_to_html(text):
+    """
+    Converts chat Markdown to HTML deterministically and in-process:
+    headers -> <h3>, lists -> <ul>/<ol>, **bold** -> <b>, text -> <p>.
+    Raw HTML in the input is escaped.
+    """
+    if not text:
+        return ""
+
+    out = []
+    paragraph, items, code = [], [], None
+
+    def flush():
+        if paragraph:
+            out.append("<p>" + "<br>".join(render_inline(line) for line in paragraph) + "</p>")
+            paragraph.clear()
+        if items:
+            out.append(_render_list(items))
+            items.clear()
+
+    for line in fix_run_on(text.replace("\r\n", "\n")).split("\n"):
+        # Fenced code blocks are copied verbatim (escaped)
+        if code is not None:
+            if _FENCE_RE.match(line):
+                out.append("<pre><code>" + html.escape("\n".join(code), quote=False) + "</code></pre>")
+                code = None
+            else:
+                code.append(line)
+            continue
+        if _FENCE_RE.match(line):
+            flush()
+            code = []
+            continue
+
+        if not line.strip():
+            # Blank lines between list items keep the list open (loose list)
+            if paragraph:
+                flush()
+            continue
+
+        header = _HEADER_RE.match(line)
+        if header:
+            flush()
+            out.append(f"<h3>{render_inline(header.group(2))}</h3>")
+            continue
+
+        if _HR_RE.match(line):
+            flush()
+            out.append("<hr>")
+            continue
+
+        bullet = _BULLET_RE.match(line)
+        numbered = None if bullet else _NUMBERED_RE.match(line)
+        if bullet or numbered:
+            if paragraph:
+                flush()
+            if bullet:
+                items.append((len(bullet.group(1).expandtabs(4)), False, 1, bullet.group(2)))
+            else:
+                items.append((len(numbered.group(1).expandtabs(4)), True, int(numbered.group(2)), numbered.group(3)))
+            continue
+
+        if items and line[:1].isspace():
+            # Indented continuation of the previous list item
+            indent, ordered, number, item_text = items[-1]
+            items[-1] = (indent, ordered, number, item_text + " " + line.strip())
+            continue
+
+        if items:
+            flush()
+        paragraph.append(line.strip())
+
+    if code is not None:  # unterminated fence (e.g. mid-stream)
+        out.append("<pre><code>" + html.escape("\n".join(code), quote=False) + "</code></pre>")
+    flush()
+    return "\n".join(out)
+
+
+def _block_boundary(text):
+    """
+    Position of the last blank line ("\n\n") in text that ends every open
+    block, or -1. Blank lines inside code fences or lists don't count: a
+    blank line doesn't end a list (loose list), and cutting there would start
+    a separate <ol start=...> for the next item.
+    """
+    boundary, offset, in_code, in_list = -1, 0, False, False
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if _FENCE_RE.match(line):
+            in_code, in_list = not in_code, False
+        elif in_code:
+            pass
+        elif not line:
+            if 0 < i < len(lines) - 1 and not in_list:
+                boundary = offset - 1
+        elif line.strip():
+            for part in fix_run_on(line).split("\n"):
+                if not part.strip():
+                    continue
+                if _HEADER_RE.match(part) or _HR_RE.match(part):
+                    in_list = False
+                elif _BULLET_RE.match(part) or _NUMBERED_RE.match(part):
+                    in_list = True
+                elif not part[:1].isspace():
+                    in_list = False  # a paragraph ends the list
+        offset += len(line) + 1
+    return boundary
+
+
+class StreamingFormatter:
+    """
+    Incremental markdown_to_html for streamed replies.
+
+    Blocks that are complete (followed by a blank line, outside code fences)
+    are rendered once and cached; each feed() only re-renders the open tail,
+    so the cost per chunk stays flat however long the reply gets.
+    """
+
+    def __init__(self):
+        self._closed_text = []  # raw text of completed blocks
+        self._closed_html = ""  # their rendered HTML
+        self._tail = ""         # text of the block still being received
+        self._checked = -1      # last blank line in the tail that didn't close anything
+
+    @property
+    def text(self):
+        return "".join(self._closed_text) + self._tail
+
+    def feed(self, chunk):
+        """Adds a chunk and returns the HTML for everything received so far."""
+        self._tail += chunk
+        boundary = self._tail.rfind("\n\n")
+        if boundary == self._checked:
+            return self.html()  # no new blank line since the last check
+        self._checked = boundary
+        if boundary != -1:
+            # Never cut inside a code fence or a list
+            boundary = _block_boundary(self._tail)
+        if boundary != -1:
+            rendered = markdown_to_html(self._tail[:boundary])
+            if rendered:
+                self._closed_html += ("\n" if self._closed_html else "") + rendered
+            self._closed_text.append(self._tail[:boundary + 2])
+            self._tail = self._tail[boundary + 2:]
+            self._checked = -1
+        return self.html()
+
+    def html(self):
+        tail = markdown_to_html(self._tail)
+        if not tail:
+            return self._closed_html
+        return self._closed_html + "\n" + tail if self._closed_html else tail
@@ -0,0 +1,117 @@
+import logging
+import re
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?。])\s|\n")
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate without a tokenizer: ~4 characters per token for
+    ASCII text, ~2 per token for Thai and other non-ASCII scripts.
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return max(1, round(ascii_chars / 4 + (len(text) - ascii_chars) / 2))
+
+
+def _first_sentence(text, limit):
+    text = " ".join(str(text).split("\n", 3)[:3]).strip()
+    sentence = _SENTENCE_END_RE.split(text, 1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + "..."
+
+
+def extractive_summary(summary, turns, max_chars=2000):
+    """
+    Folds evicted turns into the running summary without an API call:
+    one line per exchange, oldest lines dropped past max_chars.
+    """
+    lines = summary.split("\n") if summary else []
+    for i in range(0, len(turns) - 1, 2):
+        question = _first_sentence(turns[i]["parts"][0], 120)
+        answer = _first_sentence(turns[i + 1]["parts"][0], 160)
+        lines.append(f"- User: {question} / Assistant: {answer}")
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """
+    Keeps conversation history within a token budget.
+
+    The last keep_turns exchanges are kept verbatim as long as they fit in
+    max_tokens; older exchanges are folded into a rolling summary. The
+    summary is updated incrementally: the summarizer only receives the
+    previous summary plus the turns being evicted.
+    """
+
+    __slots__ = ("logger", "max_tokens", "keep_turns", "summarizer", "turns", "summary",
+                 "last_prompt_tokens", "_tokens")
+
+    def __init__(self, max_tokens=3000, keep_turns=8, summarizer=None):
+        self.logger = logging.getLogger("ChatBot")
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summarizer = summarizer or extractive_summary
+
+        self.turns = []        # verbatim window, in genai history format
+        self.summary = ""
+        self.last_prompt_tokens = 0
+        self._tokens = []      # estimated tokens per message in self.turns
+
+    def __len__(self):
+        return len(self.turns)
+
+    def reset(self, turns=None):
+        """Replaces the history (e.g. New Chat) and clears the summary."""
+        self.turns = []
+        self._tokens = []
+        self.summary = ""
+        for message in turns or []:
+            self.turns.append(message)
+            self._tokens.append(estimate_tokens(message["parts"][0]))
+        self._compact()
+
+    def add_turn(self, prompt, reply):
+        """Appends one user/model exchange, then enforces the budget."""
+        self.turns.append({"role": "user", "parts": [prompt]})
+        self.turns.append({"role": "model", "parts": [reply]})
+        self._tokens.append(estimate_tokens(prompt))
+        self._tokens.append(estimate_tokens(reply))
+        self._compact()
+
+    def window_tokens(self):
+        return sum(self._tokens) + estimate_tokens(self.summary)
+
+    def _compact(self):
+        evicted = []
+        budget = self.max_tokens - estimate_tokens(self.summary)
+        # Always keep the latest exchange, even if it alone exceeds the budget
+        while len(self.turns) > 2 and (len(self.turns) > self.keep_turns * 2
+                                       or sum(self._tokens) > budget):
+            evicted.extend(self.turns[:2])
+            del self.turns[:2]
+            del self._tokens[:2]
+
+        if evicted:
+            try:
+                self.summary = self.summarizer(self.summary, evicted)
+            except Exception as e:
+                self.logger.warning("History summarizer failed, using extractive summary: %s", e)
+                self.summary = extractive_summary(self.summary, evicted)
+            self.logger.debug("Folded %d turns into history summary.", len(evicted) // 2)
+
+    def context(self):
+        """Returns the history to send to the model: summary (if any) + window."""
+        if not self.summary:
+            return list(self.turns)
+        return [
+            {"role": "user", "parts": [f"(Summary of our earlier conversation:\n{self.summary})"]},
+            {"role": "model", "parts": ["Understood, I'll keep that context in mind."]},
+        ] + self.turns
+
+    def measure_prompt(self, *texts):
+        """Records and returns the estimated prompt size for one request."""
+        self.last_prompt_tokens = self.window_tokens() + sum(estimate_tokens(t) for t in texts)
+        return self.last_prompt_tokens
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import lazy_import
+
+asyncio = lazy_import("asyncio")
+
+
+class KeyState:
+    """Health of a single API key (circuit breaker state)."""
+
+    CLOSED = "closed"        # healthy, used normally
+    OPEN = "open"            # failing, skipped until the cooldown expires
+    HALF_OPEN = "half_open"  # cooldown expired, one probe request allowed
+
+    def __init__(self, index, key):
+        self.index = index  # position in the configured key list
+        self.key = key
+        self.state = self.CLOSED
+        self.failures = 0
+        self.last_failure = 0.0
+        self.last_used = 0.0
+        self.open_until = 0.0
+
+    def snapshot(self):
+        return {
+            "key": f"#{self.index + 1}",
+            "state": self.state,
+            "failures": self.failures,
+            "open_for": max(0.0, round(self.open_until - time.monotonic(), 1)),
+        }
+
+
+class KeyPool:
+    """
+    Pool of Gemini API keys with per-key circuit breakers and cached models.
+
+    Keys that fail failure_threshold times in a row are opened for cooldown
+    seconds, after which a single half-open probe decides whether they rejoin
+    the pool. Model objects are cached per (key, model name, persona) so a
+    request does not pay genai.configure + GenerativeModel setup every time.
+    """
+
+    def __init__(self, api_keys, backend, strategy="least_recently_failed",
+                 failure_threshold=2, cooldown=60.0, max_cooldown=900.0):
+        self.logger = logging.getLogger("ChatBot")
+        self.backend = backend
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.keys = [KeyState(i, key) for i, key in enumerate(api_keys)
+                     if "YOUR_API_KEY" not in key]  # Skip placeholders
+        self._by_index = {state.index: state for state in self.keys}
+        self._models = {}
+        self._bound = set()  # ids of cached models that have made a request
+        self._active_index = None
+        self._rr_offset = 0
+        self._lock = threading.Lock()
+        self._bind_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidates(self):
+        """Returns key states in the order they should be tried for one request."""
+        now = time.monotonic()
+        with self._lock:
+            healthy, probes, still_open = [], [], []
+            for state in self.keys:
+                if state.state == KeyState.CLOSED:
+                    healthy.append(state)
+                elif state.open_until <= now:
+                    # Let exactly one request probe the key per cooldown period
+                    state.state = KeyState.HALF_OPEN
+                    state.open_until = now + self.cooldown
+                    probes.append(state)
+                else:
+                    still_open.append(state)
+
+            if self.strategy == "round_robin" and healthy:
+                offset = self._rr_offset % len(healthy)
+                healthy = healthy[offset:] + healthy[:offset]
+                self._rr_offset += 1
+            else:
+                healthy.sort(key=lambda s: s.last_failure)
+
+            # Open keys are a last resort, soonest-to-recover first
+            still_open.sort(key=lambda s: s.open_until)
+            return healthy + probes + still_open
+
+    def record_success(self, index):
+        with self._lock:
+            state = self._by_index[index]
+            if state.state != KeyState.CLOSED:
+                self.logger.info("API Key #%d recovered.", index + 1)
+            state.state = KeyState.CLOSED
+            state.failures = 0
+            state.last_used = time.monotonic()
+
+    def record_failure(self, index):
+        with self._lock:
+            state = self._by_index[index]
+            now = time.monotonic()
+            state.failures += 1
+            state.last_failure = now
+            state.last_used = now
+            if state.state == KeyState.HALF_OPEN or state.failures >= self.failure_threshold:
+                # Back off harder the longer a key keeps failing
+                trips = max(1, state.failures - self.failure_threshold + 1)
+                cooldown = min(self.cooldown * 2 ** (trips - 1), self.max_cooldown)
+                state.state = KeyState.OPEN
+                state.open_until = now + cooldown
+                self.logger.warning("API Key #%d opened for %.0fs after %d failures.",
+                                    index + 1, cooldown, state.failures)
+
+    def get_model(self, index, model_name, persona=None, system_instruction=None):
+        """Returns the cached GenerativeModel for the key at index (see binding)."""
+        cache_key = (index, model_name, persona)
+        with self._lock:
+            model = self._models.get(cache_key)
+            if model is None:
+                if system_instruction:
+                    model = self.backend.GenerativeModel(model_name, system_instruction=system_instruction)
+                else:
+                    model = self.backend.GenerativeModel(model_name)
+                self._models[cache_key] = model
+            return model
+
+    def activate(self, index):
+        """Makes the key at index the backend's configured key."""
+        with self._lock:
+            self._activate(index)
+
+    @contextmanager
+    def binding(self, index, model):
+        """
+        Wrap a model's request in this. A model binds to the configured key
+        on its first request, so that first request holds the key steady
+        against other threads; later requests don't take the lock at all.
+        """
+        if id(model) not in self._bound:
+            with self._bind_lock:
+                # Re-check: the model may have been bound while we waited
+                if id(model) not in self._bound:
+                    self.activate(index)
+                    try:
+                        yield
+                    finally:
+                        self._bound.add(id(model))
+                    return
+        yield
+
+    async def start_async(self, index, model, request):
+        """
+        Async counterpart of binding(): runs request() (a coroutine making
+        one of model's requests) as a task and returns the task. On the
+        model's first request the key is held steady until the task has run
+        up to its first await, which is when the client binds the model.
+        """
+        if id(model) in self._bound:
+            return asyncio.ensure_future(request())
+        # A sync first request may hold the lock for its whole call: poll
+        # rather than block the event loop (or leak the lock if cancelled)
+        while not self._bind_lock.acquire(blocking=False):
+            await asyncio.sleep(0.005)
+        try:
+            if id(model) in self._bound:  # bound while we waited
+                return asyncio.ensure_future(request())
+            self.activate(index)
+            task = asyncio.ensure_future(request())
+            await asyncio.sleep(0)  # the task takes its first step and binds the model
+            self._bound.add(id(model))
+            return task
+        finally:
+            self._bind_lock.release()
+
+    def _activate(self, index):
+        # google.generativeai binds a model to the globally configured key on
+        # its first request, so configure only when switching keys.
+        if self._active_index != index:
+            self.backend.configure(api_key=self._by_index[index].key)
+            self._active_index = index
+
+    def invalidate(self, persona=None):
+        """Drops cached models (for one persona, or all of them)."""
+        with self._lock:
+            if persona is None:
+                self._models.clear()
+                self._bound.clear()
+            else:
+                for cache_key in [k for k in self._models if k[2] == persona]:
+                    self._bound.discard(id(self._models.pop(cache_key)))
+
+    def snapshot(self):
+        """Returns a list of per-key health dicts (for logging/UI)."""
+        with self._lock:
+            return [state.snapshot() for state in self.keys]
@@ -0,0 +1,134 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+class KnowledgeStore:
+    """
+    Append-only storage for learned knowledge.
+
+    Each learn event is appended as one JSON line to a journal next to the
+    snapshot file (knowledge.json). Once the journal grows past compact_every
+    entries it is folded into a new snapshot, written to a temp file and
+    atomically renamed into place. Replaying the journal is idempotent, so a
+    crash between the rename and the journal truncation loses nothing.
+    """
+
+    def __init__(self, snapshot_file, compact_every=500):
+        self.logger = logging.getLogger("ChatBot")
+        self.snapshot_file = snapshot_file
+        self.journal_file = snapshot_file + ".log"
+        self.lock_file = snapshot_file + ".lock"
+        self.compact_every = compact_every
+
+        self._lock = threading.RLock()
+        self._pending = 0  # journal entries since the last compaction
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serializes writers across threads and (where supported) processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def exists(self):
+        """Returns True if there is any stored knowledge on disk."""
+        return os.path.exists(self.snapshot_file) or os.path.exists(self.journal_file)
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_file):
+            return {}
+        with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _replay(self, responses):
+        """Applies journal entries to responses. Returns the number of entries."""
+        if not os.path.exists(self.journal_file):
+            return 0
+
+        count = 0
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write is expected; skip it
+                    self.logger.warning("Skipping corrupt journal line %d in %s", line_no, self.journal_file)
+                    continue
+                apply_learn(responses, event["q"], event["a"])
+                count += 1
+        return count
+
+    def load(self):
+        """Loads the snapshot and replays the journal tail on top of it."""
+        responses = self._read_snapshot()
+        self._pending = self._replay(responses)
+        if self._pending:
+            self.logger.info("Replayed %d journal entries from %s", self._pending, self.journal_file)
+        return responses
+
+    def append(self, question, answer):
+        """Durably records one learn event, compacting when the journal is large."""
+        line = (json.dumps({"q": question, "a": answer}, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._locked():
+            with open(self.journal_file, 'ab+') as f:
+                # After a crash mid-write the last line is torn: end it first,
+                # or this entry would be skipped on replay along with it
+                end = f.seek(0, os.SEEK_END)
+                if end:
+                    f.seek(end - 1)
+                    if f.read(1) != b"\n":
+                        line = b"\n" + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending += 1
+        if self._pending >= self.compact_every:
+            self.compact()
+
+    def compact(self, responses=None):
+        """
+        Folds the journal into a fresh snapshot.
+        Entries in responses (e.g. built-in defaults) are merged in as well.
+        """
+        with self._locked():
+            # Re-read from disk: other processes may have appended meanwhile
+            merged = self._read_snapshot()
+            self._replay(merged)
+            for question, answers in (responses or {}).items():
+                for answer in answers:
+                    apply_learn(merged, question, answer)
+
+            tmp_file = self.snapshot_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(merged, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+
+            # Safe even if we crash before this point: replay is idempotent
+            open(self.journal_file, 'w').close()
+            self._pending = 0
+            self.logger.info("Compacted knowledge into %s", self.snapshot_file)
+            return merged
+
+
+def apply_learn(responses, question, answer):
+    """Adds answer to responses[question] unless it is already there."""
+    answers = responses.setdefault(question, [])
+    if answer not in answers:
+        answers.append(answer)
@@ -0,0 +1,181 @@
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+from metrics import current_trace
+
+# LogRecord attributes that aren't extra=... fields
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+_TRACEBACKS = logging.Formatter()
+
+
+class RequestIdFilter(logging.Filter):
+    """Tags records with the id of the request being handled (see metrics.Trace), or None."""
+
+    def filter(self, record):
+        record.request_id = current_trace().request_id
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts (UTC, ms), level, logger, thread, msg,
+    request_id when inside a traced request, exc for tracebacks, plus any
+    extra=... fields passed to the log call.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._second = None
+        self._stamp = ""
+
+    def format(self, record):
+        second = int(record.created)
+        if second != self._second:  # strftime once per second, not per record
+            self._second, self._stamp = second, time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        entry = {
+            "ts": f"{self._stamp}.{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        for key in record.__dict__.keys() - _STANDARD_ATTRS:
+            entry[key] = record.__dict__[key]
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller: when the queue is full the
+    record is dropped and counted, rather than stalling a request behind
+    a slow disk.
+    """
+
+    def __init__(self, log_queue, max_size):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only resolve what can't wait (the args may change after the call);
+        # the formatting happens on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACKS.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+        else:
+            self.queue.put(record)
+
+
+class LogPipeline:
+    """
+    Asynchronous logging: the logger's only handler puts records on a
+    bounded queue, and a writer thread drains it every flush_interval
+    seconds into the real handlers (a rotating log file and the console).
+
+    Draining in batches, rather than waking the writer for every record
+    as logging.handlers.QueueListener does, keeps it from competing with
+    request threads for the GIL.
+    """
+
+    def __init__(self, logger, handlers, queue_size=10_000, flush_interval=0.05):
+        self.logger = logger
+        self.handlers = handlers
+        self.flush_interval = flush_interval
+        self.queue_handler = DroppingQueueHandler(queue.SimpleQueue(), queue_size)
+        self.queue_handler.addFilter(RequestIdFilter())
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        self.logger.addHandler(self.queue_handler)
+
+    def stop(self):
+        """Writes out what's queued and closes the handlers."""
+        self.logger.removeHandler(self.queue_handler)
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        for handler in self.handlers:
+            handler.close()
+
+    @property
+    def dropped(self):
+        return self.queue_handler.dropped
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        log_queue = self.queue_handler.queue
+        while True:
+            try:
+                record = log_queue.get_nowait()
+            except queue.Empty:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        for handler in self.handlers:
+            handler.flush()
+
+
+class SizeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler for the writer thread: keeps count of the bytes
+    written instead of checking the file before every record, and doesn't
+    flush per record (LogPipeline flushes once per batch).
+    """
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self._size = None
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+                self._size = self.stream.seek(0, 2)
+            size = len(line.encode("utf-8"))
+            if self.maxBytes and self._size and self._size + size > self.maxBytes:
+                self.doRollover()
+                self.stream = self._open()
+                self._size = 0
+            self.stream.write(line)
+            self._size += size
+        except Exception:
+            self.handleError(record)
+
+
+def rotating_file_handler(log_file, max_bytes=10 * 1024 * 1024, backup_count=5, when=None):
+    """
+    Size-based rotation (max_bytes per file), or time-based when `when` is
+    given (e.g. "midnight", "H"); keeps backup_count old files either way.
+    """
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(log_file, when=when, backupCount=backup_count,
+                                                         encoding="utf-8", delay=True)
+    return SizeRotatingFileHandler(log_file, max_bytes, backup_count)
@@ -9,9 +9,9 @@ def main():
 
     # 2. Initialize ChatBot
     try:
-        bot = ChatBot()
+        bot = ChatBot(metrics=True) # traces give log records their request ids
     except Exception as e:
-        logger.critical(f"Failed to initialize ChatBot: {e}", exc_info=True)
+        logger.critical("Failed to initialize ChatBot: %s", e, exc_info=True)
         print("Critical Error: Could not start ChatBot. Check logs for details.")
         sys.exit(1)
 
@@ -50,7 +50,7 @@ def main():
             logger.warning("Application interrupted by user (KeyboardInterrupt).")
             break
         except Exception as e:
-            logger.error(f"Unexpected error in main loop: {e}", exc_info=True)
+            logger.error("Unexpected error in main loop: %s", e, exc_info=True)
             print("Bot: An unexpected error occurred. Please try again.")
 
     logger.info("Application finished.")
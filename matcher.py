@@ -0,0 +1,221 @@
+import math
+import random
+import re
+import unicodedata
+from array import array
+from collections import Counter
+
+# Zero-width characters show up a lot in copy-pasted Thai text
+_ZERO_WIDTH = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"), None)
+
+# Anything that is not a word character, whitespace or part of the Thai block.
+# Thai vowel/tone marks are combining characters (not \w), so the whole block is
+# kept explicitly and only Thai punctuation (๏ ๚ ๛) is stripped.
+_PUNCT_RE = re.compile(r"[^\w\s\u0E00-\u0E7F]|[_\u0E4F\u0E5A\u0E5B]")
+_REPEAT_RE = re.compile(r"(.)\1{2,}")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Normalizes text for matching: unicode form, casing, punctuation, whitespace."""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text).translate(_ZERO_WIDTH)
+    text = _PUNCT_RE.sub(" ", text.casefold())
+    text = _REPEAT_RE.sub(r"\1\1", text)  # "hellooooo" -> "helloo", "55555" -> "55"
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def within_edits(a, b, max_edits):
+    """
+    True if a and b are at most max_edits apart, counting insertions,
+    deletions, substitutions and swaps of adjacent characters ("yuo").
+    """
+    if abs(len(a) - len(b)) > max_edits:
+        return False
+    if a == b:
+        return True
+    before, previous = None, list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            if before and i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == other:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > max_edits:
+            return False
+        before, previous = previous, current
+    return previous[-1] <= max_edits
+
+
+def words_agree(query, key):
+    """
+    True if every word of the (normalized) query is a word of key, or a typo
+    of one: one edit for words of up to 4 characters, two up to 8, and a
+    quarter of the length beyond that (Thai runs whole phrases together).
+    Two key words run together ("howare") count as a word as well. Unlike
+    n-gram overlap this tells "how old are you" from "how are you" and
+    "price of ethereum" from "price of bitcoin".
+    """
+    key_words = key.split()
+    key_words += [a + b for a, b in zip(key_words, key_words[1:])]
+    for word in set(query.split()).difference(key_words):
+        max_edits = 1 if len(word) <= 4 else 2 if len(word) <= 8 else len(word) // 4
+        if not any(within_edits(word, key_word, max_edits) for key_word in key_words):
+            return False
+    return True
+
+
+class KnowledgeIndex:
+    """
+    Character n-gram inverted index over learned questions.
+
+    Exact (normalized) hits are a dict lookup. Fuzzy hits are scored by n-gram
+    Jaccard similarity and found through prefix filtering: n-grams are put in a
+    fixed global order (rarest first), and two strings with similarity >=
+    threshold must share an n-gram within both of their prefixes, so only prefix
+    n-grams are indexed. Whole words are indexed too; they are far more
+    selective than n-grams and independent of each other, which keeps lookups
+    sub-millisecond on knowledge bases with millions of questions. Posting
+    lists are scanned rarest first within a budget, and the best candidates are
+    verified exactly: by Jaccard similarity, and word by word (see words_agree),
+    since questions that differ in one short word share most of their n-grams.
+    """
+
+    def __init__(self, keys=(), threshold=0.5, ngram=3, max_candidates=16,
+                 max_postings=2048, sample_size=20000):
+        self.threshold = threshold
+        self.ngram = ngram
+        self.max_candidates = max_candidates
+        self.max_postings = max_postings
+
+        self._ids = {}       # normalized text -> entry id
+        self._entries = []   # entry id -> normalized text
+        self._keys = []      # entry id -> original knowledge key
+        self._sizes = array('I')  # entry id -> number of n-grams
+        self._postings = {}  # prefix n-gram or "#word" -> array of entry ids
+
+        # The n-gram order must never change once entries are indexed, so ranks
+        # are estimated once from a sample of the initial keys (frequent n-grams
+        # get high ranks). N-grams first seen later get decreasing negative
+        # ranks, i.e. they count as the rarest, which suits newly learned text.
+        keys = list(keys)
+        sample = keys if len(keys) <= sample_size else random.Random(0).sample(keys, sample_size)
+        df = {}
+        for key in sample:
+            for gram in self._grams(normalize_text(key)):
+                df[gram] = df.get(gram, 0) + 1
+        self._rank = {gram: i for i, gram in enumerate(sorted(df, key=lambda g: (df[g], g)))}
+        self._next_rank = -1
+
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _grams(self, normalized):
+        """Returns the set of character n-grams for a normalized string."""
+        padded = f" {normalized} "
+        n = self.ngram
+        if len(padded) <= n:
+            return {padded}
+        return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+    def _prefix(self, grams):
+        """Returns the rarest n-grams that any match above the threshold must share."""
+        ordered = sorted(grams, key=self._rank.get)
+        return ordered[:len(ordered) - math.ceil(self.threshold * len(ordered)) + 1]
+
+    def add(self, key):
+        """Indexes a knowledge key. Keys that normalize identically share an entry."""
+        normalized = normalize_text(key)
+        if not normalized or normalized in self._ids:
+            return
+
+        entry_id = len(self._entries)
+        grams = self._grams(normalized)
+        self._ids[normalized] = entry_id
+        self._entries.append(normalized)
+        self._keys.append(key)
+        self._sizes.append(len(grams))
+
+        rank = self._rank
+        for gram in grams.difference(rank):
+            rank[gram] = self._next_rank
+            self._next_rank -= 1
+
+        postings = self._postings
+        features = self._prefix(grams)
+        features.extend({"#" + word for word in normalized.split()})
+        for feature in features:
+            ids = postings.get(feature)
+            if ids is None:
+                postings[feature] = array('I', (entry_id,))
+            else:
+                ids.append(entry_id)
+
+    def lookup(self, text):
+        """
+        Finds the best matching knowledge key for text.
+        Returns (key, score) or None if nothing reaches the threshold.
+        """
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+
+        # 1. Exact hit after normalization
+        entry_id = self._ids.get(normalized)
+        if entry_id is not None:
+            return self._keys[entry_id], 1.0
+
+        # 2. Fuzzy hit via the index. N-grams that were never indexed cannot be
+        # shared with any entry, so they are dropped before taking the prefix.
+        query = self._grams(normalized)
+        postings = self._postings
+        words = {"#" + word for word in normalized.split()}
+        grams = self._prefix({gram for gram in query if gram in self._rank})
+
+        # Words first, then n-grams, each rarest first
+        probes = sorted((postings[w] for w in words if w in postings), key=len)
+        probes += sorted((postings[g] for g in grams if g in postings), key=len)
+
+        counts = Counter()
+        budget = self.max_postings
+        for ids in probes:
+            if len(ids) > budget:
+                continue  # too common to be worth scanning
+            budget -= len(ids)
+            counts.update(ids)
+        if not counts:
+            return None
+
+        # Size filter: |candidate| must lie in [t*|q|, |q|/t]
+        min_size = self.threshold * len(query)
+        max_size = len(query) / self.threshold
+        sizes = self._sizes
+
+        # Keep candidates hit by at least half as many probes as the best one
+        cutoff = max(counts.values()) // 2
+        candidates = [cid for cid, hits in counts.items()
+                      if hits > cutoff and min_size <= sizes[cid] <= max_size]
+        if len(candidates) > self.max_candidates:
+            # Most probe hits first; among ties prefer entries of similar size
+            size = len(query)
+            candidates = sorted(candidates, key=lambda cid: (-counts[cid], abs(sizes[cid] - size)))
+            candidates = candidates[:self.max_candidates]
+
+        best_id, best_score = None, 0.0
+        for cid in candidates:
+            # Jaccard can never exceed the size ratio, so skip hopeless candidates
+            if min(sizes[cid], len(query)) <= best_score * max(sizes[cid], len(query)):
+                continue
+            grams = self._grams(self._entries[cid])
+            shared = len(query & grams)
+            score = shared / (len(query) + len(grams) - shared)
+            if score > best_score and score >= self.threshold and words_agree(normalized, self._entries[cid]):
+                best_id, best_score = cid, score
+
+        if best_id is None or best_score < self.threshold:
+            return None
+        return self._keys[best_id], best_score
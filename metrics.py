@@ -0,0 +1,291 @@
+import bisect
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+# Bucket upper bounds
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CHARS_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8)
+
+# name -> (type, help, buckets)
+DEFINITIONS = {
+    "chatbot_requests_total": ("counter", "Requests handled, by entry point and answer source.", None),
+    "chatbot_request_seconds": ("histogram", "End-to-end request latency.", SECONDS_BUCKETS),
+    "chatbot_stage_seconds": ("histogram", "Latency of each request stage.", SECONDS_BUCKETS),
+    "chatbot_key_success_total": ("counter", "Successful Gemini calls per API key.", None),
+    "chatbot_key_failures_total": ("counter", "Failed Gemini calls per API key.", None),
+    "chatbot_key_rate_limited_total": ("counter", "Gemini calls rejected with 429 per API key.", None),
+    "chatbot_coalescing_total": ("counter", "Coalescable requests, by role (leader went upstream, follower "
+                                            "shared, timeout gave up waiting).", None),
+    "chatbot_failed_keys_per_request": ("histogram", "Keys that failed before a request succeeded.", COUNT_BUCKETS),
+    "chatbot_prompt_chars": ("histogram", "Prompt size in characters.", CHARS_BUCKETS),
+    "chatbot_response_chars": ("histogram", "Response size in characters.", CHARS_BUCKETS),
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q (coarse, like histogram_quantile)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Trace:
+    """Spans and attributes of one request."""
+
+    __slots__ = ("request_id", "kind", "started", "spans", "attrs")
+
+    def __init__(self, request_id, kind):
+        self.request_id = request_id
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.spans = []  # (stage, seconds)
+        self.attrs = {}
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def incr(self, attr, value=1):
+        self.attrs[attr] = self.attrs.get(attr, 0) + value
+
+    def as_dict(self):
+        return {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": [(stage, round(seconds * 1000, 2)) for stage, seconds in self.spans],
+            **self.attrs,
+        }
+
+
+class _NullTrace:
+    """Stands in for a Trace when tracing is disabled (all no-ops)."""
+
+    __slots__ = ()
+    request_id = None
+
+    def set(self, **attrs):
+        pass
+
+    def incr(self, attr, value=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TRACE = _NullTrace()
+_current = contextvars.ContextVar("chatbot_trace", default=NULL_TRACE)
+
+
+def current_trace():
+    """Returns the trace of the request being handled (NULL_TRACE outside one)."""
+    return _current.get()
+
+
+class _Span:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        trace = _current.get()
+        if trace is not NULL_TRACE:
+            trace.spans.append((self.stage, seconds))
+        self.metrics.observe("chatbot_stage_seconds", seconds, stage=self.stage)
+        return False
+
+
+class _TraceScope:
+    __slots__ = ("metrics", "trace", "token")
+
+    def __init__(self, metrics, trace):
+        self.metrics = metrics
+        self.trace = trace
+
+    def __enter__(self):
+        self.token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            # Closed from another context (e.g. an abandoned stream generator)
+            _current.set(NULL_TRACE)
+        if exc_type is not None:
+            self.trace.set(error=exc_type.__name__)
+        self.metrics.finish(self.trace)
+        return False
+
+
+class Metrics:
+    """
+    In-process request tracing and metrics for ChatBot.
+
+    Each request gets a Trace with timed spans (knowledge lookup, attachment
+    preparation, each Gemini attempt, ...) and attributes (key used, keys
+    that failed first, prompt/response sizes). Finished traces feed
+    histograms and counters that can be exported in the Prometheus text
+    format. When disabled, span() and trace() return shared no-op objects.
+    """
+
+    def __init__(self, enabled=False, prometheus_file=None, export_interval=10.0, max_traces=50):
+        self.logger = logging.getLogger("ChatBot")
+        self.enabled = enabled
+        self.prometheus_file = prometheus_file
+        self.export_interval = export_interval
+        self.recent = deque(maxlen=max_traces)
+
+        self._series = {}  # (name, labels) -> Histogram or number
+        self._ids = itertools.count(1)
+        self._last_export = 0.0
+        self._lock = threading.Lock()
+
+    def span(self, stage):
+        """Times a block of a request: with metrics.span("knowledge_lookup"): ..."""
+        if not self.enabled:
+            return NULL_TRACE
+        return _Span(self, stage)
+
+    def trace(self, kind):
+        """Starts a request trace: with metrics.trace("get_response") as trace: ..."""
+        if not self.enabled:
+            return NULL_TRACE
+        return _TraceScope(self, Trace(f"{os.getpid()}-{next(self._ids)}", kind))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = Histogram(DEFINITIONS[name][2])
+            histogram.observe(value)
+
+    def finish(self, trace):
+        """Aggregates a finished trace into the metrics."""
+        attrs = trace.attrs
+        seconds = time.perf_counter() - trace.started
+        source = attrs.get("source", "unknown")
+        self.inc("chatbot_requests_total", kind=trace.kind, source=source)
+        self.observe("chatbot_request_seconds", seconds, kind=trace.kind)
+        if "prompt_chars" in attrs:
+            self.observe("chatbot_prompt_chars", attrs["prompt_chars"])
+        if "response_chars" in attrs:
+            self.observe("chatbot_response_chars", attrs["response_chars"])
+        if source == "gemini":
+            self.observe("chatbot_failed_keys_per_request", attrs.get("failed_keys", 0))
+        self.recent.append(trace.as_dict())
+
+        if self.prometheus_file and time.monotonic() - self._last_export >= self.export_interval:
+            self.export()
+
+    def recent_trace(self, request_id):
+        """The finished trace with request_id, if it is still among the recent ones."""
+        for trace in reversed(self.recent):
+            if trace["request_id"] == request_id:
+                return trace
+        return None
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0])
+            lines = []
+            for name in sorted({name for (name, _), _ in series}):
+                kind, help_text, buckets = DEFINITIONS[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (series_name, labels), value in series:
+                    if series_name != name:
+                        continue
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(buckets + (float("inf"),), value.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {value.sum:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=None):
+        """Writes render() to path (default prometheus_file) atomically."""
+        path = path or self.prometheus_file
+        self._last_export = time.monotonic()
+        tmp_file = path + ".tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_file, path)
+        except OSError as e:
+            self.logger.warning("Metrics export failed: %s", e)
+
+    def stage_summary(self):
+        """Per-stage count / p50 / p95 (bucket upper bounds, in ms) for the debug panel."""
+        with self._lock:
+            rows = []
+            for (name, labels), histogram in sorted(self._series.items()):
+                if name != "chatbot_stage_seconds":
+                    continue
+                rows.append({
+                    "stage": dict(labels)["stage"],
+                    "count": histogram.count,
+                    "mean_ms": round(histogram.sum / histogram.count * 1000, 2),
+                    "p50_ms": histogram.quantile(0.5) * 1000,
+                    "p95_ms": histogram.quantile(0.95) * 1000,
+                })
+            return rows
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
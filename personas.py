@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Mapping
+
+DEFAULT_PERSONA = "Jarvis AI"
+
+# Appended to every persona's prompt
+FORMATTING_RULES = """
+        IMPORTANT RULES:
+        1. USE STRICT MARKDOWN.
+        2. ALWAYS put a blank line before headers (###).
+        3. ALWAYS put a blank line before and after lists.
+        4. LANGUAGE MATCHING: If the user speaks Thai, YOU MUST REPLY IN THAI.
+        5. AWARENESS: Be highly aware of the conversation context.
+        """
+
+# Used when the persona directory is missing or has no valid files
+FALLBACK_PERSONAS = {
+    DEFAULT_PERSONA: "You are J.A.R.V.I.S, a highly advanced and intelligent AI assistant. You are polite, efficient, and sophisticated. Address the user as 'Sir' or 'Boss'. Provide concise, data-driven, and extremely helpful responses like a top-tier digital butler.",
+}
+
+
+class Persona:
+    """A persona with its system instruction compiled once."""
+
+    __slots__ = ("name", "prompt", "instruction", "key", "order")
+
+    def __init__(self, name, prompt, order=0):
+        self.name = name
+        self.prompt = prompt
+        self.instruction = prompt + FORMATTING_RULES
+        # Changes whenever the instruction does: cached models and replies
+        # are keyed on it, so an edited persona never serves stale ones
+        self.key = f"{name}@{hashlib.sha256(self.instruction.encode('utf-8')).hexdigest()[:12]}"
+        self.order = order
+
+
+class PersonaRegistry(Mapping):
+    """
+    Read-only mapping of persona name -> Persona, loaded from a directory
+    with one JSON file per persona:
+
+        {"name": "Jarvis AI", "prompt": "You are J.A.R.V.I.S, ...", "order": 1}
+
+    Lookups check the directory for added, changed or removed files (one
+    scandir, at most every check_interval seconds) and reload it in place,
+    so personas can be edited without restarting the process. A file that
+    fails to parse keeps its previous version. on_change(persona_key) is
+    called for every persona version that a reload replaced or removed.
+    """
+
+    def __init__(self, directory, check_interval=2.0, on_change=None):
+        self.logger = logging.getLogger("ChatBot")
+        self.directory = directory
+        self.check_interval = check_interval
+        self.on_change = on_change
+
+        self._personas = {}    # name -> Persona, replaced as a whole on reload
+        self._by_file = {}     # file name -> Persona, to keep a good version if an edit breaks a file
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def __getitem__(self, name):
+        self._maybe_reload()
+        return self._personas[name]
+
+    def __iter__(self):
+        self._maybe_reload()
+        return iter(list(self._personas))
+
+    def __len__(self):
+        return len(self._personas)
+
+    def __contains__(self, name):
+        self._maybe_reload()
+        return name in self._personas
+
+    def resolve(self, name):
+        """The persona called name, or the default one if it doesn't exist (any more)."""
+        self._maybe_reload()
+        personas = self._personas
+        persona = personas.get(name) or personas.get(DEFAULT_PERSONA)
+        return persona or next(iter(personas.values()))
+
+    def _scan(self):
+        """(file name, mtime, size) of each persona file; cheap enough to run per check."""
+        try:
+            with os.scandir(self.directory) as entries:
+                return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                                    for entry in entries if entry.name.endswith(".json") and entry.is_file()))
+        except FileNotFoundError:
+            return ()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return  # not due, or another thread is checking
+        try:
+            self._next_check = now + self.check_interval
+            if self._scan() != self._signature:
+                self._reload()
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """Re-reads the directory now."""
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        signature = self._scan()
+        by_file = {}
+        for file_name, _, _ in signature:
+            path = os.path.join(self.directory, file_name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                by_file[file_name] = Persona(str(data["name"]), str(data["prompt"]), data.get("order", 0))
+            except Exception as e:
+                self.logger.error("Error loading persona file %s: %s", path, e)
+                if file_name in self._by_file:
+                    by_file[file_name] = self._by_file[file_name]
+
+        personas = sorted(by_file.values(), key=lambda persona: (persona.order, persona.name))
+        if not personas:
+            personas = [Persona(name, prompt) for name, prompt in FALLBACK_PERSONAS.items()]
+        old = self._personas
+        self._personas = {persona.name: persona for persona in personas}
+        self._by_file = by_file
+        self._signature = signature
+
+        stale = {persona.key for persona in old.values()} - {persona.key for persona in personas}
+        if old:
+            self.logger.info("Reloaded personas from %s (%d changed or removed).", self.directory, len(stale))
+        if self.on_change:
+            for persona_key in stale:
+                self.on_change(persona_key)
@@ -1,13 +1,8 @@
-import re
+from formatter import fix_run_on, markdown_to_html
 
 def format_response(text):
-    # Current logic in app.py
-    response = text
-    # 1. Ensure headers have double newlines
-    response = re.sub(r'(?<!\n)\n?###', '\n\n###', response)
-    # 2. Ensure lists have double newlines
-    response = re.sub(r'(?<!\n)\n?(\* |- |\d+\. )', '\n\n\\1', response)
-    return response
+    # Same fix the app now applies before rendering (formatter.fix_run_on)
+    return fix_run_on(text)
 
 def test_repro():
     # Text approximated from user screenshot
@@ -21,6 +16,9 @@ def test_repro():
     print("\n--- OUTPUT ---")
     print(formatted)
     
+    print("\n--- HTML ---")
+    print(markdown_to_html(problem_text))
+    
     print("\n--- EXPECTED ---")
     print("...มนุษย์\n\n### รายการ...\n\n1. อย่า...\n\n2. อย่า...\n\n3. อย่า...")
 
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils import lazy_import
+
+# Only the disk tier (disk_path) needs it
+sqlite3 = lazy_import("sqlite3")
+
+# Questions whose answer comes from the "Current Date/Time" note in the message
+_CLOCK_RE = re.compile(r"\b(?:time|clock|now|hours?|minutes?|o'clock)\b|เวลา|กี่โมง|ตอนนี้")
+_DATE_RE = re.compile(r"\b(?:today|tonight|tomorrow|yesterday|date|day|weekend|week|month|year)\b"
+                      r"|วันนี้|คืนนี้|พรุ่งนี้|เมื่อวาน|วันที่|สัปดาห์นี้|เดือนนี้|ปีนี้")
+
+
+def normalize_prompt(prompt):
+    """
+    Lossless normalization for cache keys: casefold, collapse whitespace and
+    drop trailing ?!. only. Unlike matcher.normalize_text it keeps digits,
+    operators and repeated characters, so "100 usd" and "1000 usd" (or
+    "2+2" and "2*2") never share a reply.
+    """
+    return " ".join((prompt or "").casefold().split()).rstrip("?!.").rstrip()
+
+
+def time_bucket(prompt):
+    """
+    What a cached reply to prompt must be tied to: "" when the reply doesn't
+    depend on the current date or time, today's date for questions about
+    the day ("what's on today"), and None for questions about the time of
+    day, which must not be cached at all.
+    """
+    text = (prompt or "").casefold()
+    if _CLOCK_RE.search(text):
+        return None
+    if _DATE_RE.search(text):
+        return time.strftime("%Y-%m-%d")
+    return ""
+
+
+class ResponseCache:
+    """
+    Cache of Gemini replies in front of call_gemini.
+
+    Entries live in a bounded in-memory LRU with a TTL. With disk_path set,
+    replies are also written to a small SQLite table so they survive restarts;
+    disk hits are promoted back into memory.
+    """
+
+    def __init__(self, max_entries=1024, ttl=900, disk_path=None):
+        self.logger = logging.getLogger("ChatBot")
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()  # key -> (expires_at, text)
+        self._lock = threading.Lock()
+        self._db = None
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, text TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+            except sqlite3.Error as e:
+                self.logger.error("Response cache disk tier disabled: %s", e)
+                self._db = None
+
+    @staticmethod
+    def make_key(persona, prompt, history_window=(), attachment_digest=None, time_bucket=""):
+        """Builds a cache key from everything that shapes the reply."""
+        payload = json.dumps(
+            [persona, normalize_prompt(prompt), list(history_window), attachment_digest, time_bucket],
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached reply for key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, text = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return text
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT text, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        """Caches a reply."""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, text, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses (key, text, expires_at) VALUES (?, ?, ?)",
+                        (key, text, expires_at),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self.logger.warning("Response cache write failed: %s", e)
+
+    def _store(self, key, text, expires_at):
+        self._entries[key] = (expires_at, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        """Returns hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
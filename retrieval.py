@@ -0,0 +1,181 @@
+import logging
+import math
+import threading
+import time
+import zlib
+from array import array
+
+from matcher import normalize_text
+from utils import lazy_import
+
+np = lazy_import("numpy")
+
+
+def hashed_features(text, dim):
+    """
+    Sparse feature vector {bucket: weight} for text: words and character
+    trigrams (which also cover Thai, written without spaces), hashed into
+    dim buckets with a hash-derived sign so collisions tend to cancel out.
+    """
+    counts = {}
+    for word in normalize_text(text).split():
+        features = ["#" + word]
+        padded = f" {word} "
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            bucket = h % dim
+            counts[bucket] = counts.get(bucket, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+    # Sublinear term frequency
+    return {bucket: math.copysign(1.0 + math.log(abs(c)), c) for bucket, c in counts.items() if c}
+
+
+class KnowledgeRetriever:
+    """
+    Top-k similarity search over learned knowledge, used to ground Gemini
+    prompts in what the bot has been taught.
+
+    Each question (plus the start of its answers, at lower weight) is
+    embedded with hashed_features into a sparse L2-normalized vector, stored
+    in an inverted index: bucket -> (rows, weights) as compact arrays, about
+    8 bytes per non-zero feature. A query scores only the rows sharing one
+    of its buckets (cosine similarity, summed with numpy.bincount).
+
+    The index is built by a background thread started in __init__, so
+    neither startup nor requests wait for it: until it is ready, searches
+    return no hits. add() works at any time. A re-learned question gets a
+    new row; the old one is marked dead rather than removed from postings.
+    """
+
+    def __init__(self, responses, dim=1 << 18, k=3, min_score=0.25, answer_weight=0.5, max_answer_chars=300,
+                 build_batch=1000, background=True):
+        self.logger = logging.getLogger("ChatBot")
+        self.responses = responses  # shared knowledge dict (question -> answers)
+        self.dim = dim
+        self.k = k
+        self.min_score = min_score
+        self.answer_weight = answer_weight
+        self.max_answer_chars = max_answer_chars
+        self.build_batch = build_batch
+
+        self._keys = []          # row -> question, None once replaced by a newer row
+        self._rows = {}          # question -> its current row
+        self._alive = bytearray()  # row -> 1, or 0 once replaced
+        self._postings = {}      # bucket -> (array('i') rows, array('f') weights)
+        self._ready = threading.Event()
+        # Held only for short updates and single searches, never for the whole build
+        self._lock = threading.Lock()
+        if background:
+            threading.Thread(target=self._build, name="retrieval-index", daemon=True).start()
+        else:
+            self._build()
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """Blocks until the initial build is done. Returns False on timeout."""
+        return self._ready.wait(timeout)
+
+    def _vector(self, question, answers=()):
+        vector = hashed_features(question, self.dim)
+        if answers:
+            text = " ".join(str(answer) for answer in answers)[:self.max_answer_chars]
+            for bucket, weight in hashed_features(text, self.dim).items():
+                vector[bucket] = vector.get(bucket, 0.0) + self.answer_weight * weight
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {bucket: weight / norm for bucket, weight in vector.items()} if norm else {}
+
+    def _insert(self, question, vector):
+        """Adds a row for question (caller holds the lock)."""
+        old = self._rows.get(question)
+        if old is not None:
+            self._keys[old] = None
+            self._alive[old] = 0
+        row = len(self._keys)
+        self._keys.append(question)
+        self._alive.append(1)
+        self._rows[question] = row
+        postings = self._postings
+        for bucket, weight in vector.items():
+            posting = postings.get(bucket)
+            if posting is None:
+                posting = postings[bucket] = (array('i'), array('f'))
+            posting[0].append(row)
+            posting[1].append(weight)
+
+    def _build(self):
+        start = time.perf_counter()
+        questions = list(self.responses)
+        for i in range(0, len(questions), self.build_batch):
+            # Embed outside the lock; learn() and searches only wait for the inserts
+            batch = [(question, self._vector(question, self.responses.get(question, ())))
+                     for question in questions[i:i + self.build_batch]]
+            with self._lock:
+                for question, vector in batch:
+                    if question not in self._rows:  # add() may have indexed a newer version
+                        self._insert(question, vector)
+        self._ready.set()
+        self.logger.info("Built retrieval index over %d knowledge entries in %.2fs.", len(self._rows),
+                         time.perf_counter() - start)
+
+    def add(self, question):
+        """Adds or refreshes the row for a (newly learned) question."""
+        vector = self._vector(question, self.responses.get(question, ()))
+        with self._lock:
+            self._insert(question, vector)
+
+    def search(self, queries, k=None):
+        """
+        Batched top-k cosine search. Returns, for each query, a list of
+        (question, score) with score >= min_score, best first (no hits while
+        the index is still being built).
+        """
+        k = k or self.k
+        if not self._ready.is_set():
+            return [[] for _ in queries]
+        vectors = [self._vector(query) for query in queries]
+        results = []
+        with self._lock:
+            n = len(self._keys)
+            for vector in vectors:
+                postings = [(self._postings[bucket], weight) for bucket, weight in vector.items()
+                            if bucket in self._postings]
+                if not postings:
+                    results.append([])
+                    continue
+                # Views of the arrays must not outlive the lock (they grow under it)
+                rows = np.concatenate([np.frombuffer(posting[0], dtype=np.int32) for posting, _ in postings])
+                weights = np.concatenate([np.frombuffer(posting[1], dtype=np.float32) * weight
+                                          for posting, weight in postings])
+                scores = np.bincount(rows, weights=weights, minlength=n)
+                if len(self._rows) < n:
+                    scores[np.frombuffer(self._alive, dtype=np.uint8) == 0] = 0.0
+                top_k = min(k, n)
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+                ranked = sorted(top, key=lambda j: -scores[j])
+                results.append([(self._keys[j], float(scores[j])) for j in ranked
+                                if scores[j] >= self.min_score])
+        return results
+
+    def context(self, query):
+        """Compact prompt snippet with the best-matching knowledge, or ""."""
+        hits = self.search([query])[0]
+        if not hits:
+            return ""
+        lines = []
+        for question, score in hits:
+            answers = self.responses.get(question)
+            if not answers:
+                continue
+            answer = " ".join(str(answers[-1]).split())  # latest taught answer
+            if len(answer) > self.max_answer_chars:
+                answer = answer[:self.max_answer_chars - 3].rstrip() + "..."
+            lines.append(f"- Q: {question} -> A: {answer}")
+        if not lines:
+            return ""
+        return "\n\n(RELEVANT KNOWLEDGE I was taught; use it if it helps:\n" + "\n".join(lines) + ")"
@@ -0,0 +1,239 @@
+import bisect
+import itertools
+import logging
+import re
+import threading
+import time
+
+# Request priorities (lower is served first)
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Token estimates for budgeting: Gemini bills an image as a fixed number of
+# tokens, and the reply is unknown until it arrives
+IMAGE_TOKENS = 258
+REPLY_TOKENS = 512
+
+_RETRY_PATTERNS = (
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),  # google.rpc.RetryInfo in the error details
+    re.compile(r"retry in\s*([\d.]+)\s*s", re.IGNORECASE),  # "Please retry in 37.2s."
+    re.compile(r"retry-after:?\s*([\d.]+)", re.IGNORECASE),
+)
+
+
+class SchedulerBusy(Exception):
+    """Raised when the request queue is full (backpressure)."""
+
+
+def rate_limit_delay(error, default=30.0):
+    """
+    Returns the seconds to back off if error is a 429 / quota error
+    (using the server's retry delay when it sent one), else None.
+    """
+    text = str(error)
+    if not (getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted"
+            or "429" in text or "quota" in text.lower()):
+        return None
+    for pattern in _RETRY_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return default
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = capacity
+        self.rate = capacity / period  # refill per second
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount is available (requests bigger than the bucket wait for a full one)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+class KeyBudget:
+    """Request and token budget of one API key, plus its 429 cooldown."""
+
+    def __init__(self, index, rpm=None, tpm=None, period=60.0):
+        self.index = index
+        self.requests = TokenBucket(rpm, period) if rpm else None
+        self.tokens = TokenBucket(tpm, period) if tpm else None
+        self.cooldown_until = 0.0
+        self.granted = 0
+        self.rate_limited = 0
+
+    def wait_time(self, tokens, now):
+        wait = self.cooldown_until - now
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return max(0.0, wait)
+
+    def take(self, tokens, now):
+        if self.requests:
+            self.requests.take(1, now)
+        if self.tokens:
+            self.tokens.take(tokens, now)
+        self.granted += 1
+
+    def snapshot(self, now):
+        return {
+            "key": f"#{self.index + 1}",
+            "requests_left": int(self.requests.level) if self.requests else None,
+            "tokens_left": int(self.tokens.level) if self.tokens else None,
+            "cooldown_for": max(0.0, round(self.cooldown_until - now, 1)),
+            "granted": self.granted,
+            "rate_limited": self.rate_limited,
+        }
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "exclude", "index", "wait", "event")
+
+    def __init__(self, priority, tokens, exclude):
+        self.priority = priority
+        self.tokens = tokens
+        self.exclude = exclude
+        self.index = None  # key granted by _dispatch
+        self.wait = None   # shortest wait for any usable key, as of the last _dispatch
+        self.event = threading.Event()
+
+
+class RequestScheduler:
+    """
+    Quota-aware admission of Gemini requests across API keys.
+
+    Each key has a token bucket for requests per minute and one for
+    (estimated) tokens per minute; a key that answers 429 is cooled down
+    for the retry delay the server asked for. Requests wait in a bounded
+    priority queue (interactive before batch) until a key has budget, and
+    are granted keys in KeyPool.candidates() order, so healthy keys are
+    still preferred. A full queue raises SchedulerBusy instead of piling
+    up more work; a request that cannot get a key within max_wait seconds
+    gives up (acquire returns None).
+    """
+
+    def __init__(self, key_pool, rpm=None, tpm=None, max_queue=64, max_wait=20.0,
+                 default_cooldown=30.0, period=60.0):
+        self.logger = logging.getLogger("ChatBot")
+        self.key_pool = key_pool
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.default_cooldown = default_cooldown
+        self.budgets = {state.index: KeyBudget(state.index, rpm, tpm, period) for state in key_pool.keys}
+
+        self._queue = []  # sorted (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0, priority=INTERACTIVE, exclude=(), timeout=None):
+        """
+        Blocks until a key (not in exclude) has budget for a request of
+        about tokens tokens and returns its index; None if no key can serve
+        it within timeout (default max_wait).
+        """
+        if not any(index not in exclude for index in self.budgets):
+            return None
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        waiter = _Waiter(priority, tokens, exclude)
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                raise SchedulerBusy(f"{len(self._queue)} requests already queued")
+            bisect.insort(self._queue, (priority, next(self._seq), waiter))
+            self._dispatch()
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if waiter.index is None and waiter.wait is not None and waiter.wait <= remaining:
+                waiter.event.wait(max(waiter.wait, 0.001))
+            with self._lock:
+                if waiter.index is not None:
+                    return waiter.index
+                self._dispatch()
+                if waiter.index is not None:
+                    return waiter.index
+                remaining = deadline - time.monotonic()
+                if waiter.wait is None or waiter.wait > remaining:
+                    # No key will have budget in time; don't hold the caller
+                    self._queue = [item for item in self._queue if item[2] is not waiter]
+                    return None
+
+    def try_acquire(self, tokens=0, exclude=()):
+        """Returns a key index with budget right now, or None (never queues)."""
+        with self._lock:
+            if self._queue:
+                return None  # don't jump the queue
+            now = time.monotonic()
+            for state in self.key_pool.candidates():
+                budget = self.budgets[state.index]
+                if state.index not in exclude and budget.wait_time(tokens, now) == 0:
+                    budget.take(tokens, now)
+                    return state.index
+            return None
+
+    def _dispatch(self):
+        """Grants keys to queued requests in priority order (caller holds the lock)."""
+        if not self._queue:
+            return
+        now = time.monotonic()
+        order = [state.index for state in self.key_pool.candidates()]
+        still_waiting = []
+        for item in self._queue:
+            waiter = item[2]
+            waiter.wait = None
+            for index in order:
+                if index in waiter.exclude:
+                    continue
+                budget = self.budgets[index]
+                wait = budget.wait_time(waiter.tokens, now)
+                if wait == 0:
+                    budget.take(waiter.tokens, now)
+                    waiter.index = index
+                    waiter.event.set()
+                    break
+                waiter.wait = wait if waiter.wait is None else min(waiter.wait, wait)
+            if waiter.index is None:
+                still_waiting.append(item)
+        self._queue = still_waiting
+
+    def rate_limited(self, index, delay=None):
+        """Cools the key at index down after a 429 (for delay seconds, or default_cooldown)."""
+        delay = self.default_cooldown if delay is None else delay
+        with self._lock:
+            budget = self.budgets[index]
+            budget.cooldown_until = max(budget.cooldown_until, time.monotonic() + delay)
+            budget.rate_limited += 1
+            # Queued requests re-plan around the cooled-down key
+            self._dispatch()
+        self.logger.warning("API Key #%d rate limited; cooling down for %.0fs.", index + 1, delay)
+
+    def snapshot(self):
+        """Queue depth and per-key budgets (for logging/UI)."""
+        with self._lock:
+            now = time.monotonic()
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, _ in self._queue:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                queued[name] = queued.get(name, 0) + 1
+            keys = []
+            for budget in self.budgets.values():
+                # Bring the levels up to date before reporting them
+                budget.wait_time(0, now)
+                keys.append(budget.snapshot(now))
+            return {"queue_depth": len(self._queue), "queued": queued, "keys": keys}
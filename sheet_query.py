@@ -0,0 +1,431 @@
+import logging
+import operator
+import re
+import time
+
+from attachments import ColumnStats, _DigestCache, _fmt
+from utils import content_digest, lazy_import
+
+pd = lazy_import("pandas")
+
+MAX_TABLE_ROWS = 50
+
+# Phrase -> aggregate; English phrases match whole words, Thai ones anywhere
+AGGREGATE_WORDS = {
+    "sum": "sum", "total": "sum", "รวม": "sum",
+    "average": "mean", "mean": "mean", "avg": "mean", "เฉลี่ย": "mean",
+    "max": "max", "maximum": "max", "highest": "max", "largest": "max", "สูงสุด": "max", "มากที่สุด": "max",
+    "min": "min", "minimum": "min", "lowest": "min", "smallest": "min", "ต่ำสุด": "min", "น้อยที่สุด": "min",
+    "count": "count", "how many": "count", "number of": "count", "จำนวน": "count", "กี่": "count",
+    "distinct": "distinct", "unique": "distinct", "ไม่ซ้ำ": "distinct",
+}
+DESCRIBE_WORDS = ("describe", "summary", "summarize", "summarise", "statistics", "stats", "overview",
+                  "สรุป", "สถิติ", "ภาพรวม")
+GROUP_PATTERN = re.compile(r"(?<![a-z0-9])(?:for each|group by|grouped by|by|per|each|ตาม|แต่ละ)\s*$")
+TOP_PATTERN = re.compile(r"(?<![a-z0-9])(top|highest|largest|best|bottom|lowest|smallest|worst)\s+(\d+)(?![0-9])"
+                         r"|(\d+)\s*อันดับ(แรก|สุดท้าย)?")
+BOTTOM_WORDS = ("bottom", "lowest", "smallest", "worst", "สุดท้าย")
+
+OPERATORS = {
+    ">=": ">=", "≥": ">=", "at least": ">=", "มากกว่าหรือเท่ากับ": ">=",
+    "<=": "<=", "≤": "<=", "at most": "<=", "น้อยกว่าหรือเท่ากับ": "<=",
+    "!=": "!=", "is not": "!=", "not equal to": "!=", "ไม่เท่ากับ": "!=",
+    ">": ">", "greater than": ">", "more than": ">", "above": ">", "over": ">", "มากกว่า": ">",
+    "<": "<", "less than": "<", "below": "<", "under": "<", "น้อยกว่า": "<",
+    "==": "=", "=": "=", "equals": "=", "equal to": "=", "is": "=", "เท่ากับ": "=", "คือ": "=",
+}
+COMPARE = {">=": operator.ge, "<=": operator.le, "!=": operator.ne, ">": operator.gt, "<": operator.lt,
+           "=": operator.eq}
+# <column> <operator> <value>, matched right after a column mention
+FILTER_PATTERN = re.compile(
+    r"\s*(" + "|".join(re.escape(op) for op in sorted(OPERATORS, key=len, reverse=True)) + r")"
+    r"(?:(?<=[a-z])\s+|(?<![a-z])\s*)"
+    r"(?:\"([^\"]*)\"|'([^']*)'|(-?\d{1,3}(?:,\d{3})+(?:\.\d+)?)|([^\s,;?]+))"
+)
+# A comparison or number left over once the filters are parsed is a condition
+# that couldn't be tied to a column; bare "is" is usually just "what is ..."
+CONDITION_PHRASES = tuple(op for op in OPERATORS if op not in ("is", "คือ"))
+NUMBER_PATTERN = re.compile(r"\d")
+# Whole-word match that also accepts a plural ("regions", "boxes")
+WORD = r"(?<![a-z0-9]){}(?:e?s)?(?![a-z0-9])"
+
+
+def _normalize(text):
+    # Position-preserving (one character in, one out) so spans stay valid
+    return str(text).casefold().replace("_", " ")
+
+
+def _number(value):
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _blank(text, start, end):
+    return text[:start] + " " * (end - start) + text[end:]
+
+
+class SheetQuery:
+    """A recognized question about a spreadsheet: what to compute, over which columns."""
+
+    __slots__ = ("kind", "aggregate", "columns", "group", "filters", "n", "ascending")
+
+    def __init__(self, kind, aggregate=None, columns=(), group=None, filters=(), n=None, ascending=False):
+        self.kind = kind            # "aggregate", "top" or "describe"
+        self.aggregate = aggregate  # sum, mean, min, max, count or distinct
+        self.columns = list(columns)
+        self.group = group
+        self.filters = list(filters)  # (column, op, value); value is a float or casefolded text
+        self.n = n
+        self.ascending = ascending
+
+    def needed_columns(self):
+        """Columns to read from the file (None: all of them)."""
+        if self.kind == "top" and self.group is None:
+            return None  # whole rows are shown
+        names = self.columns + ([self.group] if self.group else []) + [column for column, _, _ in self.filters]
+        return list(dict.fromkeys(names))
+
+    def describe(self):
+        if self.kind == "describe":
+            text = "statistics" + (f" of {', '.join(self.columns)}" if self.columns else "")
+        elif self.kind == "top":
+            what = (f"{self.group} by {self.aggregate}({self.columns[0]})" if self.group and self.columns
+                    else f"{self.group} by row count" if self.group else f"rows by {self.columns[0]}")
+            text = f"{'bottom' if self.ascending else 'top'} {self.n} {what}"
+        else:
+            text = ", ".join(f"{self.aggregate}({column})" for column in self.columns) or "row count"
+            if self.group:
+                text += f" by {self.group}"
+        if self.filters:
+            text += " where " + " and ".join(f"{column} {op} {_fmt(value)}" for column, op, value in self.filters)
+        return text
+
+
+def parse_question(question, columns):
+    """
+    Recognizes aggregate, group-by, top-N, filter and describe questions.
+    columns maps column name -> is numeric. Returns a SheetQuery, or None
+    when the question isn't one of these (or mentions something it can't
+    place), so it goes to Gemini as usual.
+    """
+    text = _normalize(question)
+    raw = str(question).casefold()
+
+    # Column mentions, longest names first so "unit price" wins over "price"
+    mentions, masked = [], text
+    names = sorted(columns, key=lambda name: len(_normalize(name).strip()), reverse=True)
+    for name in names:
+        key = " ".join(_normalize(name).split())
+        if not key:
+            continue
+        for match in re.finditer(WORD.format(re.escape(key)), masked):
+            mentions.append((match.start(), match.end(), name))
+            masked = _blank(masked, *match.span())
+    mentions.sort()
+
+    filters, group_columns, other_columns, filtered_until = [], [], [], 0
+    for start, end, name in mentions:
+        if start < filtered_until:
+            continue  # part of the previous filter's value
+        match = FILTER_PATTERN.match(text, end)
+        if match:
+            op = OPERATORS[match.group(1)]
+            value = raw[match.start(match.lastindex):match.end(match.lastindex)]  # original spelling
+            number = _number(value)
+            if number is None and (columns[name] or op not in ("=", "!=")):
+                return None
+            filters.append((name, op, value.strip() if number is None else number))
+            masked = _blank(masked, *match.span())
+            filtered_until = match.end()
+        elif GROUP_PATTERN.search(text, 0, start):
+            group_columns.append(name)
+        else:
+            other_columns.append(name)
+    group_columns = list(dict.fromkeys(group_columns))
+    other_columns = [name for name in dict.fromkeys(other_columns) if name not in group_columns]
+
+    top = TOP_PATTERN.search(masked)
+    if top:
+        masked = _blank(masked, *top.span())
+    if NUMBER_PATTERN.search(masked) or _has_phrase(masked, CONDITION_PHRASES):
+        return None  # e.g. "how many sales are over 500": answering count(sales) would drop the filter
+    aggregates = _aggregate_words(masked)
+    if "distinct" in aggregates:
+        aggregate = "distinct"  # "how many distinct ..."
+    elif len(aggregates) > 1:
+        return None  # e.g. "max price and min qty"
+    else:
+        aggregate = aggregates[0] if aggregates else None
+
+    if top:
+        n = int(top.group(2) or top.group(3))
+        ascending = (top.group(1) or top.group(4) or "") in BOTTOM_WORDS
+        candidates = list(dict.fromkeys(other_columns + group_columns))
+        numeric = [name for name in candidates if columns[name]]
+        value = numeric[-1] if numeric else None
+        rest = [name for name in candidates if name != value]
+        if len(rest) > 1 or aggregate == "distinct" or not (value or rest):
+            return None
+        group = rest[0] if rest else None
+        if group is None:
+            return SheetQuery("top", columns=[value], filters=filters, n=n, ascending=ascending)
+        aggregate = aggregate or ("sum" if value else "count")
+        if aggregate != "count" and value is None:
+            return None
+        return SheetQuery("top", aggregate, [value] if value and aggregate != "count" else [], group, filters,
+                          n, ascending)
+
+    if aggregate:
+        if len(group_columns) > 1:
+            return None
+        group = group_columns[0] if group_columns else None
+        if aggregate == "distinct":
+            if group or not other_columns:
+                return None
+        elif aggregate != "count":
+            if not other_columns or not all(columns[name] for name in other_columns):
+                return None
+        return SheetQuery("aggregate", aggregate, other_columns, group, filters)
+
+    if _has_word(masked, DESCRIBE_WORDS):
+        return SheetQuery("describe", columns=other_columns + group_columns, filters=filters)
+    return None
+
+
+def _aggregate_words(text):
+    """Distinct aggregates asked for, in the order they appear."""
+    found = []
+    for phrase, aggregate in AGGREGATE_WORDS.items():
+        match = re.search(WORD.format(re.escape(phrase)), text) if phrase.isascii() else None
+        position = match.start() if match else (-1 if phrase.isascii() else text.find(phrase))
+        if position >= 0:
+            found.append((position, aggregate))
+    return list(dict.fromkeys(aggregate for _, aggregate in sorted(found)))
+
+
+def _has_word(text, phrases):
+    return any(re.search(WORD.format(re.escape(phrase)), text) if phrase.isascii() else phrase in text
+               for phrase in phrases)
+
+
+def _has_phrase(text, phrases):
+    """Like _has_word, but symbols (">=", "=") match anywhere."""
+    return any(re.search(WORD.format(re.escape(phrase)), text) if phrase.isascii() and phrase[0].isalpha()
+               else phrase in text for phrase in phrases)
+
+
+class QueryResult:
+    """Answer to a SheetQuery, computed over every row of the file."""
+
+    __slots__ = ("description", "table", "rows_scanned", "rows_matched", "seconds")
+
+    def __init__(self, description, table, rows_scanned, rows_matched, seconds):
+        self.description = description
+        self.table = table  # Markdown
+        self.rows_scanned = rows_scanned
+        self.rows_matched = rows_matched
+        self.seconds = seconds
+
+    def _counts(self):
+        if self.rows_matched is None or self.rows_matched == self.rows_scanned:
+            return f"{self.rows_scanned:,} rows"
+        return f"{self.rows_matched:,} of {self.rows_scanned:,} rows matched"
+
+    def as_context(self):
+        """Prompt text that replaces the sample rows (goes after the spreadsheet overview)."""
+        return (f"[COMPUTED FROM THE FULL FILE: {self.description}; {self._counts()}]\n{self.table}\n"
+                "(Exact results computed over every row; answer from these rather than estimating.)\n\n")
+
+    def as_answer(self):
+        """Markdown reply for answering without Gemini."""
+        return f"**{self.description}**\n\n{self.table}\n\n_{self._counts()}, computed in {self.seconds:.2f}s._"
+
+
+def _cell(value):
+    if hasattr(value, "item"):
+        value = value.item()  # NumPy scalar
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return _fmt(value).replace("|", "\\|").replace("\n", " ")
+
+
+def _markdown_table(header, rows, total=None):
+    lines = ["| " + " | ".join(str(name).replace("|", "\\|") for name in header) + " |",
+             "|" + "---|" * len(header)]
+    shown = 0
+    for row in rows:
+        lines.append("| " + " | ".join(_cell(value) for value in row) + " |")
+        shown += 1
+    if total is not None and total > shown:
+        lines.append(f"\n(showing {shown} of {total:,})")
+    return "\n".join(lines)
+
+
+def _frame_table(frame, index_name=None):
+    """Markdown for at most MAX_TABLE_ROWS rows of a DataFrame (index first if named)."""
+    shown = frame.head(MAX_TABLE_ROWS)
+    if index_name is None:
+        return _markdown_table(list(shown.columns), shown.itertuples(index=False), len(frame))
+    return _markdown_table([index_name] + list(shown.columns), shown.itertuples(index=True), len(frame))
+
+
+class SpreadsheetQueryEngine:
+    """
+    Answers common questions about an attached spreadsheet locally, with
+    vectorized pandas over the whole file, so Gemini gets exact computed
+    results (or isn't called at all) instead of estimating from a sample.
+
+    parse_question recognizes sums, means, min/max, counts and distinct
+    counts (optionally grouped and filtered), top/bottom-N rows or groups
+    and describe requests. The file is streamed through the ingestor's
+    chunked reader, only the columns the query needs are parsed, and
+    per-chunk partial aggregates are merged, so memory stays bounded on
+    multi-million-row files. Results are cached by (content, question).
+    """
+
+    def __init__(self, ingestor, max_cache=128):
+        self.logger = logging.getLogger("ChatBot")
+        self.ingestor = ingestor
+        self._results = _DigestCache(max_cache)  # (content digest, question) -> QueryResult
+
+    def answer(self, question, file_data, file_type, digest=None):
+        """
+        Returns a QueryResult, or None if the question isn't one we can
+        compute. digest is the attachment's content_digest, if known.
+        """
+        if not question:
+            return None
+        digest = digest or content_digest(file_data)
+        cache_key = (digest, " ".join(_normalize(question).split()))
+        result = self._results.get(cache_key)
+        if result is not None:
+            return result
+
+        profile = self.ingestor.profile(file_data, file_type, digest)
+        columns = {name: bool(stats.numeric) for name, stats in profile.columns.items()}
+        query = parse_question(question, columns)
+        if query is None:
+            return None
+
+        start = time.perf_counter()
+        if query.kind == "describe" and not query.filters:
+            table, scanned, matched = self._profile_stats(profile, query), profile.rows, None
+        elif query.kind == "aggregate" and query.aggregate == "count" and not query.columns \
+                and not query.group and not query.filters:
+            table, scanned, matched = _markdown_table(["rows"], [(profile.rows,)]), profile.rows, None
+        else:
+            chunks = self.ingestor.iter_chunks(file_data, file_type, usecols=query.needed_columns())
+            run = {"describe": self._describe, "top": self._top, "aggregate": self._aggregate}[query.kind]
+            table, scanned, matched = run(query, chunks)
+        result = QueryResult(query.describe(), table, scanned, matched, time.perf_counter() - start)
+        self.logger.info("Spreadsheet query '%s' over %d rows in %.2fs", result.description, scanned,
+                         result.seconds)
+        self._results.put(cache_key, result)
+        return result
+
+    @staticmethod
+    def _filtered(query, chunks, counts):
+        """Yields chunks with the query's filters applied; counts = [scanned, matched]."""
+        for chunk in chunks:
+            counts[0] += len(chunk)
+            for column, op, value in query.filters:
+                if isinstance(value, float):
+                    mask = COMPARE[op](pd.to_numeric(chunk[column], errors="coerce"), value)
+                else:
+                    # Case-insensitive, but only the distinct values are normalized
+                    series = chunk[column]
+                    matches = [v for v in series.dropna().unique() if str(v).strip().casefold() == value]
+                    mask = series.isin(matches) if op == "=" else ~series.isin(matches)
+                chunk = chunk[mask]
+            counts[1] += len(chunk)
+            yield chunk
+
+    def _profile_stats(self, profile, query):
+        names = query.columns or list(profile.columns)
+        return "\n".join(profile.columns[name].describe() for name in names)
+
+    def _describe(self, query, chunks):
+        counts = [0, 0]
+        names = query.columns or None
+        stats = {}
+        for chunk in self._filtered(query, chunks, counts):
+            for name in names or chunk.columns:
+                stats.setdefault(name, ColumnStats(name)).update(chunk[name])
+        return "\n".join(column.describe() for column in stats.values()), counts[0], counts[1]
+
+    def _aggregate(self, query, chunks):
+        counts = [0, 0]
+        chunks = self._filtered(query, chunks, counts)
+        if query.aggregate == "distinct":
+            seen = {name: set() for name in query.columns}
+            for chunk in chunks:
+                for name in query.columns:
+                    seen[name].update(chunk[name].dropna().unique().tolist())
+            header = [f"distinct({name})" for name in query.columns]
+            return _markdown_table(header, [[len(seen[name]) for name in query.columns]]), counts[0], counts[1]
+
+        frame = self._grouped(query, chunks)
+        if query.group is None:
+            return _markdown_table(list(frame.columns), frame.itertuples(index=False)), counts[0], counts[1]
+        if len(frame) > MAX_TABLE_ROWS:
+            frame = frame.sort_values(frame.columns[0], ascending=query.aggregate == "min")
+        else:
+            frame = frame.sort_index()
+        return _frame_table(frame, query.group), counts[0], counts[1]
+
+    def _grouped(self, query, chunks):
+        """
+        DataFrame of the query's aggregate per group (one row if ungrouped),
+        merged from per-chunk partial sums, counts, minima and maxima.
+        """
+        aggregate, names, group = query.aggregate, query.columns, query.group
+        stats = {"mean": ("sum", "count")}.get(aggregate, (aggregate,))
+        partial = {}
+        for chunk in chunks:
+            if not names:  # row count
+                part = {"count": (chunk.groupby(group).size() if group else pd.Series([len(chunk)])).to_frame("rows")}
+            else:
+                values = chunk[names]
+                if aggregate != "count":
+                    values = values.apply(pd.to_numeric, errors="coerce")
+                grouped = values.groupby(chunk[group]) if group else None
+                part = {stat: getattr(grouped, stat)() if group else getattr(values, stat)().to_frame().T
+                        for stat in stats}
+            for stat, frame in part.items():
+                if stat not in partial:
+                    partial[stat] = frame
+                elif stat in ("sum", "count"):
+                    partial[stat] = partial[stat].add(frame, fill_value=0)
+                else:
+                    partial[stat] = getattr(pd.concat([partial[stat], frame]).groupby(level=0), stat)()
+        if not partial:
+            return pd.DataFrame({f"{aggregate}({name})": [] for name in names} or {"rows": []})
+        if aggregate == "mean":
+            result = partial["sum"] / partial["count"]
+        else:
+            result = partial[stats[0]]
+        if names:
+            result.columns = [f"{aggregate}({name})" for name in result.columns]
+        if aggregate == "count":
+            result = result.astype("int64")
+        return result
+
+    def _top(self, query, chunks):
+        counts = [0, 0]
+        chunks = self._filtered(query, chunks, counts)
+        pick = "nsmallest" if query.ascending else "nlargest"
+        if query.group is not None:
+            frame = self._grouped(query, chunks)
+            frame = getattr(frame, pick)(query.n, frame.columns[0])
+            return _frame_table(frame, query.group), counts[0], counts[1]
+
+        value, best = query.columns[0], None
+        for chunk in chunks:
+            chunk = chunk.assign(**{value: pd.to_numeric(chunk[value], errors="coerce")})
+            top = getattr(chunk, pick)(query.n, value)
+            best = top if best is None else getattr(pd.concat([best, top]), pick)(query.n, value)
+        if best is None or best.empty:
+            return "No rows match.", counts[0], counts[1]
+        return _frame_table(best), counts[0], counts[1]
@@ -0,0 +1,107 @@
+import threading
+
+from utils import lazy_import
+
+asyncio = lazy_import("asyncio")
+
+
+class Flight:
+    """One in-flight call that other callers can wait on."""
+
+    __slots__ = ("event", "value", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.waiters = []  # (loop, future) of async followers
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the leader finishes; returns its value (None if it
+        failed). Raises TimeoutError if the leader takes longer than timeout.
+        """
+        if not self.event.wait(timeout):
+            raise TimeoutError("the coalesced call did not finish in time")
+        return self.value
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the
+    leader) does the work, callers that arrive while it is in flight (the
+    followers) wait for it and share its result. Nothing is kept once the
+    call finishes; that is the response cache's job.
+
+    Use do() for a plain function, or begin() / finish() when the work
+    can't be wrapped in one (e.g. a streamed reply). If the leader fails,
+    followers get None.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._flights = {}  # key -> Flight
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Returns (flight, is_leader). The leader must call finish()."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.followers += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, key, flight, value):
+        """Publishes the leader's value and wakes its followers."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.value = value
+            flight.event.set()
+            waiters, flight.waiters = flight.waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, value)
+            except RuntimeError:
+                pass  # the follower's event loop is gone
+
+    async def wait_async(self, flight, timeout=None):
+        """Awaitable flight.wait(); doesn't tie up an executor thread while the leader works."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if flight.event.is_set():
+                return flight.value
+            flight.waiters.append((loop, future))
+        return await asyncio.wait_for(future, timeout)
+
+    def do(self, key, fn):
+        """Returns (value, shared): fn() run once for all concurrent callers with key."""
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait(), True
+        value = None
+        try:
+            value = fn()
+            return value, False
+        finally:
+            self.finish(key, flight, value)
+
+    def stats(self):
+        """Leader/follower counts; coalescing_ratio is the share of calls that did not go upstream."""
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "upstream_calls": self.leaders,
+                "coalesced": self.followers,
+                "coalescing_ratio": round(self.followers / total, 4) if total else 0.0,
+                "in_flight": len(self._flights),
+            }
+
+
+def _resolve(future, value):
+    if not future.done():  # the follower may have been cancelled
+        future.set_result(value)
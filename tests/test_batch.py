@@ -0,0 +1,62 @@
+import json
+import os
+import shutil
+
+from batch import BatchRunner, load_checkpoint
+from chatbot import ChatEngine
+from fake_genai import FakeGenAI
+
+KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge.json")
+
+
+def _checkpoint(path):
+    records = [
+        {"id": "a", "prompt": "first zebra question", "conversation": "c1", "response": "zebra reply",
+         "status": "ok"},
+        {"id": "b", "prompt": "standalone yak question", "response": "Error", "status": "failed"},
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.write('{"id": "c", "prompt": "torn')  # interrupted mid-write
+
+
+def test_checkpoint_drops_a_torn_last_line(tmp_path):
+    output = tmp_path / "results.jsonl"
+    _checkpoint(output)
+    done, conversations = load_checkpoint(str(output))
+    assert done == {"a"}
+    assert conversations == {"c1": [("first zebra question", "zebra reply")]}
+    assert output.read_text(encoding="utf-8").endswith('"status": "failed"}\n')
+
+
+def test_resume_skips_finished_items_and_restores_history(tmp_path):
+    shutil.copy(KNOWLEDGE_FILE, tmp_path / "knowledge.json")
+    backend = FakeGenAI(latency=0)
+    engine = ChatEngine(knowledge_file=str(tmp_path / "knowledge.json"), genai_backend=backend,
+                        api_keys=["key-a"], cache_size=0)
+    output = tmp_path / "results.jsonl"
+    _checkpoint(output)
+
+    bots = []
+
+    class Runner(BatchRunner):
+        def _new_bot(self):
+            bots.append(super()._new_bot())
+            return bots[-1]
+
+    items = [
+        ("a", {"prompt": "first zebra question", "conversation": "c1"}),
+        ("b", {"prompt": "standalone yak question"}),
+        ("c", {"prompt": "torn llama question"}),
+        ("d", {"prompt": "second zebra question", "conversation": "c1"}),
+    ]
+    stats = Runner(engine, str(output), workers=1, progress_every=0).run(iter(items))
+    assert (stats["skipped"], stats["ok"], stats["failed"]) == (1, 3, 0)
+    assert backend.calls == 3
+
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [record["id"] for record in records] == ["a", "b", "b", "c", "d"]
+    # The conversation's session (created last) picks up where the checkpoint left off
+    assert [message["parts"][0] for message in bots[-1].history[::2]] == [
+        "first zebra question", "second zebra question"]
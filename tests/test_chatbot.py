@@ -0,0 +1,150 @@
+import asyncio
+import os
+import shutil
+import threading
+
+import pytest
+
+from chatbot import ChatBot, ChatEngine
+from fake_genai import FakeGenAI
+
+KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge.json")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    shutil.copy(KNOWLEDGE_FILE, tmp_path / "knowledge.json")
+    return ChatEngine(knowledge_file=str(tmp_path / "knowledge.json"), genai_backend=FakeGenAI(latency=0),
+                      api_keys=["key-a"], cache_size=0)
+
+
+def test_sessions_with_different_histories_do_not_share_a_flight(engine):
+    first, second = ChatBot(engine), ChatBot(engine)
+    first.history_manager.add_turn("I live in Bangkok", "Noted.")
+    second.history_manager.add_turn("I live in Oslo", "Noted.")
+
+    first_key, first_flight, _ = first._join_flight("what's the weather like?")
+    second_key, second_flight, second_leader = second._join_flight("what's the weather like?")
+    assert first_key != second_key
+    assert second_leader
+    first._finish_flight(first_key, first_flight, "hot")
+    second._finish_flight(second_key, second_flight, "cold")
+
+
+def test_sessions_with_the_same_history_share_a_flight(engine):
+    first, second = ChatBot(engine), ChatBot(engine)
+    first_key, first_flight, first_leader = first._join_flight("tell me a joke")
+    second_key, _, second_leader = second._join_flight("tell me a joke")
+    assert first_key == second_key
+    assert first_leader and not second_leader
+    first._finish_flight(first_key, first_flight, "knock knock")
+
+
+def test_async_concurrency_limit_is_shared_by_all_sessions(engine):
+    first, second = ChatBot(engine), ChatBot(engine)
+
+    async def semaphores():
+        return first.engine.async_semaphore(), second.engine.async_semaphore()
+
+    one, other = asyncio.run(semaphores())
+    assert one is other
+    assert asyncio.run(semaphores())[0] is not one  # one per event loop
+
+
+def test_async_replies_under_the_shared_limit(tmp_path):
+    shutil.copy(KNOWLEDGE_FILE, tmp_path / "knowledge.json")
+    backend = FakeGenAI(latency=0.01)
+    engine = ChatEngine(knowledge_file=str(tmp_path / "knowledge.json"), genai_backend=backend,
+                        api_keys=["key-a"], cache_size=0, coalesce_max_history=None, max_concurrency=2)
+    bots = [ChatBot(engine) for _ in range(4)]
+
+    async def ask_all():
+        return await asyncio.gather(*(bot.aget_response(f"explain topic {i}") for i, bot in enumerate(bots)))
+
+    assert all(asyncio.run(ask_all()))
+    assert backend.calls == 4
+
+
+def test_time_questions_are_not_served_from_another_sessions_cache(tmp_path):
+    shutil.copy(KNOWLEDGE_FILE, tmp_path / "knowledge.json")
+    backend = FakeGenAI(latency=0)
+    engine = ChatEngine(knowledge_file=str(tmp_path / "knowledge.json"), genai_backend=backend, api_keys=["key-a"])
+    ChatBot(engine).get_response("what time is it?")
+    ChatBot(engine).get_response("what time is it?")
+    ChatBot(engine).get_response("tell me a joke")
+    ChatBot(engine).get_response("tell me a joke")
+    assert backend.calls == 3
+
+
+def test_async_history_summary_runs_off_the_event_loop(tmp_path):
+    shutil.copy(KNOWLEDGE_FILE, tmp_path / "knowledge.json")
+    engine = ChatEngine(knowledge_file=str(tmp_path / "knowledge.json"), genai_backend=FakeGenAI(latency=0),
+                        api_keys=["key-a"], cache_size=0)
+    bot = ChatBot(engine, history_keep_turns=1, llm_summary=True)
+    threads = []
+
+    def summarize(summary, turns):
+        threads.append(threading.current_thread())
+        return "summary"
+
+    bot.history_manager.summarizer = summarize
+
+    async def chat():
+        await bot.aget_response("first question")
+        await bot.aget_response("second question")
+
+    asyncio.run(chat())
+    assert bot.history_manager.summary == "summary"
+    assert threads and threading.main_thread() not in threads  # the loop runs on the main thread
+
+
+def test_last_request_is_per_session(tmp_path):
+    shutil.copy(KNOWLEDGE_FILE, tmp_path / "knowledge.json")
+    engine = ChatEngine(knowledge_file=str(tmp_path / "knowledge.json"), genai_backend=FakeGenAI(latency=0),
+                        api_keys=["key-a"], metrics=True)
+    first, second = ChatBot(engine), ChatBot(engine)
+    first.get_response("tell me a joke")
+    second.get_response("hello")
+    assert engine.metrics.recent_trace(first.last_request_id)["source"] == "gemini"
+    assert engine.metrics.recent_trace(second.last_request_id)["source"] == "local"
+
+
+def test_follower_of_a_hung_leader_calls_on_its_own(tmp_path):
+    shutil.copy(KNOWLEDGE_FILE, tmp_path / "knowledge.json")
+    backend = FakeGenAI(latency=0)
+    engine = ChatEngine(knowledge_file=str(tmp_path / "knowledge.json"), genai_backend=backend,
+                        api_keys=["key-a"], cache_size=0, coalesce_timeout=0.05)
+    leader, follower = ChatBot(engine), ChatBot(engine)
+    flight_key, flight, is_leader = leader._join_flight("tell me a joke")  # and never finishes
+    assert is_leader
+
+    assert follower.get_response("tell me a joke")
+    assert "".join(follower.stream_response("tell me a joke"))
+    assert asyncio.run(follower.aget_response("tell me a joke"))
+    assert backend.calls == 3
+    leader._finish_flight(flight_key, flight, None)
+
+
+def test_attachment_is_hashed_once_per_request(tmp_path, monkeypatch):
+    import attachments
+    import chatbot
+    import sheet_query
+    from utils import content_digest
+
+    hashed = []
+
+    def counting_digest(data):
+        hashed.append(data)
+        return content_digest(data)
+
+    for module in (attachments, chatbot, sheet_query):
+        monkeypatch.setattr(module, "content_digest", counting_digest)
+    shutil.copy(KNOWLEDGE_FILE, tmp_path / "knowledge.json")
+    engine = ChatEngine(knowledge_file=str(tmp_path / "knowledge.json"), genai_backend=FakeGenAI(latency=0),
+                        api_keys=["key-a"])
+    bot = ChatBot(engine)
+    sheet = b"region,sales\nnorth,10\nsouth,20\n"
+    assert bot.get_response("what is the total sales?", file_data=sheet, file_type="csv")
+    assert len(hashed) == 1
+    assert "".join(bot.stream_response("describe this file", file_data=sheet, file_type="csv"))
+    assert len(hashed) == 2
@@ -0,0 +1,48 @@
+import pytest
+
+from conversation_store import ZLIB, ConversationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConversationStore(str(tmp_path / "chats.db"))
+    yield store
+    store.close()
+
+
+def test_pages_walk_back_from_the_newest_message(store):
+    session = store.create_session()
+    other = store.create_session()
+    for i in range(45):
+        store.append(session, "user" if i % 2 == 0 else "assistant", f"message {i}")
+        store.append(other, "user", f"other {i}")
+
+    newest = store.page(session)
+    assert [message["text"] for message in newest] == [f"message {i}" for i in range(25, 45)]
+    assert store.has_earlier(session, newest[0]["id"])
+
+    middle = store.page(session, before_id=newest[0]["id"])
+    assert [message["text"] for message in middle] == [f"message {i}" for i in range(5, 25)]
+
+    oldest = store.page(session, before_id=middle[0]["id"])
+    assert [message["text"] for message in oldest] == [f"message {i}" for i in range(5)]
+    assert not store.has_earlier(session, oldest[0]["id"])
+    assert store.page(session, before_id=oldest[0]["id"]) == []
+
+
+def test_long_messages_round_trip_compressed(store):
+    session = store.create_session()
+    text = "A long reply about spreadsheets. " * 50
+    message_id = store.append(session, "assistant", text)
+    (codec,) = store._db.execute("SELECT codec FROM messages WHERE id = ?", (message_id,)).fetchone()
+    assert codec == ZLIB
+    assert store.page(session)[0]["text"] == text
+
+
+def test_recent_turns_skip_attachment_notes(store):
+    session = store.create_session()
+    for i in range(3):
+        store.append(session, "user", f"question {i}")
+        store.append(session, "user", f"attached file {i}", kind="attachment")
+        store.append(session, "assistant", f"answer {i}")
+    assert store.recent_turns(session, limit=2) == [("question 1", "answer 1"), ("question 2", "answer 2")]
@@ -0,0 +1,49 @@
+import pytest
+
+from formatter import StreamingFormatter, fix_run_on, markdown_to_html, render_inline
+
+
+def test_link_url_cannot_break_out_of_href():
+    rendered = render_inline('[x](https://example.com/"onmouseover="alert(1))')
+    assert '"onmouseover' not in rendered
+    assert 'href="https://example.com/&quot;onmouseover=&quot;alert(1"' in rendered
+
+
+def test_link_query_string_is_escaped_once():
+    assert render_inline("[q](https://example.com/?a=1&b=2)") == \
+        '<a href="https://example.com/?a=1&amp;b=2" target="_blank">q</a>'
+
+
+@pytest.mark.parametrize("text", [
+    "Intro\n\n1. one\n\n2. two\n\n3. three\n\nDone.",
+    "- a\n\n  more about a\n\n- b\n\n### Next\n\ntext",
+    "```\ncode\n\nmore code\n```\n\n1. x\n\n2. y",
+    "para one\n\npara two\n\n- a\n- b\n\npara three",
+])
+@pytest.mark.parametrize("chunk_size", [1, 3, 16])
+def test_streamed_html_matches_the_final_render(text, chunk_size):
+    formatter = StreamingFormatter()
+    for i in range(0, len(text), chunk_size):
+        streamed = formatter.feed(text[i:i + chunk_size])
+    assert streamed == markdown_to_html(text)
+
+
+def test_loose_numbered_list_stays_one_list():
+    formatter = StreamingFormatter()
+    for chunk in ("1. one\n\n", "2. two\n\n", "3. three"):
+        streamed = formatter.feed(chunk)
+    assert streamed.count("<ol") == 1
+
+
+def test_numbers_inside_a_sentence_are_not_a_list():
+    assert fix_run_on("I have 1. apples and 2. pears") == "I have 1. apples and 2. pears"
+    assert "<ol" not in markdown_to_html("I have 1. apples and 2. pears")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1. one 2. two", "1. one\n\n2. two"),
+    ("You need: 1. flour 2. eggs", "You need:\n\n1. flour\n\n2. eggs"),
+    ("Intro ### Steps 1. mix 2. bake", "Intro\n\n### Steps\n\n1. mix\n\n2. bake"),
+])
+def test_run_on_numbered_list_is_split(text, expected):
+    assert fix_run_on(text) == expected
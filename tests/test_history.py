@@ -0,0 +1,53 @@
+from history import HistoryManager, estimate_tokens
+
+
+def test_history_stays_within_the_token_budget():
+    history = HistoryManager(max_tokens=200, keep_turns=50)
+    for i in range(30):
+        history.add_turn(f"question {i} " + "word " * 20, f"answer {i} " + "word " * 20)
+    assert sum(estimate_tokens(message["parts"][0]) for message in history.turns) <= 200
+    assert history.summary.startswith("- User: question ")
+    assert len(history) < 60
+    # The latest exchange is always kept verbatim
+    assert history.turns[-2]["parts"][0].startswith("question 29 ")
+    assert history.turns[-1]["parts"][0].startswith("answer 29 ")
+
+
+def test_latest_exchange_is_kept_even_over_budget():
+    history = HistoryManager(max_tokens=10)
+    history.add_turn("short", "short")
+    history.add_turn("long " * 100, "long " * 100)
+    assert len(history) == 2
+    assert history.turns[0]["parts"][0].startswith("long")
+
+
+def test_evicted_turns_roll_into_the_summary():
+    calls = []
+
+    def summarizer(summary, turns):
+        calls.append((summary, [message["parts"][0] for message in turns]))
+        return (summary + " " if summary else "") + "+".join(message["parts"][0] for message in turns)
+
+    history = HistoryManager(max_tokens=10_000, keep_turns=2, summarizer=summarizer)
+    for i in range(4):
+        history.add_turn(f"q{i}", f"a{i}")
+
+    # Only the previous summary and the newly evicted turns are summarized
+    assert calls == [("", ["q0", "a0"]), ("q0+a0", ["q1", "a1"])]
+    assert history.summary == "q0+a0 q1+a1"
+    assert [message["parts"][0] for message in history.turns] == ["q2", "a2", "q3", "a3"]
+
+    context = history.context()
+    assert "q0+a0 q1+a1" in context[0]["parts"][0]
+    assert context[2:] == history.turns
+
+
+def test_failing_summarizer_falls_back_to_extractive():
+    def summarizer(summary, turns):
+        raise RuntimeError("quota")
+
+    history = HistoryManager(keep_turns=1, summarizer=summarizer)
+    history.add_turn("What is the capital of France?", "Paris. It is also the largest city.")
+    history.add_turn("And of Spain?", "Madrid.")
+    assert history.summary == "- User: What is the capital of France? / Assistant: Paris."
+    assert estimate_tokens(history.summary) > 0
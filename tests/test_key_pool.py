@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from fake_genai import FakeGenAI
+from key_pool import KeyPool, KeyState
+
+
+def test_async_first_bind_waits_for_a_sync_one():
+    pool = KeyPool(["key-a", "key-b"], FakeGenAI(latency=0))
+    sync_model = pool.get_model(0, "gemini-test")
+    async_model = pool.get_model(1, "gemini-test")
+    entered = threading.Event()
+
+    def sync_request():
+        with pool.binding(0, sync_model):
+            entered.set()
+            time.sleep(0.05)  # the async request tries to switch keys meanwhile
+            sync_model.generate_content("hi")
+
+    thread = threading.Thread(target=sync_request)
+    thread.start()
+    entered.wait()
+
+    async def async_request():
+        task = await pool.start_async(1, async_model, lambda: async_model.generate_content_async("hi"))
+        return await task
+
+    asyncio.run(async_request())
+    thread.join()
+    assert sync_model.api_key == "key-a"
+    assert async_model.api_key == "key-b"
+
+
+def test_circuit_breaker_opens_probes_and_recovers(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("key_pool.time", SimpleNamespace(monotonic=lambda: clock[0]))
+    pool = KeyPool(["key-a", "key-b"], FakeGenAI(latency=0), failure_threshold=2, cooldown=10.0)
+    first = pool.keys[0]
+
+    pool.record_failure(0)
+    assert first.state == KeyState.CLOSED
+    pool.record_failure(0)
+    assert first.state == KeyState.OPEN
+    # Open keys are only tried after the healthy ones
+    assert [state.index for state in pool.candidates()] == [1, 0]
+    assert first.state == KeyState.OPEN
+
+    clock[0] += 10.0
+    assert [state.index for state in pool.candidates()] == [1, 0]
+    assert first.state == KeyState.HALF_OPEN
+    # A failed probe re-opens the key for twice as long
+    pool.record_failure(0)
+    assert first.state == KeyState.OPEN
+    assert first.open_until == clock[0] + 20.0
+
+    clock[0] += 20.0
+    pool.candidates()
+    assert first.state == KeyState.HALF_OPEN
+    pool.record_success(0)
+    assert first.state == KeyState.CLOSED
+    assert first.failures == 0
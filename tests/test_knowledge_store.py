@@ -0,0 +1,30 @@
+from knowledge_store import KnowledgeStore
+
+
+def test_append_and_load(tmp_path):
+    store = KnowledgeStore(str(tmp_path / "knowledge.json"))
+    store.append("hello", "Hi!")
+    store.append("hello", "Hey!")
+    store.append("hello", "Hi!")
+    assert KnowledgeStore(str(tmp_path / "knowledge.json")).load() == {"hello": ["Hi!", "Hey!"]}
+
+
+def test_append_after_a_torn_line_is_not_lost(tmp_path):
+    store = KnowledgeStore(str(tmp_path / "knowledge.json"))
+    store.append("hello", "Hi!")
+    with open(store.journal_file, "a", encoding="utf-8") as f:
+        f.write('{"q": "bye", "a": "Good')  # crash mid-write
+    store.append("thanks", "You're welcome!")
+    assert KnowledgeStore(str(tmp_path / "knowledge.json")).load() == {
+        "hello": ["Hi!"],
+        "thanks": ["You're welcome!"],
+    }
+
+
+def test_compact_folds_the_journal_into_the_snapshot(tmp_path):
+    store = KnowledgeStore(str(tmp_path / "knowledge.json"), compact_every=2)
+    store.append("hello", "Hi!")
+    store.append("bye", "Goodbye!")
+    with open(store.journal_file, encoding="utf-8") as f:
+        assert f.read() == ""
+    assert KnowledgeStore(str(tmp_path / "knowledge.json")).load() == {"hello": ["Hi!"], "bye": ["Goodbye!"]}
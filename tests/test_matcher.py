@@ -0,0 +1,48 @@
+import pytest
+
+from matcher import KnowledgeIndex, normalize_text, within_edits
+
+KEYS = ["how do i reset my password", "price of bitcoin", "will it rain today", "how are you", "hello",
+        "what is your name", "สวัสดีครับ"]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return KnowledgeIndex(KEYS)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Hello!!", "hello"),
+    ("hellooooo", "hello"),
+    ("helo", "hello"),
+    ("how are yuo", "how are you"),
+    ("howare you", "how are you"),
+    ("how do i rest my password", "how do i reset my password"),
+    ("whats your name", "what is your name"),
+    ("สวัสดีคับ", "สวัสดีครับ"),
+])
+def test_typos_and_variants_match(index, question, expected):
+    match = index.lookup(question)
+    assert match is not None and match[0] == expected
+
+
+@pytest.mark.parametrize("question", [
+    "how do i reset my pin",
+    "price of ethereum",
+    "will it snow today",
+    "how old are you",
+    "what is my name",
+])
+def test_questions_that_differ_in_a_word_do_not_match(index, question):
+    assert index.lookup(question) is None
+
+
+def test_within_edits():
+    assert within_edits("kitten", "sitting", 3)
+    assert not within_edits("kitten", "sitting", 2)
+    assert within_edits("yuo", "you", 1)  # adjacent swap
+    assert not within_edits("old", "are", 2)
+
+
+def test_normalize_text():
+    assert normalize_text("  Hello,   WORLD!!! ") == "hello world"
@@ -0,0 +1,47 @@
+import json
+
+from personas import DEFAULT_PERSONA, PersonaRegistry
+
+
+def _write(directory, file_name, name, prompt, order=0):
+    (directory / file_name).write_text(json.dumps({"name": name, "prompt": prompt, "order": order}),
+                                       encoding="utf-8")
+
+
+def test_edits_are_picked_up_without_a_restart(tmp_path):
+    _write(tmp_path, "jarvis.json", DEFAULT_PERSONA, "You are Jarvis.", order=1)
+    _write(tmp_path, "pirate.json", "Pirate", "You are a pirate.", order=2)
+    changed = []
+    registry = PersonaRegistry(str(tmp_path), check_interval=0, on_change=changed.append)
+    assert list(registry) == [DEFAULT_PERSONA, "Pirate"]
+    old_key = registry["Pirate"].key
+
+    _write(tmp_path, "pirate.json", "Pirate", "You are a grumpy pirate.", order=2)
+    _write(tmp_path, "tutor.json", "Tutor", "You are a patient tutor.", order=3)
+    assert "grumpy" in registry["Pirate"].instruction
+    assert registry["Pirate"].key != old_key
+    assert list(registry) == [DEFAULT_PERSONA, "Pirate", "Tutor"]
+    assert changed == [old_key]
+
+    tutor_key = registry["Tutor"].key
+    (tmp_path / "tutor.json").unlink()
+    assert "Tutor" not in registry
+    assert changed == [old_key, tutor_key]
+    # Sessions still using a removed persona fall back to the default one
+    assert registry.resolve("Tutor").name == DEFAULT_PERSONA
+
+
+def test_a_broken_edit_keeps_the_previous_version(tmp_path):
+    _write(tmp_path, "pirate.json", "Pirate", "You are a pirate.")
+    changed = []
+    registry = PersonaRegistry(str(tmp_path), check_interval=0, on_change=changed.append)
+    key = registry["Pirate"].key
+
+    (tmp_path / "pirate.json").write_text('{"name": "Pirate", "prompt": ', encoding="utf-8")
+    assert registry["Pirate"].key == key
+    assert changed == []
+
+
+def test_an_empty_directory_falls_back_to_the_builtin_persona(tmp_path):
+    registry = PersonaRegistry(str(tmp_path / "missing"), check_interval=0)
+    assert list(registry) == [DEFAULT_PERSONA]
@@ -0,0 +1,28 @@
+import time
+
+from response_cache import ResponseCache, time_bucket
+
+
+def key(prompt):
+    return ResponseCache.make_key("Jarvis AI@0", prompt, (), None)
+
+
+def test_numbers_and_operators_get_different_keys():
+    assert key("convert 1000 usd to thb") != key("convert 100 usd to thb")
+    assert key("what is 2+2") != key("what is 2*2")
+
+
+def test_case_whitespace_and_trailing_punctuation_share_a_key():
+    assert key("Hello?") == key("hello")
+    assert key("  What   is\tthe time!") == key("what is the time")
+
+
+def test_time_of_day_questions_are_not_cached():
+    assert time_bucket("what time is it?") is None
+    assert time_bucket("ตอนนี้กี่โมงแล้ว") is None
+
+
+def test_date_questions_are_keyed_by_day():
+    assert time_bucket("what's the date today?") == time.strftime("%Y-%m-%d")
+    assert time_bucket("tell me a joke") == ""
+    assert key("what day is it") != ResponseCache.make_key("Jarvis AI@0", "what day is it", (), None, "2020-01-01")
@@ -0,0 +1,35 @@
+from retrieval import KnowledgeRetriever
+
+KNOWLEDGE = {
+    "how do i reset my password": ["Use the 'Forgot password' link on the login page."],
+    "what is the price of bitcoin": ["I can't check live prices."],
+    "will it rain today": ["Check the weather forecast."],
+}
+
+
+def test_background_build_then_search():
+    retriever = KnowledgeRetriever(dict(KNOWLEDGE))
+    assert retriever.wait_ready(5)
+    hits = retriever.search(["reset password"])[0]
+    assert hits[0][0] == "how do i reset my password"
+    assert "Forgot password" in retriever.context("i forgot my password")
+
+
+def test_relearned_question_replaces_its_row():
+    responses = dict(KNOWLEDGE)
+    retriever = KnowledgeRetriever(responses, background=False)
+    responses["will it rain today"] = ["Check the weather forecast.", "Bring an umbrella."]
+    retriever.add("will it rain today")
+    responses["how do i change my email"] = ["Go to account settings."]
+    retriever.add("how do i change my email")
+
+    assert len(retriever) == 4
+    hits = retriever.search(["rain today"], k=4)[0]
+    assert [question for question, _ in hits].count("will it rain today") == 1
+    assert retriever.search(["change my email"])[0][0][0] == "how do i change my email"
+
+
+def test_no_hits_below_min_score():
+    retriever = KnowledgeRetriever(dict(KNOWLEDGE), background=False)
+    assert retriever.search(["zzzz qqqq"]) == [[]]
+    assert retriever.context("zzzz qqqq") == ""
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from fake_genai import FakeGenAI
+from key_pool import KeyPool
+from scheduler import BATCH, INTERACTIVE, RequestScheduler, rate_limit_delay
+
+
+def _wait_for_queue(scheduler, depth):
+    deadline = time.monotonic() + 2
+    while scheduler.snapshot()["queue_depth"] < depth:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_interactive_requests_are_served_before_batch():
+    scheduler = RequestScheduler(KeyPool(["key-a"], FakeGenAI(latency=0)), rpm=1, period=0.5)
+    assert scheduler.acquire() == 0  # uses up the key's budget
+    granted = []
+
+    def request(priority):
+        assert scheduler.acquire(priority=priority) == 0
+        granted.append(priority)
+
+    batch = threading.Thread(target=request, args=(BATCH,))
+    batch.start()
+    _wait_for_queue(scheduler, 1)
+    interactive = threading.Thread(target=request, args=(INTERACTIVE,))
+    interactive.start()
+    _wait_for_queue(scheduler, 2)
+    assert scheduler.snapshot()["queued"] == {"interactive": 1, "batch": 1}
+
+    batch.join()
+    interactive.join()
+    assert granted == [INTERACTIVE, BATCH]
+
+
+def test_rate_limited_key_cools_down_for_the_retry_delay():
+    error = Exception("429 Resource has been exhausted. Please retry in 37.2s.")
+    assert rate_limit_delay(error) == 37.2
+    assert rate_limit_delay(Exception("quota exceeded")) == 30.0
+    assert rate_limit_delay(Exception("500 internal error")) is None
+
+    scheduler = RequestScheduler(KeyPool(["key-a", "key-b"], FakeGenAI(latency=0)), default_cooldown=0.1)
+    scheduler.rate_limited(0, rate_limit_delay(error))
+    assert scheduler.snapshot()["keys"][0]["cooldown_for"] > 37
+    assert scheduler.try_acquire() == 1
+    assert scheduler.try_acquire(exclude=(1,)) is None
+    # Nothing can serve it within the timeout, so it gives up instead of waiting
+    assert scheduler.acquire(exclude=(1,), timeout=0.05) is None
+
+    scheduler.rate_limited(1)
+    assert scheduler.acquire(exclude=(0,), timeout=1) == 1  # after the 0.1s default cooldown
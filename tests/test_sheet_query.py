@@ -0,0 +1,41 @@
+import pytest
+
+from sheet_query import parse_question
+
+COLUMNS = {"region": False, "status": False, "product": False, "sales": True, "unit price": True, "qty": True}
+
+
+def describe(question):
+    query = parse_question(question, COLUMNS)
+    return query.describe() if query else None
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is the total sales by region?", "sum(sales) by region"),
+    ("what is the max qty", "max(qty)"),
+    ("how many rows", "row count"),
+    ("total sales where sales > 500", "sum(sales) where sales > 500"),
+    ("average unit price where status is shipped", "mean(unit price) where status = shipped"),
+    ("total sales where region != 'north'", "sum(sales) where region != north"),
+    ("sales >= 1,000 count", "row count where sales >= 1,000"),
+    ("top 5 product by sales", "top 5 product by sum(sales)"),
+    ("overview of sales", "statistics of sales"),
+    ("รวม sales ตาม region", "sum(sales) by region"),
+    ("sales มากกว่า 100 จำนวน", "row count where sales > 100"),
+])
+def test_recognized_questions(question, expected):
+    assert describe(question) == expected
+
+
+@pytest.mark.parametrize("question", [
+    "How many sales are over 500?",      # filter not attached to the column
+    "sum of sales in 2024",              # number that isn't part of a filter
+    "count of sales under budget",
+    "average qty above the target",
+    "max unit price and min qty",        # two different aggregates
+    "average region",                    # mean of a text column
+    "sales where unit price > cheap",    # non-numeric value for a numeric column
+    "tell me a joke",
+])
+def test_unrecognized_questions_go_to_gemini(question):
+    assert describe(question) is None
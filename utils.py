@@ -1,32 +1,158 @@
+import atexit
+import hashlib
+import importlib
 import logging
 import os
 import sys
+import types
 
-def setup_logging(log_file="chatbot.log"):
+_log_pipeline = None
+
+
+def setup_logging(log_file="chatbot.log", max_bytes=10 * 1024 * 1024, backup_count=5, rotate_when=None,
+                  json_lines=True, queue_size=10_000):
     """
     Sets up logging to both file and console.
+
+    Log calls only put the record on a bounded queue; a background thread
+    writes it to the file (JSON lines with request ids, rotated by size,
+    or by time with rotate_when) and to the console (warnings and up).
     """
+    global _log_pipeline
+    from log_pipeline import JsonLinesFormatter, LogPipeline, rotating_file_handler
+
     # Create a custom logger
     logger = logging.getLogger("ChatBot")
     logger.setLevel(logging.DEBUG)
+    if _log_pipeline is not None or logger.handlers:
+        return logger
 
     # Create handlers
     c_handler = logging.StreamHandler(sys.stdout)
-    f_handler = logging.FileHandler(log_file, encoding='utf-8')
+    f_handler = rotating_file_handler(log_file, max_bytes, backup_count, rotate_when)
     
     c_handler.setLevel(logging.WARNING)
     f_handler.setLevel(logging.DEBUG)
 
     # Create formatters and add it to handlers
     c_format = logging.Formatter('%(message)s')
-    f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if json_lines:
+        f_format = JsonLinesFormatter()
+    else:
+        f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s')
     
     c_handler.setFormatter(c_format)
     f_handler.setFormatter(f_format)
 
-    # Add handlers to the logger
-    if not logger.handlers:
-        logger.addHandler(c_handler)
-        logger.addHandler(f_handler)
+    # The handlers run on the pipeline's writer thread
+    _log_pipeline = LogPipeline(logger, [c_handler, f_handler], queue_size=queue_size)
+    _log_pipeline.start()
+    atexit.register(shutdown_logging)
 
     return logger
+
+
+def shutdown_logging():
+    """Writes out queued log records and stops the writer thread (safe to call twice)."""
+    global _log_pipeline
+    if _log_pipeline is not None:
+        _log_pipeline.stop()
+        _log_pipeline = None
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module (google.generativeai, pandas, ...) that is
+    imported on first attribute access, keeping startup fast for code paths
+    that never use it.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """Returns the module if it is already imported, else a LazyModule."""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def content_digest(data):
+    """
+    Returns a SHA-256 hex digest of an attachment's content.
+    Accepts bytes, file-like objects (e.g. Streamlit UploadedFile), file paths
+    and PIL images. Returns None for None.
+    """
+    if data is None:
+        return None
+
+    digest = hashlib.sha256()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        digest.update(data)
+    elif hasattr(data, "getbuffer"):
+        # BytesIO / UploadedFile: hash in place without copying
+        digest.update(data.getbuffer())
+    elif hasattr(data, "read") and hasattr(data, "seek"):
+        position = data.tell()
+        data.seek(0)
+        for block in iter(lambda: data.read(1 << 20), b""):
+            digest.update(block)
+        data.seek(position)
+    elif isinstance(data, (str, os.PathLike)) and os.path.isfile(data):
+        with open(data, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    elif hasattr(data, "tobytes"):
+        # PIL image
+        digest.update(f"{getattr(data, 'mode', '')}{getattr(data, 'size', '')}".encode())
+        digest.update(data.tobytes())
+    else:
+        digest.update(repr(data).encode())
+    return digest.hexdigest()
+
+
+def deep_sizeof(obj, exclude=()):
+    """
+    Approximate memory footprint of obj and everything it references, in
+    bytes. Objects in exclude, callables, classes, modules and loggers are
+    not followed (they are shared, not owned).
+    """
+    seen = {id(o) for o in exclude}
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or callable(o) or isinstance(o, (types.ModuleType, logging.Logger)):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif not isinstance(o, (str, bytes, int, float, bool)):
+            if hasattr(o, "__dict__"):
+                stack.append(vars(o))
+            for cls in type(o).__mro__:
+                slots = cls.__dict__.get("__slots__", ())
+                for name in ([slots] if isinstance(slots, str) else slots):
+                    if hasattr(o, name):
+                        stack.append(getattr(o, name))
+    return total
+
+
+def percentile(values, pct):
+    """The pct-th percentile of values (nearest rank, no interpolation)."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]